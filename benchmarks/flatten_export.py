@@ -0,0 +1,156 @@
+"""
+Micro-benchmark comparing :meth:`BaseExport.flatten_dict` with
+:class:`FlattenSchema` for CSV output of event and member export data.
+
+Does not require a database; run from the project root with::
+
+    python benchmarks/flatten_export.py
+
+"""
+
+import csv
+import io
+import os
+import sys
+import timeit
+from collections import OrderedDict
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mep.settings")
+django.setup()
+
+from mep.accounts.management.commands.export_events import (  # noqa: E402
+    Command as ExportEvents,
+)
+from mep.common.management.export import BaseExport, FlattenSchema  # noqa: E402
+from mep.people.management.commands.export_members import (  # noqa: E402
+    Command as ExportMembers,
+)
+
+EVENTS = [
+    {
+        "event_type": "Subscription",
+        "start_date": "1921-06-13",
+        "end_date": "1921-07-13",
+        "members": [
+            {
+                "id": "hemingway",
+                "uri": "https://shakespeareandco.princeton.edu/members/hemingway/",
+                "name": "Ernest Hemingway",
+                "sort_name": "Hemingway, Ernest",
+            }
+        ],
+        "subscription": OrderedDict(
+            [
+                ("price_paid", "16.00"),
+                ("deposit", "7.00"),
+                ("duration", "1 month"),
+                ("duration_days", 30),
+                ("volumes", 1),
+                ("category", "A"),
+            ]
+        ),
+        "currency": "FRF",
+        "source": [
+            {
+                "type": "Lending Library Card",
+                "citation": "Ernest Hemingway Lending Library Card, Sylvia Beach "
+                "Papers, Princeton University Library.",
+                "manifest": "https://figgy.princeton.edu/concern/scanned_resources/"
+                "6b7d0a8a/manifest",
+                "image": "https://iiif-cloud.princeton.edu/iiif/2/04%2F2a/full/"
+                "full/0/default.jpg",
+            }
+        ],
+    },
+    {
+        "event_type": "Borrow",
+        "start_date": "1925-03-02",
+        "end_date": "1925-03-19",
+        "members": [
+            {
+                "id": "joyce-james",
+                "uri": "https://shakespeareandco.princeton.edu/members/joyce-james/",
+                "name": "James Joyce",
+                "sort_name": "Joyce, James",
+            },
+            {
+                "id": "joyce-nora",
+                "uri": "https://shakespeareandco.princeton.edu/members/joyce-nora/",
+                "name": "Nora Joyce",
+                "sort_name": "Joyce, Nora",
+            },
+        ],
+        "borrow": {"status": "Returned", "duration_days": 17},
+        "item": {
+            "uri": "https://shakespeareandco.princeton.edu/books/lawrence-rainbow/",
+            "title": "The Rainbow",
+            "volume": "Vol. 1",
+            "authors": ["Lawrence, D. H."],
+            "year": 1915,
+        },
+        "source": [
+            {"type": "Logbook", "citation": "Logbooks 1919–1928"},
+            {"type": "Lending Library Card", "citation": "Joyce card"},
+        ],
+    },
+]
+
+MEMBERS = [
+    OrderedDict(
+        [
+            ("id", "gay"),
+            ("uri", "https://shakespeareandco.princeton.edu/members/gay/"),
+            ("name", "Francisque Gay"),
+            ("sort_name", "Gay, Francisque"),
+            ("is_organization", False),
+            ("has_card", True),
+            ("title", "M."),
+            ("gender", "Male"),
+            ("birth_year", 1885),
+            ("death_year", 1963),
+            ("membership_years", [1919, 1920, 1921, 1929]),
+            ("viaf_url", "http://viaf.org/viaf/9857613"),
+            ("wikipedia_url", "https://en.wikipedia.org/wiki/Francisque_Gay"),
+            ("nationalities", ["France"]),
+            ("addresses", ["3 Rue Garancière, Paris", "12 Rue Jacob, Paris"]),
+            ("coordinates", ["48.85101, 2.33590", ""]),
+            ("postal_codes", ["75006", "75006"]),
+            ("arrondissements", [6, 6]),
+            ("notes", "Publisher and politician."),
+            ("updated", "2020-05-12T11:08:19.564738+00:00"),
+        ]
+    )
+]
+
+
+def flatten_dict_rows(fields, rows):
+    writer = csv.DictWriter(io.StringIO(), fieldnames=fields)
+    for row in rows:
+        writer.writerow(BaseExport.flatten_dict(row))
+
+
+def flatten_schema_rows(fields, rows):
+    writer = csv.writer(io.StringIO())
+    flatten = FlattenSchema(fields)
+    for row in rows:
+        writer.writerow(flatten(row))
+
+
+def main(rows=35000, repeat=5):
+    for label, fields, sample in [
+        ("events", ExportEvents.csv_fields, EVENTS),
+        ("members", ExportMembers.csv_fields, MEMBERS),
+    ]:
+        data = (sample * (rows // len(sample) + 1))[:rows]
+        for method in (flatten_dict_rows, flatten_schema_rows):
+            best = min(
+                timeit.repeat(lambda: method(fields, data), number=1, repeat=repeat)
+            )
+            print("%-8s %-20s %d rows: %.3fs" % (label, method.__name__, rows, best))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     name = "mep.accounts"
     verbose_name = "Library Accounts"
+
+    def ready(self):
+        from parasolr.django.signals import IndexableSignalHandler
+
+        from mep.accounts.models import AccountActivitySignalHandlers
+
+        # activity summaries must be updated before indexing signal handlers
+        # (connected by the common app) reindex people using them, so
+        # reconnect indexing handlers after the summary handlers
+        indexing_enabled = IndexableSignalHandler.disconnect()
+        AccountActivitySignalHandlers.connect()
+        if indexing_enabled:
+            IndexableSignalHandler.connect()
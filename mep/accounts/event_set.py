@@ -1,6 +1,9 @@
 import datetime
-from itertools import chain
+from itertools import chain, groupby
+from operator import attrgetter
 
+from cached_property import cached_property
+from django.db.models import BooleanField, ExpressionWrapper, Q
 from django.db.models.functions import Coalesce
 
 
@@ -9,55 +12,33 @@ class EventSetMixin:
     with :class:`~mep.accounts.models.Account`, but pulled out as a mixin
     for use with :class:`~mep.books.models.Book`. Should only be used
     with Models that have an `event_set`.
+
+    All aggregate values are calculated by an :class:`EventTimeline`,
+    which is loaded with a single query and cached on the instance.
     """
 
+    @cached_property
+    def event_timeline(self):
+        """:class:`EventTimeline` for all events associated with this
+        account or book"""
+        return EventTimeline.for_events(self.event_set.all())
+
+    def clear_event_timeline(self):
+        """Clear the cached :attr:`event_timeline`, e.g. when associated
+        events are changed."""
+        self.__dict__.pop("event_timeline", None)
+
     @property
     def event_dates(self):
         """sorted list of all unique event dates associated with this
         account or book; ignores borrow and purchase dates with unknown year"""
-        # get value list of all start and end dates
-        date_values = self.event_set.known_years().values_list("start_date", "end_date")
-        # flatten list of tuples into a list, filter out None, and make unique
-        uniq_dates = set(filter(None, chain.from_iterable(date_values)))
-        # return as a sorted list
-        return sorted(list(uniq_dates))
+        return self.event_timeline.event_dates
 
     @property
     def event_years(self):
         """list of years covered by all event dates (including
         years covered by multiyear subscriptions)"""
-        # FIXME: what does this do to long-running borrows?
-        event_dates = self.event_set.known_years()
-
-        # for subscriptions/renewals ONLY, we need to fill in intervening years
-        # between start and end date
-        date_values = event_dates.membership_activities().values_list(
-            "start_date", "end_date"
-        )
-        # get a unique list of year ranges
-        year_ranges = list(
-            set(
-                [
-                    (start.year if start else None, end.year if end else None)
-                    for start, end in date_values
-                ]
-            )
-        )
-        years = []
-        for start, end in year_ranges:
-            # if both start and end year are known, add all years in range
-            if start is not None and end is not None:
-                years.extend(range(start, end + 1))
-            # otherwise add whichever year is known
-            elif start is not None:
-                years.append(start)
-            elif end is not None:
-                years.append(end)
-
-        # for book activity, we only want specified years
-        years.extend([d.year for d in self.event_dates])
-
-        return list(set(years))
+        return self.event_timeline.event_years
 
     def event_date_ranges(self, event_type=None):
         """Generate and return a list of date ranges this account/book
@@ -65,68 +46,7 @@ class EventSetMixin:
         to a specific kind of event activity (currently only
         supports membership).
         """
-        ranges = []
-        current_range = None
-
-        events = (
-            self.event_set.known_years()
-            .annotate(first_date=Coalesce("start_date", "end_date"))
-            .order_by("first_date")
-        )
-
-        # if event type was specified, filter as requested
-        if event_type == "membership":
-            events = events.membership_activities()
-
-        for event in events:
-            # if no date is set, ignore
-            if not event.start_date and not event.end_date:
-                continue
-
-            # if either date is partial with month unknown, skip
-            if (
-                event.start_date
-                and event.start_date_precision
-                and not event.start_date_precision.month
-            ) or (
-                event.end_date
-                and event.end_date_precision
-                and not event.end_date_precision.month
-            ):
-                continue
-
-            # if only one date is known, use for start/end of
-            # range (i.e., borrow event with no end date)
-            if not event.start_date or not event.end_date:
-                date = event.start_date or event.end_date
-                start_date = end_date = date
-
-            # otherwise, use start and end dates for range
-            else:
-                start_date = event.start_date
-                end_date = event.end_date
-
-            # if no current range is set, create one from current event
-            if not current_range:
-                current_range = [start_date, end_date]
-            # if this event starts within the current range, include it
-            # NOTE: includes the following day; if this event is the
-            # next day after the current range, extend the same range
-            elif (
-                current_range[0]
-                <= start_date
-                <= (current_range[1] + datetime.timedelta(days=1))
-            ):
-                current_range[1] = max(end_date, current_range[1])
-            # otherwise, close out the current range and start a new one
-            else:
-                ranges.append(current_range)
-                current_range = [start_date, end_date]
-
-        # store the last range after the loop ends
-        if current_range:
-            ranges.append(current_range)
-        return ranges
+        return self.event_timeline.event_date_ranges(event_type)
 
     def active_months(self, event_type=None):
         """Generate and return a list of year/month dates this account/book
@@ -135,55 +55,305 @@ class EventSetMixin:
         "membership" or "books").
         Months are returned as a set in YYYYMM format.
         """
-        months = set()
-
-        # Book activities are handled differently, since they do not
-        # span multiple months; no need to convert to date ranges
-        if event_type == "books":
-            book_events = self.event_set.known_years().book_activities()
-            for event in book_events:
-                # skip unset dates and unknown months (precision unset
-                # or month flag present); add all other
-                # to the set of years & months in YYYYMM format
-                if event.start_date and (
-                    not event.start_date_precision or event.start_date_precision.month
-                ):
-                    months.add(event.start_date.strftime("%Y%m"))
-                if event.end_date and (
-                    not event.end_date_precision or event.end_date_precision.month
-                ):
-                    months.add(event.end_date.strftime("%Y%m"))
-
-            return months
-
-        # For general events or membership activity,
-        # calculate months based on date ranges to track months
-        # when a subscription was active
-        date_ranges = self.event_date_ranges(event_type)
-        for start_date, end_date in date_ranges:
-            current_date = start_date
-            while current_date <= end_date:
-                # if date is within range,
-                # add to set of months in YYYYMM format
-                months.add(current_date.strftime("%Y%m"))
-                # get the date for the first of the next month
-                next_month = current_date.month + 1
-                year = current_date.year
-                # handle december to january
-                if next_month == 13:
-                    year += 1
-                    next_month = 1
-                current_date = datetime.date(year, next_month, 1)
-        return months
+        return self.event_timeline.active_months(event_type)
 
     def earliest_date(self):
         """Earliest known date from all events associated with this account/book"""
-        dates = self.event_dates
-        if dates:
-            return dates[0]
+        return self.event_timeline.earliest_date()
 
     def last_date(self):
         """Last known date from all events associated with this account/book"""
-        dates = self.event_dates
-        if dates:
-            return dates[-1]
+        return self.event_timeline.last_date()
+
+
+class EventTimeline:
+    """Aggregate dates, years, date ranges and active months for a set of
+    events, calculated from a single list of event values and cached.
+
+    :param events: iterable of event values as returned by
+        :meth:`event_values`, ordered by first known date
+    """
+
+    #: event fields needed to calculate a timeline
+    fields = (
+        "start_date",
+        "end_date",
+        "start_date_precision",
+        "end_date_precision",
+        "work_id",
+    )
+
+    def __init__(self, events):
+        self.events = list(events)
+
+    @classmethod
+    def for_events(cls, events):
+        """Initialize a timeline from an :class:`~mep.accounts.models.Event`
+        queryset."""
+        return cls(cls.event_values(events))
+
+    @classmethod
+    def for_related(cls, queryset, batch_size=2000):
+        """Calculate timelines for all accounts or works in a queryset
+        from a single query over their events, grouped by account or work
+        as the ordered results are streamed. Returns a dictionary of
+        timelines keyed on account or work id; items with no events have
+        an empty timeline."""
+        # reverse relation from the account or work model to events
+        relation = queryset.model._meta.get_field("event")
+        id_field = relation.field.attname
+        timelines = {
+            pk: cls([]) for pk in queryset.order_by().values_list("pk", flat=True)
+        }
+        events = relation.related_model.objects.filter(
+            **{"%s__in" % id_field: queryset.order_by().values("pk")}
+        )
+        extra_fields = [id_field] if id_field not in cls.fields else []
+        events = cls.event_values(events, *extra_fields).order_by(
+            id_field, "first_date"
+        )
+        for pk, related_events in groupby(
+            events.iterator(chunk_size=batch_size), key=attrgetter(id_field)
+        ):
+            timelines[pk] = cls(related_events)
+        return timelines
+
+    @classmethod
+    def event_values(cls, events, *fields):
+        """Filter an :class:`~mep.accounts.models.Event` queryset to
+        events with known years and return named values for calculating a
+        timeline, ordered by first known date. Any additional fields
+        specified are included in the values."""
+        return (
+            events.known_years()
+            .annotate(
+                first_date=Coalesce("start_date", "end_date"),
+                membership=ExpressionWrapper(
+                    Q(subscription__isnull=False) | Q(reimbursement__isnull=False),
+                    output_field=BooleanField(),
+                ),
+            )
+            .order_by("first_date")
+            .values_list(*fields, *cls.fields, "membership", named=True)
+        )
+
+    @cached_property
+    def membership_events(self):
+        """subscription and reimbursement events"""
+        return [event for event in self.events if event.membership]
+
+    @cached_property
+    def book_events(self):
+        """events associated with a book"""
+        return [event for event in self.events if event.work_id]
+
+    @cached_property
+    def event_dates(self):
+        """sorted list of all unique event dates"""
+        # flatten start and end dates into a list, filter out None,
+        # and make unique
+        return sorted(
+            set(
+                filter(
+                    None,
+                    chain.from_iterable(
+                        (event.start_date, event.end_date) for event in self.events
+                    ),
+                )
+            )
+        )
+
+    @cached_property
+    def event_years(self):
+        """list of years covered by all event dates (including
+        years covered by multiyear subscriptions)"""
+        # for subscriptions/renewals ONLY, fill in intervening years
+        return years_covered(
+            [(event.start_date, event.end_date) for event in self.membership_events],
+            self.event_dates,
+        )
+
+    @cached_property
+    def date_ranges(self):
+        """date ranges for all events"""
+        return merge_date_ranges(self.events)
+
+    @cached_property
+    def membership_date_ranges(self):
+        """date ranges for membership activities"""
+        return merge_date_ranges(self.membership_events)
+
+    @cached_property
+    def months(self):
+        """months covered by all event date ranges"""
+        return range_months(self.date_ranges)
+
+    @cached_property
+    def membership_months(self):
+        """months covered by membership activity date ranges"""
+        return range_months(self.membership_date_ranges)
+
+    @cached_property
+    def book_months(self):
+        """months with book activity; book activities do not span
+        multiple months, so these are not converted to date ranges"""
+        return event_months(self.book_events)
+
+    def event_date_ranges(self, event_type=None):
+        """list of date ranges for all events, or for membership
+        activities only when `event_type` is "membership" """
+        if event_type == "membership":
+            return self.membership_date_ranges
+        return self.date_ranges
+
+    def active_months(self, event_type=None):
+        """set of months in YYYYMM format covered by all events, or by
+        "membership" or "books" activities only"""
+        if event_type == "membership":
+            return self.membership_months
+        if event_type == "books":
+            return self.book_months
+        return self.months
+
+    def earliest_date(self):
+        """earliest known event date"""
+        if self.event_dates:
+            return self.event_dates[0]
+
+    def last_date(self):
+        """last known event date"""
+        if self.event_dates:
+            return self.event_dates[-1]
+
+
+def years_covered(date_values, event_dates):
+    """List of years covered by membership activity start and end dates
+    (including intervening years) and any other event dates.
+
+    :param date_values: iterable of start and end date tuples for
+        membership activities
+    :param event_dates: list of all event dates
+    """
+    # get a unique list of year ranges
+    year_ranges = list(
+        set(
+            [
+                (start.year if start else None, end.year if end else None)
+                for start, end in date_values
+            ]
+        )
+    )
+    years = []
+    for start, end in year_ranges:
+        # if both start and end year are known, add all years in range
+        if start is not None and end is not None:
+            years.extend(range(start, end + 1))
+        # otherwise add whichever year is known
+        elif start is not None:
+            years.append(start)
+        elif end is not None:
+            years.append(end)
+
+    # for book activity, we only want specified years
+    years.extend([d.year for d in event_dates])
+
+    return list(set(years))
+
+
+def merge_date_ranges(events):
+    """Combine dates for a list of events into a list of date ranges.
+    Events must be ordered by first known date; events with partial dates
+    where the month is unknown are skipped.
+    """
+    ranges = []
+    current_range = None
+
+    for event in events:
+        # if no date is set, ignore
+        if not event.start_date and not event.end_date:
+            continue
+
+        # if either date is partial with month unknown, skip
+        if (
+            event.start_date
+            and event.start_date_precision
+            and not event.start_date_precision.month
+        ) or (
+            event.end_date
+            and event.end_date_precision
+            and not event.end_date_precision.month
+        ):
+            continue
+
+        # if only one date is known, use for start/end of
+        # range (i.e., borrow event with no end date)
+        if not event.start_date or not event.end_date:
+            date = event.start_date or event.end_date
+            start_date = end_date = date
+
+        # otherwise, use start and end dates for range
+        else:
+            start_date = event.start_date
+            end_date = event.end_date
+
+        # if no current range is set, create one from current event
+        if not current_range:
+            current_range = [start_date, end_date]
+        # if this event starts within the current range, include it
+        # NOTE: includes the following day; if this event is the
+        # next day after the current range, extend the same range
+        elif (
+            current_range[0]
+            <= start_date
+            <= (current_range[1] + datetime.timedelta(days=1))
+        ):
+            current_range[1] = max(end_date, current_range[1])
+        # otherwise, close out the current range and start a new one
+        else:
+            ranges.append(current_range)
+            current_range = [start_date, end_date]
+
+    # store the last range after the loop ends
+    if current_range:
+        ranges.append(current_range)
+    return ranges
+
+
+def range_months(date_ranges):
+    """Set of all months in YYYYMM format covered by a list of
+    date ranges."""
+    months = set()
+    for start_date, end_date in date_ranges:
+        current_date = start_date
+        while current_date <= end_date:
+            # if date is within range,
+            # add to set of months in YYYYMM format
+            months.add(current_date.strftime("%Y%m"))
+            # get the date for the first of the next month
+            next_month = current_date.month + 1
+            year = current_date.year
+            # handle december to january
+            if next_month == 13:
+                year += 1
+                next_month = 1
+            current_date = datetime.date(year, next_month, 1)
+    return months
+
+
+def event_months(events):
+    """Set of months in YYYYMM format for start and end dates of
+    a list of events, skipping dates where the month is unknown."""
+    months = set()
+    for event in events:
+        # skip unset dates and unknown months (precision unset
+        # or month flag present); add all other
+        # to the set of years & months in YYYYMM format
+        if event.start_date and (
+            not event.start_date_precision or event.start_date_precision.month
+        ):
+            months.add(event.start_date.strftime("%Y%m"))
+        if event.end_date and (
+            not event.end_date_precision or event.end_date_precision.month
+        ):
+            months.add(event.end_date.strftime("%Y%m"))
+    return months
@@ -10,7 +10,6 @@ addresses.
 import argparse
 
 from mep.common.management.export import BaseExport
-from mep.common.utils import absolutize_url
 from mep.accounts.models import Address
 
 
@@ -39,6 +38,16 @@ class Command(BaseExport):
         "longitude",
         "latitude",
     ]
+
+    column_types = {
+        "member_ids": ["string"],
+        "member_names": ["string"],
+        "member_sort_names": ["string"],
+        "member_uris": ["string"],
+        "arrondissement": "int",
+        "longitude": "float",
+        "latitude": "float",
+    }
     include_dates = False
 
     def add_arguments(self, parser):
@@ -68,10 +77,15 @@ class Command(BaseExport):
         prefetch account, location and account persons
         """
         # skip any addresses not associated with a member
-        return Address.objects.filter(account__persons__isnull=False).prefetch_related(
-            "account",
-            "location",
-            "account__persons",
+        return (
+            Address.objects.filter(account__persons__isnull=False)
+            .select_related("care_of_person")
+            .prefetch_related(
+                "account",
+                "location",
+                "location__country",
+                "account__persons",
+            )
         )
 
     def get_base_filename(self):
@@ -118,7 +132,7 @@ class Command(BaseExport):
         return [
             dict(
                 id=m.slug,
-                uri=absolutize_url(m.get_absolute_url()),
+                uri=self.absolute_url(m),
                 name=m.name,
                 sort_name=m.sort_name,
             )
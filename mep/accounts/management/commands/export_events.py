@@ -16,7 +16,6 @@ from django.db.models.query import Prefetch
 from mep.accounts.models import Event
 from mep.books.models import Creator
 from mep.common.management.export import BaseExport
-from mep.common.utils import absolutize_url
 
 
 class Command(BaseExport):
@@ -65,6 +64,26 @@ class Command(BaseExport):
         "source_image",
     ]
 
+    column_types = {
+        "member_ids": ["string"],
+        "member_uris": ["string"],
+        "member_names": ["string"],
+        "member_sort_names": ["string"],
+        "subscription_price_paid": "float",
+        "subscription_deposit": "float",
+        "subscription_duration_days": "int",
+        "subscription_volumes": "int",
+        "reimbursement_refund": "float",
+        "borrow_duration_days": "int",
+        "purchase_price": "float",
+        "item_authors": ["string"],
+        "item_year": "int",
+        "source_type": ["string"],
+        "source_citation": ["string"],
+        "source_manifest": ["string"],
+        "source_image": ["string"],
+    }
+
     def get_queryset(self):
         """get event objects to be exported"""
         # Order events by date. Order on precision first so unknown dates
@@ -78,8 +97,10 @@ class Command(BaseExport):
                 "account__persons",
                 "footnotes",
                 "footnotes__bibliography__manifest",
+                "footnotes__bibliography__source_type",
+                "footnotes__image",
                 Prefetch(
-                    "work__creators",
+                    "work__creator_set",
                     queryset=Creator.objects.select_related("person", "creator_type"),
                 ),
             )
@@ -149,7 +170,7 @@ class Command(BaseExport):
         return [
             dict(
                 id=m.slug,
-                uri=absolutize_url(m.get_absolute_url()),
+                uri=self.absolute_url(m),
                 name=m.name,
                 sort_name=m.sort_name,
             )
@@ -185,7 +206,7 @@ class Command(BaseExport):
         """associated work details for an event"""
         if event.work:
             item_info = dict(
-                uri=absolutize_url(event.work.get_absolute_url()),
+                uri=self.absolute_url(event.work),
                 title=event.work.title,
             )
             if event.edition:
@@ -24,6 +24,7 @@ from dateutil.relativedelta import relativedelta
 from django.core.management.base import BaseCommand
 from django.db.models import Count
 
+from mep.accounts.event_set import EventTimeline
 from mep.accounts.models import Account
 from mep.common.utils import absolutize_url
 
@@ -104,6 +105,9 @@ class Command(BaseCommand):
         # gap size to look for; assume 1 month = 30 days
         gap = timedelta(days=30 * kwargs["gap"])
 
+        # calculate event timelines for all accounts in a single query
+        timelines = EventTimeline.for_related(accounts)
+
         total = 0
         with open(kwargs["filename"], "w") as csvfile:
             # write utf-8 byte order mark at the beginning of the file
@@ -116,7 +120,10 @@ class Command(BaseCommand):
             # loop through all accounts to find and report on time gaps
             for acct in accounts:
                 # print summary info: account and full date range
-                date_range = "{}/{}".format(acct.earliest_date(), acct.last_date())
+                timeline = timelines[acct.pk]
+                date_range = "{}/{}".format(
+                    timeline.earliest_date(), timeline.last_date()
+                )
 
                 if self.verbosity > self.v_normal:
                     self.stdout.write("{} ({})".format(acct, date_range))
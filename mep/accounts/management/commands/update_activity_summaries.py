@@ -0,0 +1,56 @@
+"""
+Manage command to rebuild activity summaries for library accounts.
+
+Recalculates :class:`~mep.accounts.models.AccountActivitySummary` records
+(event dates, years, date ranges and active months) for all accounts, or
+for the specified account ids, in bulk. Summaries are updated automatically
+when events are saved or deleted; use this command after initial setup or
+after changes made without signals (e.g. loading fixtures). Monthly
+membership statistics are recalculated from the updated summaries;
+run nightly (e.g. from cron) to keep them current.
+
+Example usage::
+
+    python manage.py update_activity_summaries
+    python manage.py update_activity_summaries 123 456
+
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from mep.accounts.models import Account, AccountActivitySummary
+from mep.people.stats import MembershipStats
+
+
+class Command(BaseCommand):
+    """Rebuild account activity summaries and membership statistics"""
+
+    help = __doc__
+
+    #: default verbosity
+    v_normal = 1
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "account_ids",
+            nargs="*",
+            type=int,
+            help="Only update summaries for the specified accounts",
+        )
+
+    def handle(self, *args, **kwargs):
+        accounts = Account.objects.all()
+        if kwargs.get("account_ids"):
+            accounts = accounts.filter(pk__in=kwargs["account_ids"])
+        start = time.perf_counter()
+        total = AccountActivitySummary.rebuild(accounts)
+        if kwargs.get("verbosity", self.v_normal) >= self.v_normal:
+            self.stdout.write(
+                "Updated %d account activity summaries in %.2fs"
+                % (total, time.perf_counter() - start)
+            )
+        MembershipStats.update()
+        if kwargs.get("verbosity", self.v_normal) >= self.v_normal:
+            self.stdout.write("Updated membership statistics")
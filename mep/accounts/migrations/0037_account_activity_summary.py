@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0036_rename_separate_deposit_to_separate_payment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountActivitySummary",
+            fields=[
+                (
+                    "account",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="activity_summary",
+                        serialize=False,
+                        to="accounts.account",
+                    ),
+                ),
+                ("dates", models.JSONField(default=list)),
+                ("years", models.JSONField(default=list)),
+                ("date_ranges", models.JSONField(default=list)),
+                ("membership_date_ranges", models.JSONField(default=list)),
+                ("months", models.JSONField(default=list)),
+                ("membership_months", models.JSONField(default=list)),
+                ("book_months", models.JSONField(default=list)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "account activity summary",
+                "verbose_name_plural": "account activity summaries",
+            },
+        ),
+    ]
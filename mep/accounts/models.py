@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import datetime
 import re
 
 from cached_property import cached_property
@@ -6,11 +7,12 @@ from dateutil.relativedelta import relativedelta
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.template.defaultfilters import pluralize
+from django.utils import timezone
 from djiffy.models import Canvas
 
-from mep.accounts.event_set import EventSetMixin
+from mep.accounts.event_set import EventSetMixin, EventTimeline
 from mep.accounts.partial_date import (
     DatePrecision,
     DatePrecisionField,
@@ -109,6 +111,18 @@ class Account(models.Model, EventSetMixin):
 
     has_card.boolean = True
 
+    @property
+    def activity(self):
+        """:class:`AccountActivitySummary` with event dates, years, date
+        ranges and active months for this account; if it does not exist
+        yet, an unsaved summary is calculated from the account's events
+        (summaries are saved by signal handlers and
+        :meth:`AccountActivitySummary.rebuild`)."""
+        try:
+            return self.activity_summary
+        except ObjectDoesNotExist:
+            return AccountActivitySummary.calculate(self.pk, self.event_timeline)
+
     @staticmethod
     def validate_etype(etype):
         etype = etype.lower()
@@ -416,6 +430,15 @@ class Event(Notable, PartialDateMixin):
                 return self.nonstandard_notation[match.group(0)]
         return self.event_type
 
+    def clear_event_timelines(self):
+        """Clear cached event timelines on the associated account and
+        work, if they are loaded, so they reflect changes to this event."""
+        for field in ("account", "work"):
+            if self._meta.get_field(field).is_cached(self):
+                related = getattr(self, field)
+                if related is not None:
+                    related.clear_event_timeline()
+
     def calculate_duration(self):
         """Calculate and set subscription duration based on start and end
         date, when both are known. Duration is only calculated when both
@@ -722,3 +745,220 @@ class Reimbursement(Event, CurrencyMixin):
 
         if qs.exists():
             raise ValidationError("Reimbursement event is not unique")
+
+
+class AccountActivitySummary(models.Model):
+    """Denormalized event activity for a single :class:`Account`, as
+    calculated by :class:`~mep.accounts.event_set.EventSetMixin`.
+    Updated when events for the account are saved or deleted; use the
+    `update_activity_summaries` manage command to rebuild in bulk.
+    Provides the same methods and properties as the event set mixin
+    for use in place of the account."""
+
+    account = models.OneToOneField(
+        Account,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="activity_summary",
+    )
+    #: sorted list of unique event dates, in ISO format
+    dates = models.JSONField(default=list)
+    #: sorted list of years covered by events
+    years = models.JSONField(default=list)
+    #: date ranges for all events, as lists of start and end date
+    date_ranges = models.JSONField(default=list)
+    #: date ranges for membership activities
+    membership_date_ranges = models.JSONField(default=list)
+    #: sorted list of months covered by events, in YYYYMM format
+    months = models.JSONField(default=list)
+    #: months covered by membership activities
+    membership_months = models.JSONField(default=list)
+    #: months with book activities
+    book_months = models.JSONField(default=list)
+    #: date last updated
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "account activity summary"
+        verbose_name_plural = "account activity summaries"
+
+    def __str__(self):
+        return "Activity summary for account #%s" % self.account_id
+
+    @classmethod
+    def calculate(cls, account_id, timeline):
+        """Generate an unsaved summary for a single account from an
+        :class:`~mep.accounts.event_set.EventTimeline`."""
+        return cls(
+            account_id=account_id,
+            dates=[date.isoformat() for date in timeline.event_dates],
+            years=sorted(timeline.event_years),
+            date_ranges=[
+                [start.isoformat(), end.isoformat()]
+                for start, end in timeline.date_ranges
+            ],
+            membership_date_ranges=[
+                [start.isoformat(), end.isoformat()]
+                for start, end in timeline.membership_date_ranges
+            ],
+            months=sorted(timeline.months),
+            membership_months=sorted(timeline.membership_months),
+            book_months=sorted(timeline.book_months),
+        )
+
+    @classmethod
+    def update_account(cls, account):
+        """Calculate and save the summary for a single account."""
+        summary = cls.calculate(
+            account.pk,
+            EventTimeline.for_events(Event.objects.filter(account_id=account.pk)),
+        )
+        summary.save()
+        account.activity_summary = summary
+        return summary
+
+    @classmethod
+    def rebuild(cls, accounts=None, batch_size=1000):
+        """Recalculate summaries for all accounts (or the specified
+        account queryset) from a single events query. Returns the number
+        of summaries saved."""
+        accounts = accounts if accounts is not None else Account.objects.all()
+        timelines = EventTimeline.for_related(accounts, batch_size=batch_size)
+        summaries = [
+            cls.calculate(account_id, timelines[account_id])
+            for account_id in sorted(timelines)
+        ]
+        with transaction.atomic():
+            cls.objects.filter(account_id__in=timelines.keys()).delete()
+            # summaries calculated concurrently from the same events are
+            # identical, so skip any saved since they were deleted
+            cls.objects.bulk_create(
+                summaries, batch_size=batch_size, ignore_conflicts=True
+            )
+        return len(summaries)
+
+    @property
+    def event_dates(self):
+        """sorted list of all unique event dates; see
+        :attr:`~mep.accounts.event_set.EventSetMixin.event_dates`"""
+        return [datetime.date.fromisoformat(date) for date in self.dates]
+
+    @property
+    def event_years(self):
+        """list of years covered by all event dates; see
+        :attr:`~mep.accounts.event_set.EventSetMixin.event_years`"""
+        return list(self.years)
+
+    def event_date_ranges(self, event_type=None):
+        """list of date ranges for all events or membership activities; see
+        :meth:`~mep.accounts.event_set.EventSetMixin.event_date_ranges`"""
+        date_ranges = self.date_ranges
+        if event_type == "membership":
+            date_ranges = self.membership_date_ranges
+        return [
+            [datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)]
+            for start, end in date_ranges
+        ]
+
+    def active_months(self, event_type=None):
+        """set of active months in YYYYMM format; see
+        :meth:`~mep.accounts.event_set.EventSetMixin.active_months`"""
+        if event_type == "membership":
+            return set(self.membership_months)
+        if event_type == "books":
+            return set(self.book_months)
+        return set(self.months)
+
+    def earliest_date(self):
+        """Earliest known event date"""
+        if self.dates:
+            return datetime.date.fromisoformat(self.dates[0])
+
+    def last_date(self):
+        """Last known event date"""
+        if self.dates:
+            return datetime.date.fromisoformat(self.dates[-1])
+
+
+class AccountActivitySignalHandlers:
+    """Signal handlers for updating :class:`AccountActivitySummary`
+    records and cached event timelines when events are saved or deleted."""
+
+    @staticmethod
+    def event_pre_save(sender, instance, raw=False, **kwargs):
+        """before an existing event is saved, record the account it
+        currently belongs to, so that the previous account can be updated
+        if it changes"""
+        if raw or not instance.pk:
+            return
+        instance._previous_account_id = (
+            Event.objects.filter(pk=instance.pk)
+            .values_list("account_id", flat=True)
+            .first()
+        )
+
+    @staticmethod
+    def event_save(sender, instance, raw=False, **kwargs):
+        """when an event is saved, update the summary for its account
+        (and its previous account, if changed)"""
+        # raw = saved as presented; don't query the database
+        if raw or not instance.pk:
+            return
+        instance.clear_event_timelines()
+        AccountActivitySummary.update_account(instance.account)
+        previous_id = getattr(instance, "_previous_account_id", None)
+        if previous_id and previous_id != instance.account_id:
+            previous = Account.objects.filter(pk=previous_id).first()
+            if previous:
+                AccountActivitySummary.update_account(previous)
+
+    @staticmethod
+    def event_subtype_delete(sender, instance, **kwargs):
+        """when a subclass type of event is deleted, clear cached timelines
+        for its loaded account and work; the summary is updated when the
+        generic event is deleted"""
+        instance.clear_event_timelines()
+
+    @staticmethod
+    def event_delete(sender, instance, **kwargs):
+        """when an event is deleted, update the summary for its account if
+        there is one; when the account is being deleted, the summary has
+        already been removed or will be removed with the account"""
+        instance.clear_event_timelines()
+        if AccountActivitySummary.objects.filter(
+            account_id=instance.account_id
+        ).exists():
+            summary = AccountActivitySummary.calculate(
+                instance.account_id,
+                EventTimeline.for_events(
+                    Event.objects.filter(account_id=instance.account_id)
+                ),
+            )
+            # update rather than save, in case the account is being deleted
+            AccountActivitySummary.objects.filter(
+                account_id=instance.account_id
+            ).update(
+                **{
+                    field.attname: getattr(summary, field.attname)
+                    for field in AccountActivitySummary._meta.concrete_fields
+                    if not field.primary_key and field.name != "updated_at"
+                },
+                updated_at=timezone.now(),
+            )
+
+    @classmethod
+    def connect(cls):
+        """Connect activity summary signal handlers for all event types.
+        Generic event signals aren't sent when subclass types are saved,
+        so save handlers are connected for each event type; deleting any
+        type of event also deletes the generic event and sends its delete
+        signal, so the summary is only updated for :class:`Event` to avoid
+        updating it twice."""
+        for event_model in [Event, Subscription, Borrow, Purchase, Reimbursement]:
+            models.signals.pre_save.connect(cls.event_pre_save, sender=event_model)
+            models.signals.post_save.connect(cls.event_save, sender=event_model)
+        models.signals.post_delete.connect(cls.event_delete, sender=Event)
+        for event_model in [Subscription, Borrow, Purchase, Reimbursement]:
+            models.signals.post_delete.connect(
+                cls.event_subtype_delete, sender=event_model
+            )
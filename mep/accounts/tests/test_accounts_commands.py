@@ -1,6 +1,7 @@
 import codecs
 import os.path
 from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import date, timedelta
 from io import StringIO
 from tempfile import NamedTemporaryFile, TemporaryDirectory
@@ -24,12 +25,20 @@ from mep.accounts.management.commands import (
     report_timegaps,
     export_addresses,
 )
-from mep.accounts.models import Account, Borrow, Event, Address, Location
+from mep.accounts.models import (
+    Account,
+    AccountActivitySummary,
+    Borrow,
+    Event,
+    Address,
+    Location,
+)
 from mep.books.models import Creator, CreatorType
 from mep.common.management.export import StreamArray
 from mep.common.utils import absolutize_url
 from mep.footnotes.models import Bibliography, Footnote
 from mep.people.models import Person
+from mep.people.stats import MembershipStats
 
 
 class TestReportTimegaps(TestCase):
@@ -439,6 +448,43 @@ class TestExportEvents(TestCase):
         assert len(event_data) == Event.objects.count()
         assert isinstance(event_data[0], dict)
 
+    def test_get_data_chunks(self):
+        # loading in small chunks should match the full queryset order
+        expected = [self.cmd.get_object_data(ev) for ev in self.cmd.get_queryset()]
+        self.cmd.chunk_size = 2
+        assert list(self.cmd.get_data()) == expected
+        # maximum is respected
+        data = self.cmd.get_data(maximum=3)
+        assert data.total == 3
+        assert list(data) == expected[:3]
+
+    @patch("mep.common.management.export.connections")
+    @patch("mep.common.management.export.ProcessPoolExecutor")
+    def test_get_data_workers(self, mock_executor, mock_connections):
+        # run worker tasks inline, since the test database is not
+        # visible to other processes
+        def submit(fn, *args):
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+
+        def executor(initializer, initargs, **kwargs):
+            initializer(*initargs)
+            inline = Mock()
+            inline.__enter__ = Mock(return_value=Mock(submit=submit))
+            inline.__exit__ = Mock(return_value=False)
+            return inline
+
+        mock_executor.side_effect = executor
+        expected = [self.cmd.get_object_data(ev) for ev in self.cmd.get_queryset()]
+        self.cmd.chunk_size = 2
+        self.cmd.workers = 2
+        data = self.cmd.get_data()
+        assert data.total == len(expected)
+        assert list(data) == expected
+        assert mock_executor.call_args.kwargs["max_workers"] == 2
+        mock_connections.close_all.assert_called_once()
+
     def test_member_info(self):
         # test single member data
         event = Event.objects.filter(account__persons__name__contains="Brue").first()
@@ -693,3 +739,26 @@ class TestExportAddresses(TestCase):
         loc.save()
         gay_data = self.cmd.get_object_data(address)
         assert gay_data["location_name"] == loc.name
+
+
+class TestUpdateActivitySummaries(TestCase):
+    fixtures = ["sample_people"]
+
+    def test_command_line(self):
+        stdout = StringIO()
+        # fixture events are loaded without summaries
+        AccountActivitySummary.objects.all().delete()
+        call_command("update_activity_summaries", stdout=stdout)
+        total = Account.objects.count()
+        assert "Updated %d account activity summaries" % total in stdout.getvalue()
+        assert AccountActivitySummary.objects.count() == total
+        # membership statistics are stored from the summaries
+        assert "Updated membership statistics" in stdout.getvalue()
+        assert MembershipStats.compressed_json() is not None
+
+        account = Account.objects.first()
+        AccountActivitySummary.objects.all().delete()
+        call_command("update_activity_summaries", str(account.pk), stdout=stdout)
+        assert list(AccountActivitySummary.objects.values_list("pk", flat=True)) == [
+            account.pk
+        ]
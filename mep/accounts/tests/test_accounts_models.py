@@ -8,8 +8,10 @@ from django.test import TestCase
 from djiffy.models import Canvas, Manifest
 import pytest
 
+from mep.accounts.event_set import EventTimeline
 from mep.accounts.models import (
     Account,
+    AccountActivitySummary,
     Address,
     Borrow,
     CurrencyMixin,
@@ -1203,3 +1205,211 @@ class TestCurrencyMixin(TestCase):
         # when symbol is not known
         coin.currency = "foo"
         assert coin.currency_symbol() == "foo"
+
+
+class TestEventTimeline(TestCase):
+    def test_single_query(self):
+        account = Account.objects.create()
+        work = Work.objects.create()
+        Subscription.objects.create(
+            account=account,
+            start_date=datetime.date(1921, 1, 1),
+            end_date=datetime.date(1922, 2, 1),
+        )
+        borrow = Borrow.objects.create(
+            account=account, work=work, start_date=datetime.date(1921, 4, 10)
+        )
+        account = Account.objects.get(pk=account.pk)
+        # all aggregates are calculated from one query and cached
+        with self.assertNumQueries(1):
+            assert account.event_dates == [
+                datetime.date(1921, 1, 1),
+                datetime.date(1921, 4, 10),
+                datetime.date(1922, 2, 1),
+            ]
+            assert sorted(account.event_years) == [1921, 1922]
+            assert len(account.event_date_ranges()) == 1
+            assert account.event_date_ranges("membership") == [
+                [datetime.date(1921, 1, 1), datetime.date(1922, 2, 1)]
+            ]
+            assert len(account.active_months()) == 14
+            assert account.active_months("books") == {"192104"}
+            assert account.earliest_date() == datetime.date(1921, 1, 1)
+            assert account.last_date() == datetime.date(1922, 2, 1)
+
+        # cleared when an event on a loaded account or work changes
+        Borrow.objects.create(
+            account=account, work=work, start_date=datetime.date(1925, 3, 1)
+        )
+        assert account.last_date() == datetime.date(1925, 3, 1)
+        assert len(work.event_dates) == 2
+        borrow.delete()
+        assert work.event_dates == [datetime.date(1925, 3, 1)]
+
+    def test_for_related(self):
+        work = Work.objects.create()
+        accounts = [Account.objects.create() for i in range(3)]
+        for i, account in enumerate(accounts[:2]):
+            Subscription.objects.create(
+                account=account,
+                start_date=datetime.date(1921 + i, 1, 1),
+                end_date=datetime.date(1922 + i, 2, 1),
+            )
+            Borrow.objects.create(
+                account=account, work=work, start_date=datetime.date(1925, 4, 10)
+            )
+        # one query for ids, one for all events
+        with self.assertNumQueries(2):
+            timelines = EventTimeline.for_related(Account.objects.all())
+        assert set(timelines) == set(account.pk for account in accounts)
+        for account in accounts:
+            timeline = timelines[account.pk]
+            assert timeline.event_dates == account.event_dates
+            assert timeline.event_years == account.event_years
+            assert timeline.event_date_ranges() == account.event_date_ranges()
+            assert timeline.active_months() == account.active_months()
+            assert timeline.active_months("books") == account.active_months("books")
+        # no events: empty timeline
+        assert timelines[accounts[2].pk].event_dates == []
+
+        # works
+        timelines = EventTimeline.for_related(Work.objects.all())
+        assert timelines[work.pk].event_dates == work.event_dates
+        assert timelines[work.pk].active_months("membership") == set()
+
+    def test_for_events(self):
+        # no events, no error
+        timeline = EventTimeline.for_events(Event.objects.none())
+        assert timeline.event_dates == []
+        assert timeline.event_years == []
+        assert timeline.earliest_date() is None
+        assert timeline.last_date() is None
+        assert timeline.active_months("membership") == set()
+
+
+class TestAccountActivitySummary(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create()
+        self.work = Work.objects.create()
+        Subscription.objects.create(
+            account=self.account,
+            start_date=datetime.date(1921, 1, 1),
+            end_date=datetime.date(1923, 2, 1),
+        )
+        Borrow.objects.create(
+            account=self.account,
+            work=self.work,
+            start_date=datetime.date(1923, 4, 10),
+            end_date=datetime.date(1923, 4, 20),
+        )
+        # borrow with unknown month
+        month_unknown = Borrow(account=self.account, work=self.work)
+        month_unknown.partial_start_date = "1930"
+        month_unknown.save()
+        # purchase with unknown year
+        year_unknown = Purchase(account=self.account, work=self.work)
+        year_unknown.partial_start_date = "--05-01"
+        year_unknown.save()
+        Reimbursement.objects.create(
+            account=self.account, start_date=datetime.date(1924, 1, 1)
+        )
+
+    def assert_matches_account(self, summary, account):
+        # summary values should match event set calculations
+        assert summary.event_dates == account.event_dates
+        assert sorted(summary.event_years) == sorted(account.event_years)
+        assert summary.earliest_date() == account.earliest_date()
+        assert summary.last_date() == account.last_date()
+        for event_type in [None, "membership"]:
+            assert summary.event_date_ranges(event_type) == account.event_date_ranges(
+                event_type
+            )
+        for event_type in [None, "membership", "books"]:
+            assert summary.active_months(event_type) == account.active_months(
+                event_type
+            )
+
+    def test_update_account(self):
+        summary = AccountActivitySummary.update_account(self.account)
+        self.assert_matches_account(summary, self.account)
+        assert summary.years == [1921, 1922, 1923, 1924, 1930]
+        assert summary.book_months == ["192304"]
+        # saved and cached on the account
+        assert self.account.activity == summary
+        assert AccountActivitySummary.objects.get(account=self.account).dates
+
+        # no events
+        empty = Account.objects.create()
+        summary = AccountActivitySummary.update_account(empty)
+        assert summary.event_dates == []
+        assert summary.earliest_date() is None
+        assert summary.active_months() == set()
+
+    def test_account_activity(self):
+        account = Account.objects.get(pk=self.account.pk)
+        # calculated but not saved when accessed if it does not exist
+        AccountActivitySummary.objects.filter(account=account).delete()
+        account = Account.objects.get(pk=self.account.pk)
+        self.assert_matches_account(account.activity, account)
+        assert account.activity._state.adding
+        assert not AccountActivitySummary.objects.filter(account=account).exists()
+        # loaded from the database when it does exist
+        AccountActivitySummary.update_account(account)
+        account = Account.objects.get(pk=self.account.pk)
+        with self.assertNumQueries(1):
+            assert account.activity.dates
+
+    def test_signals(self):
+        # summaries are updated when any kind of event is saved
+        assert self.account.activity.last_date() == datetime.date(1930, 1, 1)
+        purchase = Purchase.objects.create(
+            account=self.account, work=self.work, start_date=datetime.date(1935, 3, 1)
+        )
+        account = Account.objects.get(pk=self.account.pk)
+        assert account.activity.last_date() == datetime.date(1935, 3, 1)
+        assert "193503" in account.activity.active_months("books")
+
+        # moved to another account: both accounts are updated
+        other_account = Account.objects.create()
+        purchase.account = other_account
+        purchase.save()
+        account = Account.objects.get(pk=self.account.pk)
+        assert account.activity.last_date() == datetime.date(1930, 1, 1)
+        assert other_account.activity.event_dates == [datetime.date(1935, 3, 1)]
+
+        # deleted
+        Event.objects.filter(reimbursement__isnull=False).delete()
+        account = Account.objects.get(pk=self.account.pk)
+        self.assert_matches_account(account.activity, account)
+        assert "192401" not in account.activity.active_months("membership")
+        # summary is only updated once when a subclass type is deleted
+        with patch.object(
+            EventTimeline, "for_events", wraps=EventTimeline.for_events
+        ) as mock_for_events:
+            Borrow.objects.filter(account=self.account).first().delete()
+            assert mock_for_events.call_count == 1
+        account = Account.objects.get(pk=self.account.pk)
+        self.assert_matches_account(account.activity, account)
+
+        # deleting an account removes the summary
+        self.account.delete()
+        assert not AccountActivitySummary.objects.filter(account_id=account.pk).exists()
+
+    def test_rebuild(self):
+        other_account = Account.objects.create()
+        Subscription.objects.create(
+            account=other_account,
+            start_date=datetime.date(1935, 1, 1),
+            end_date=datetime.date(1935, 2, 1),
+        )
+        AccountActivitySummary.objects.all().delete()
+        # one query for account ids and a single query to load all events
+        with self.assertNumQueries(6):
+            assert AccountActivitySummary.rebuild() == 2
+        for account in Account.objects.all():
+            self.assert_matches_account(account.activity_summary, account)
+
+        # rebuild only the specified accounts
+        AccountActivitySummary.objects.all().delete()
+        AccountActivitySummary.rebuild(Account.objects.filter(pk=other_account.pk))
+        assert AccountActivitySummary.objects.count() == 1
@@ -8,9 +8,8 @@ and purchases.
 """
 
 from django.db.models import F, Prefetch
-from mep.books.models import CreatorType, Work
+from mep.books.models import Creator, CreatorType, Work
 from mep.common.management.export import BaseExport
-from mep.common.utils import absolutize_url
 
 
 class Command(BaseExport):
@@ -53,6 +52,19 @@ class Command(BaseExport):
         ]
     )
 
+    column_types = dict(
+        {creator.lower(): ["string"] for creator in creator_types},
+        year="int",
+        genre_category=["string"],
+        uncertain="bool",
+        volumes_issues=["string"],
+        event_count="int",
+        borrow_count="int",
+        purchase_count="int",
+        circulation_years=["int"],
+        updated="datetime",
+    )
+
     def get_base_filename(self):
         """use "books" instead of "works" for export file"""
         return "books"
@@ -64,7 +76,15 @@ class Command(BaseExport):
         return (
             super()
             .get_queryset()
-            .prefetch_related(Prefetch("creator_set"), Prefetch("categories"))
+            .select_related("work_format")
+            .prefetch_related(
+                Prefetch(
+                    "creator_set",
+                    queryset=Creator.objects.select_related("person", "creator_type"),
+                ),
+                Prefetch("categories"),
+                "edition_set",
+            )
             .count_events()
             .order_by(F("year").asc(nulls_last=True), "title")
         )
@@ -77,7 +97,7 @@ class Command(BaseExport):
         # required properties
         data = dict(
             id=work.slug,
-            uri=absolutize_url(work.get_absolute_url()),
+            uri=self.absolute_url(work),
             title=work.title,
         )
         data.update(self.creator_info(work))
@@ -97,10 +117,9 @@ class Command(BaseExport):
         if work.ebook_url:
             data["ebook_url"] = work.ebook_url
         # text listing of volumes/issues
-        if work.edition_set.exists():
-            data["volumes_issues"] = [
-                vol.display_text() for vol in work.edition_set.all()
-            ]
+        editions = work.edition_set.all()
+        if editions:
+            data["volumes_issues"] = [vol.display_text() for vol in editions]
         # public notes
         if work.public_notes:
             data["notes"] = work.public_notes
@@ -110,7 +129,7 @@ class Command(BaseExport):
         data["borrow_count"] = work.borrow_count
         data["purchase_count"] = work.purchase_count
         # set for unique, list for json serialization
-        data["circulation_years"] = list(set(d.year for d in work.event_dates))
+        data["circulation_years"] = list(set(d.year for d in self.event_dates(work)))
 
         # date last modified
         data["updated"] = work.updated_at.isoformat()
@@ -9,9 +9,15 @@ from django.urls import reverse
 from django.utils.html import format_html, strip_tags
 from parasolr.django.indexing import ModelIndexable
 
-from mep.accounts.event_set import EventSetMixin
+from mep.accounts.event_set import EventSetMixin, EventTimeline
 from mep.accounts.partial_date import DatePrecisionField, PartialDate, PartialDateMixin
 from mep.books.utils import generate_sort_title, nonstop_words, work_slug
+from mep.common.indexing import (
+    CONTENT_HASH_FIELD,
+    PartialIndexable,
+    ReindexCoalescer,
+    content_hash,
+)
 from mep.common.models import Named, Notable, TrackChangesModel
 from mep.common.validators import verify_latlon
 from mep.people.models import Person
@@ -148,7 +154,11 @@ class WorkSignalHandlers:
             logger.debug(
                 "creator type save, reindexing %d related works", works.count()
             )
-            ModelIndexable.index_items(works)
+            ReindexCoalescer.index_items(
+                works,
+                reason="creatortype save",
+                fields=Work.index_fields("books.CreatorType"),
+            )
 
     @staticmethod
     def creatortype_delete(sender, instance, **_kwargs):
@@ -162,7 +172,11 @@ class WorkSignalHandlers:
             )
             # find the items based on the list of ids to reindex
             works = Work.objects.filter(id__in=list(work_ids))
-            ModelIndexable.index_items(works)
+            ReindexCoalescer.index_items(
+                works,
+                reason="creatortype delete",
+                fields=Work.index_fields("books.CreatorType"),
+            )
 
     @staticmethod
     def person_save(sender, instance=None, raw=False, **_kwargs):
@@ -174,7 +188,9 @@ class WorkSignalHandlers:
         works = Work.objects.filter(creator__person__pk=instance.pk)
         if works.exists():
             logger.debug("person save, reindexing %d related works", works.count())
-            ModelIndexable.index_items(works)
+            ReindexCoalescer.index_items(
+                works, reason="person save", fields=Work.index_fields("creators")
+            )
 
     @staticmethod
     def person_delete(sender, instance, **_kwargs):
@@ -186,7 +202,9 @@ class WorkSignalHandlers:
             logger.debug("person delete, reindexing %d related works", len(work_ids))
             # find the items based on the list of ids to reindex
             works = Work.objects.filter(id__in=list(work_ids))
-            ModelIndexable.index_items(works)
+            ReindexCoalescer.index_items(
+                works, reason="person delete", fields=Work.index_fields("creators")
+            )
 
     @staticmethod
     def creator_change(sender, instance=None, raw=False, **_kwargs):
@@ -196,7 +214,11 @@ class WorkSignalHandlers:
             return
         logger.debug("creator change, reindexing %s", instance.work)
         # delete the assocation so cards will index without the account
-        ModelIndexable.index_items([instance.work])
+        ReindexCoalescer.index_items(
+            [instance.work],
+            reason="creator change",
+            fields=Work.index_fields("books.Creator"),
+        )
 
     @staticmethod
     def format_save(sender, instance=None, raw=False, **_kwargs):
@@ -208,7 +230,9 @@ class WorkSignalHandlers:
         works = Work.objects.filter(work_format__pk=instance.pk)
         if works.exists():
             logger.debug("format save, reindexing %d related works", works.count())
-            ModelIndexable.index_items(works)
+            ReindexCoalescer.index_items(
+                works, reason="format save", fields=Work.index_fields("books.Format")
+            )
 
     @staticmethod
     def format_delete(sender, instance, **_kwargs):
@@ -220,7 +244,9 @@ class WorkSignalHandlers:
             logger.debug("format delete, reindexing %d related works", len(work_ids))
             # find the items based on the list of ids to reindex
             works = Work.objects.filter(id__in=list(work_ids))
-            ModelIndexable.index_items(works)
+            ReindexCoalescer.index_items(
+                works, reason="format delete", fields=Work.index_fields("books.Format")
+            )
 
     @staticmethod
     def event_save(sender=None, instance=None, raw=False, **kwargs):
@@ -230,7 +256,11 @@ class WorkSignalHandlers:
             return
         # if any books are associated
         if instance.work:
-            ModelIndexable.index_items([instance.work])
+            ReindexCoalescer.index_items(
+                [instance.work],
+                reason="event save",
+                fields=Work.index_fields("accounts.Event"),
+            )
 
     @staticmethod
     def event_delete(sender, instance, **kwargs):
@@ -238,7 +268,11 @@ class WorkSignalHandlers:
         with the corresponding account."""
         # get a list of ids for deleted event
         if instance.work:
-            ModelIndexable.index_items([instance.work])
+            ReindexCoalescer.index_items(
+                [instance.work],
+                reason="event delete",
+                fields=Work.index_fields("accounts.Event"),
+            )
 
 
 class WorkQuerySet(models.QuerySet):
@@ -254,7 +288,7 @@ class WorkQuerySet(models.QuerySet):
         )
 
 
-class Work(TrackChangesModel, Notable, ModelIndexable, EventSetMixin):
+class Work(TrackChangesModel, Notable, PartialIndexable, ModelIndexable, EventSetMixin):
     """Work record for an item that circulated in the library or was
     other referenced in library activities."""
 
@@ -449,27 +483,25 @@ class Work(TrackChangesModel, Notable, ModelIndexable, EventSetMixin):
     def event_count(self):
         """Number of events of any kind associated with this work."""
         # use database annotation if present; otherwise use queryset
-        return getattr(self, "event__count", self.event_set.count())
+        if hasattr(self, "event__count"):
+            return self.event__count
+        return self.event_set.count()
 
     @property
     def borrow_count(self):
         """Number of times this work was borrowed."""
         # use database annotation if present; otherwise use queryset
-        return getattr(
-            self,
-            "event__borrow__count",
-            self.event_set.filter(borrow__isnull=False).count(),
-        )
+        if hasattr(self, "event__borrow__count"):
+            return self.event__borrow__count
+        return self.event_set.filter(borrow__isnull=False).count()
 
     @property
     def purchase_count(self):
         """Number of times this work was purchased."""
         # use database annotation if present; otherwise use queryset
-        return getattr(
-            self,
-            "event__purchase__count",
-            self.event_set.filter(purchase__isnull=False).count(),
-        )
+        if hasattr(self, "event__purchase__count"):
+            return self.event__purchase__count
+        return self.event_set.filter(purchase__isnull=False).count()
 
     def admin_url(self):
         """URL to edit this record in the admin site"""
@@ -500,6 +532,29 @@ class Work(TrackChangesModel, Notable, ModelIndexable, EventSetMixin):
         """format of this work if known (e.g. book or periodical)"""
         return self.work_format.name if self.work_format else ""
 
+    #: methods that generate index data for groups of Solr fields, for
+    #: partial updates; see :class:`~mep.common.indexing.PartialIndexable`
+    index_field_providers = {
+        "creators": (
+            "index_creator_data",
+            ["authors_t", "sort_authors_t", "sort_authors_isort", "creators_t"],
+        ),
+        "format": ("index_format_data", ["format_s_lower"]),
+        "events": (
+            "index_event_data",
+            ["event_count_i", "first_event_date_i", "event_years_is"],
+        ),
+    }
+
+    #: field groups affected by each index dependency
+    index_depends_on_fields = {
+        "creators": ["creators"],
+        "books.Creator": ["creators"],
+        "books.CreatorType": ["creators"],
+        "books.Format": ["format"],
+        "accounts.Event": ["events"],
+    }
+
     index_depends_on = {
         "creators": {
             "post_save": WorkSignalHandlers.person_save,
@@ -539,6 +594,17 @@ class Work(TrackChangesModel, Notable, ModelIndexable, EventSetMixin):
         creators, annotate event counts."""
         return cls.objects.prefetch_related("creator_set").count_events()
 
+    @classmethod
+    def prep_index_chunk(cls, chunk):
+        """Calculate event timelines for a chunk of works being indexed
+        in bulk from a single events query."""
+        timelines = EventTimeline.for_related(
+            cls.objects.filter(pk__in=[work.pk for work in chunk])
+        )
+        for work in chunk:
+            work.event_timeline = timelines[work.pk]
+        return chunk
+
     def index_data(self):
         """data for indexing in Solr"""
         index_data = super().index_data()
@@ -553,29 +619,41 @@ class Work(TrackChangesModel, Notable, ModelIndexable, EventSetMixin):
                 "title_t": self.title,
                 "sort_title_isort": self.sort_title,
                 "slug_s": self.slug,
-                "authors_t": [a.name for a in self.authors] if self.authors else None,
-                "sort_authors_t": [str(a) for a in self.authors]
-                if self.authors
-                else None,
-                "sort_authors_isort": self.sort_author_list,
-                "creators_t": self.creator_names,
                 "pub_date_i": self.year,
-                "format_s_lower": self.format(),
                 "notes_txt_en": self.public_notes,
                 "is_uncertain_b": self.is_uncertain,
-                "event_count_i": self.event_count,
                 "admin_notes_txt_en": self.notes,
                 "edition_titles": [ed.title for ed in self.edition_set.all()],
             }
         )
+        index_data.update(self.index_creator_data())
+        index_data.update(self.index_format_data())
+        index_data.update(self.index_event_data())
+        index_data[CONTENT_HASH_FIELD] = content_hash(index_data)
+        return index_data
 
+    def index_creator_data(self):
+        """author and creator data for indexing in Solr"""
+        return {
+            "authors_t": [a.name for a in self.authors] if self.authors else None,
+            "sort_authors_t": [str(a) for a in self.authors] if self.authors else None,
+            "sort_authors_isort": self.sort_author_list,
+            "creators_t": self.creator_names,
+        }
+
+    def index_format_data(self):
+        """format data for indexing in Solr"""
+        return {"format_s_lower": self.format()}
+
+    def index_event_data(self):
+        """event count and circulation dates for indexing in Solr"""
+        index_data = {"event_count_i": self.event_count}
         earliest_date = self.earliest_date()
         if earliest_date:
             # NOTE: doesn't matter if partial, will still sort as expected
             index_data["first_event_date_i"] = earliest_date.strftime("%Y%m%d")
             # if there is at least one date, also include circulation years
             index_data["event_years_is"] = self.event_years
-
         return index_data
 
     @property
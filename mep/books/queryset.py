@@ -1,4 +1,4 @@
-from parasolr.django import AliasedSolrQuerySet
+from mep.common.solr import AliasedSolrQuerySet
 
 
 class WorkSolrQuerySet(AliasedSolrQuerySet):
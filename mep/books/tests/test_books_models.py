@@ -460,6 +460,21 @@ class TestWork(TestCase):
             mockobjects.prefetch_related.assert_called_with("creator_set")
             mockobjects.prefetch_related.return_value.count_events.assert_any_call()
 
+    def test_prep_index_chunk(self):
+        work1 = Work.objects.create(title="poems", slug="poems")
+        work2 = Work.objects.create(title="plays", slug="plays")
+        acct = Account.objects.create()
+        Event.objects.create(
+            account=acct, work=work1, start_date=datetime.date(1919, 11, 15)
+        )
+        chunk = [work1, work2]
+        # timelines for all works in the chunk calculated in bulk
+        with self.assertNumQueries(2):
+            assert Work.prep_index_chunk(chunk) == chunk
+        with self.assertNumQueries(0):
+            assert chunk[0].earliest_date() == datetime.date(1919, 11, 15)
+            assert chunk[1].event_dates == []
+
 
 class TestCreator(TestCase):
     def test_str(self):
@@ -11,6 +11,7 @@ import pytest
 
 from mep.books.models import PastWorkSlug, Work
 from mep.books.views import WorkCirculation, WorkCardList, WorkList
+from mep.common.indexing import SurrogateKeys
 from mep.common.utils import absolutize_url, login_temporarily_required
 from mep.footnotes.models import Footnote
 from mep.pages.models import LinkPage
@@ -207,7 +208,9 @@ class TestWorkListView(TestCase):
         # should use /books LinkPage for title if set
         new_title = "New Title"
         root = LinkPage.get_first_root_node()
-        root.add_child(instance=LinkPage(title=new_title, tagline="test", link_url="/books"))
+        root.add_child(
+            instance=LinkPage(title=new_title, tagline="test", link_url="/books")
+        )
         response = self.client.get(self.url)
         assert response.context.get("page_title") == new_title
 
@@ -233,21 +236,18 @@ class TestWorkListView(TestCase):
         # alpha page labels depending on sort
         form.is_valid.return_value = True
         view.queryset = Mock()
-        page_label_results = [
-            {"sort_title_isort": "ABC books"},
-            {"sort_title_isort": "Charlie Day"},
-        ]
-        view.queryset.only.return_value.get_results.return_value = page_label_results
         form.cleaned_data = {"sort": "title"}
-        paginator = Paginator(page_label_results, per_page=view.paginate_by)
-        page_labels = view.get_page_labels(paginator)
-        # assert page_labels == [(1, 'ABC – Char')]
-        # only one entry; couldn't get odict items comparison to work otherwise
-        for i, val in page_labels:
-            assert i == 1
-            assert val == "ABC – Char"
-        view.queryset.only.assert_called_with(view.solr_sort["title"])
-        view.queryset.only.return_value.get_results.assert_called_with(rows=100000)
+        with patch("mep.books.views.solr_pagelabels") as mock_pagelabels:
+            page_labels = view.get_page_labels(paginator)
+            view.queryset.only.assert_called_with(view.solr_sort["title"])
+            args, kwargs = mock_pagelabels.call_args
+            assert args[0] == paginator
+            assert args[1] == view.queryset.only.return_value
+            assert kwargs["max_chars"] == 4
+            # label method casts to string, e.g. for years
+            assert args[2]({"sort_title_isort": "ABC books"}) == "ABC books"
+            assert args[2]({}) == ""
+            assert page_labels == mock_pagelabels.return_value.items.return_value
 
     def test_pagination(self):
         response = self.client.get(self.url)
@@ -265,12 +265,12 @@ class TestWorkListView(TestCase):
         )
 
     @patch("mep.books.views.WorkSolrQuerySet")
-    def test_get_range_stats(self, mock_wsq):
+    def test_calculate_range_stats(self, mock_wsq):
         # NOTE: This depends on configuration for mapping the fields
         # in the range_field_map class attribute of MembersList
         mock_stats = {"stats_fields": {"event_years": {"min": 1919.0, "max": 1962.0}}}
         mock_wsq.return_value.stats.return_value.get_stats.return_value = mock_stats
-        range_minmax = WorkList().get_range_stats()
+        range_minmax = WorkList().calculate_range_stats()
         # returns integer years
         # also converts membership_dates to
         assert range_minmax == {"circulation_dates": (1919, 1962)}
@@ -279,12 +279,12 @@ class TestWorkListView(TestCase):
         assert "event_years" in args
         # if get stats returns None, should return an empty dict
         mock_wsq.return_value.stats.return_value.get_stats.return_value = None
-        assert WorkList().get_range_stats() == {}
+        assert WorkList().calculate_range_stats() == {}
         # None set for min or max should result in the field not being
         # returned (but the other should be passed through as expected)
         mock_wsq.return_value.stats.return_value.get_stats.return_value = mock_stats
         mock_stats["stats_fields"]["event_years"]["min"] = None
-        assert WorkList().get_range_stats() == {}
+        assert WorkList().calculate_range_stats() == {}
 
 
 class TestWorkDetailView(TestCase):
@@ -409,6 +409,16 @@ class TestWorkCirculation(TestCase):
         assert context["work"] == self.work
         assert context["page_title"] == "The Dial Circulation Activity"
 
+    def test_get_surrogate_keys(self):
+        self.view.object_list = self.view.get_queryset()
+        self.view.get_context_data()
+        keys = self.view.get_surrogate_keys()
+        assert SurrogateKeys.for_item(self.work) in keys
+        # includes members with events, since their names are displayed
+        for event in self.view.object_list:
+            for person in event.account.persons.all():
+                assert SurrogateKeys.for_item(person) in keys
+
     def test_get_breadcrumbs(self):
         # breadcrumbs order should be: home, works list, work detail, work circ.
         self.view.object_list = self.view.get_queryset()
@@ -14,21 +14,29 @@ from mep.books.forms import WorkSearchForm
 from mep.books.models import Work
 from mep.books.queryset import WorkSolrQuerySet
 from mep.common import SCHEMA_ORG
-from mep.common.utils import absolutize_url, alpha_pagelabels
+from mep.common.indexing import SurrogateKeys
+from mep.common.solr import SolrPaginator, solr_pagelabels
+from mep.common.utils import absolutize_url
 from mep.common.views import (
     AjaxTemplateMixin,
+    CachedResponseMixin,
     FacetJSONMixin,
     LabeledPagesMixin,
+    RangeStatsMixin,
     RdfViewMixin,
     SolrLastModifiedMixin,
+    SolrQueryCountMixin,
 )
 from mep.footnotes.models import Footnote
 from mep.pages.models import LinkPage
 
 
 class WorkList(
+    SolrQueryCountMixin,
+    CachedResponseMixin,
     LabeledPagesMixin,
     SolrLastModifiedMixin,
+    RangeStatsMixin,
     ListView,
     FormMixin,
     AjaxTemplateMixin,
@@ -49,6 +57,10 @@ class WorkList(
     context_object_name = "works"
     rdf_type = SCHEMA_ORG.SearchResultPage
     solr_lastmodified_filters = {"item_type": "work"}
+    #: retrieve each page, count, and facets with a single Solr query
+    paginator_class = SolrPaginator
+    #: purge cached responses when any work is reindexed
+    surrogate_keys = ["work"]
 
     form_class = WorkSearchForm
     _form = None
@@ -80,36 +92,9 @@ class WorkList(
 
         return kwargs
 
-    # adapted from member list view
-    def get_range_stats(self):
-        """Return the min and max for fields specified in
-        :class:`WorkList`'s stats_fields
-
-        :returns: Dictionary keyed on form field name with a tuple of
-            (min, max) as integers. If stats are not returned from the field,
-            the key is not added to a dictionary.
-        :rtype: dict
-        """
-        stats = WorkSolrQuerySet().stats(*self.stats_fields).get_stats()
-        min_max_ranges = {}
-        if not stats:
-            return min_max_ranges
-        for name in self.stats_fields:
-            try:
-                min_year = int(stats["stats_fields"][name]["min"])
-                max_year = int(stats["stats_fields"][name]["max"])
-                # map to form field name if an alias is provided
-                min_max_ranges[self.range_field_map.get(name, name)] = (
-                    min_year,
-                    max_year,
-                )
-            # If the field stats are missing, min and max will be NULL,
-            # rendered as None.
-            # The TypeError will catch and pass returning an empty entry
-            # for that field but allowing others to be passed on.
-            except TypeError:
-                pass
-        return min_max_ranges
+    def get_stats_queryset(self):
+        """Solr queryset for range stats"""
+        return WorkSolrQuerySet()
 
     def get_form(self, *args, **kwargs):
         if not self._form:
@@ -134,7 +119,12 @@ class WorkList(
     def get_queryset(self):
         # NOTE faceting so that response doesn't register as an error;
         # data is currently unused
-        sqs = WorkSolrQuerySet().facet_field("format", exclude="format")
+        # include last modified date for the last modified header
+        sqs = (
+            WorkSolrQuerySet()
+            .last_modified_aggregate(**self.get_solr_lastmodified_filters())
+            .facet_field("format", exclude="format")
+        )
 
         form = self.get_form()
 
@@ -206,13 +196,11 @@ class WorkList(
         if sort in ["title", "author", "pubdate", "circulation_date"]:
             sort_field = self.solr_sort[sort].lstrip("-")
             # otherwise, when sorting by alpha, generate alpha page labels
-            # Only return sort name; get everything at once to avoid
-            # hitting Solr for each page / item.
-            pagination_qs = self.queryset.only(sort_field).get_results(rows=100000)
+            # Only return sort name, for the first and last item on each page
             # cast to string so integers (year) can be treated the same
-            alpha_labels = alpha_pagelabels(
+            alpha_labels = solr_pagelabels(
                 paginator,
-                pagination_qs,
+                self.queryset.only(sort_field),
                 lambda x: str(x.get(sort_field, "")),
                 max_chars=4,
             )
@@ -236,14 +224,20 @@ class WorkList(
         ]
 
 
-class WorkLastModifiedListMixin(SolrLastModifiedMixin):
-    """last modified mixin with common logic for all work detail views"""
+class WorkLastModifiedListMixin(CachedResponseMixin, SolrLastModifiedMixin):
+    """last modified and response cache mixin with common logic for all
+    work detail views"""
 
     def get_solr_lastmodified_filters(self):
         """filter solr query by item type and slug"""
         # NOTE: slug_s because not using aliased queryset
         return {"item_type": "work", "slug_s": self.kwargs["slug"]}
 
+    def get_surrogate_keys(self):
+        """purge cached responses when this work is reindexed"""
+        work = getattr(self, "work", None) or self.object
+        return super().get_surrogate_keys() + [SurrogateKeys.for_item(work)]
+
 
 class WorkPastSlugMixin:
     """View mixin to handle redirects for previously used slugs.
@@ -357,6 +351,18 @@ class WorkCirculation(
         )
         return context
 
+    def get_surrogate_keys(self):
+        """purge cached responses when this work or any member with
+        events listed is reindexed, since member names are displayed"""
+        members = {
+            person
+            for event in self.object_list
+            for person in event.account.persons.all()
+        }
+        return super().get_surrogate_keys() + sorted(
+            SurrogateKeys.for_item(member) for member in members
+        )
+
     def get_absolute_url(self):
         """Get the full URI of this page."""
         return absolutize_url(reverse("books:book-circ", kwargs=self.kwargs))
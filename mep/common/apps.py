@@ -7,3 +7,16 @@ class CommonConfig(AppConfig):
     def ready(self):
         # import and connect signal handlers for Solr indexing
         from parasolr.django.signals import IndexableSignalHandler
+        from django.core.checks import register
+        from django.db.models.signals import post_delete, post_save
+        from parasolr.indexing import Indexable
+
+        from mep.common.checks import response_cache_check
+        from mep.common.indexing import purge_surrogate_keys
+
+        register(response_cache_check)
+
+        # purge cached responses when indexed records change
+        for model in Indexable.all_indexables():
+            post_save.connect(purge_surrogate_keys, sender=model)
+            post_delete.connect(purge_surrogate_keys, sender=model)
@@ -0,0 +1,28 @@
+"""
+System checks for cache settings used by the public views.
+"""
+
+from django.conf import settings
+from django.core.checks import Error
+
+LOCMEM_BACKEND = "django.core.cache.backends.locmem.LocMemCache"
+
+
+def response_cache_check(app_configs, **kwargs):
+    """Response caching relies on surrogate key versions in the Django
+    cache being purged for every process when records change, so it
+    requires a cache backend shared by all processes."""
+    errors = []
+    if getattr(settings, "RESPONSE_CACHE", False):
+        backend = settings.CACHES.get("default", {}).get("BACKEND", LOCMEM_BACKEND)
+        if backend == LOCMEM_BACKEND:
+            errors.append(
+                Error(
+                    "RESPONSE_CACHE requires a shared cache backend",
+                    hint="Configure CACHES with a cache shared by all "
+                    "processes, e.g. Redis or Memcached.",
+                    obj="RESPONSE_CACHE",
+                    id="common.E001",
+                )
+            )
+    return errors
@@ -0,0 +1,397 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from parasolr.django import SolrClient
+from parasolr.django.indexing import ModelIndexable
+import requests
+
+from mep.common.models import IndexQueueItem
+
+
+logger = logging.getLogger(__name__)
+
+
+class IndexVersion:
+    """Version of the Solr index, as reported by Solr for the index that
+    queries currently search; changes whenever committed changes become
+    visible, including changes made outside this application (e.g. with
+    the parasolr `index` manage command). Used to key values calculated
+    from the index, so that they are not reused after the index changes.
+
+    Solr is checked at most once every **SOLR_INDEX_VERSION_TTL** seconds
+    (default 5) in each process, so values may be reused for that long
+    after a change."""
+
+    #: default number of seconds to reuse the version before checking again
+    default_ttl = 5
+
+    #: last version retrieved in this process, and when it was checked
+    _checked = (None, None)
+
+    @staticmethod
+    def fetch():
+        """Get the current index version from the Solr Luke request
+        handler. Returns None if Solr is unavailable."""
+        solr = SolrClient()
+        try:
+            response = solr.make_request(
+                "get",
+                solr.build_url(solr.solr_url, solr.collection, "admin/luke"),
+                params={"numTerms": 0, "show": "index"},
+            )
+        except requests.exceptions.ConnectionError:
+            return None
+        if response:
+            return response.index.version
+
+    @classmethod
+    def get(cls):
+        """Get the current index version; returns None if it can't be
+        determined, in which case values should not be cached."""
+        ttl = getattr(settings, "SOLR_INDEX_VERSION_TTL", cls.default_ttl)
+        version, checked = cls._checked
+        now = time.monotonic()
+        if checked is None or now - checked > ttl:
+            version = cls.fetch()
+            # failures are not remembered, so the next call checks again
+            cls._checked = (version, now) if version is not None else (None, None)
+        return version
+
+    @classmethod
+    def clear(cls):
+        """Forget the version retrieved by this process, so that Solr is
+        checked again on the next call to :meth:`get`."""
+        cls._checked = (None, None)
+
+
+class SurrogateKeys:
+    """Versions for surrogate keys identifying the indexed records included
+    in cached responses (see :class:`~mep.common.views.CachedResponseMixin`).
+    Keys are the index item type for all records of that type (e.g.
+    ``person``, for search pages), or item type and primary key for a single
+    record (e.g. ``person:123``); :attr:`all` is included for every
+    response. Purging a key removes its version, so that cached responses
+    tagged with it are no longer used."""
+
+    #: key for all cached responses
+    all = "all"
+
+    #: prefix for cache keys storing versions
+    cache_prefix = "surrogate-key-"
+
+    @staticmethod
+    def for_item(item):
+        """Surrogate key for a single indexed record."""
+        return "%s:%s" % (item.index_item_type(), item.pk)
+
+    @classmethod
+    def versions(cls, keys):
+        """Get current versions for a list of keys, as a dictionary."""
+        cache_keys = {cls.cache_prefix + key: key for key in keys}
+        versions = cache.get_many(cache_keys.keys())
+        for cache_key in cache_keys.keys() - versions.keys():
+            # use the current time so that versions are not reused
+            # after a key is purged
+            cache.add(cache_key, time.time_ns(), timeout=None)
+            versions[cache_key] = cache.get(cache_key)
+        return {cache_keys[cache_key]: val for cache_key, val in versions.items()}
+
+    @classmethod
+    def purge(cls, keys):
+        """Purge cached responses tagged with any of the specified keys."""
+        cache.delete_many([cls.cache_prefix + key for key in keys])
+
+    @classmethod
+    def purge_items(cls, model, pks):
+        """Purge cached responses including any of the specified records
+        of an indexed model, or any search results for that model."""
+        item_type = model.index_item_type()
+        cls.purge([item_type] + ["%s:%s" % (item_type, pk) for pk in pks])
+
+
+def purge_surrogate_keys(sender=None, instance=None, **kwargs):
+    """Signal handler to purge cached responses including an indexed
+    record when it is saved or deleted; see :class:`SurrogateKeys`."""
+    SurrogateKeys.purge_items(sender, [instance.pk])
+
+
+#: Solr field for a hash of indexed content; see :func:`content_hash`
+CONTENT_HASH_FIELD = "content_hash_s"
+
+
+def content_hash(index_data):
+    """Generate a hash of index data for a Solr document, to check
+    whether the indexed version is current (see the `check_index`
+    manage command)."""
+    data = {key: val for key, val in index_data.items() if key != CONTENT_HASH_FIELD}
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class PartialIndexable:
+    """Mixin for :class:`~parasolr.django.indexing.ModelIndexable` models
+    to support Solr atomic updates of a subset of indexed fields, when a
+    change to a related record only affects some of them. Index data for
+    each group of fields is generated by a separate provider method, which
+    should also be used by :meth:`index_data`.
+
+    Atomic updates require all other fields to be stored in Solr (copy
+    field destinations are regenerated from stored sources).
+    """
+
+    #: maps a name for a group of Solr fields to the name of a method that
+    #: generates index data for those fields and the list of fields;
+    #: fields not included in the generated data are removed
+    index_field_providers = {}
+
+    #: field groups affected by changes to each
+    #: :attr:`~parasolr.django.indexing.ModelIndexable.index_depends_on`
+    #: dependency; changes to dependencies not listed require a full reindex
+    index_depends_on_fields = {}
+
+    @classmethod
+    def index_fields(cls, dependency):
+        """Field groups affected by changes to the specified index
+        dependency, or None if a full reindex is required."""
+        return cls.index_depends_on_fields.get(dependency)
+
+    def partial_index_ok(self):
+        """Check if this record can be updated with an atomic update;
+        records indexed without their full data (e.g. only an id)
+        should be fully reindexed instead."""
+        return True
+
+    def partial_index_data(self, field_groups):
+        """Solr atomic update to set only the fields in the specified
+        field groups, and update the last modified date."""
+        index_data = {
+            "id": self.index_id(),
+            "last_modified": {"set": "NOW"},
+            # the content hash is only calculated for full index data;
+            # clear it so check_index will fully reindex the document
+            CONTENT_HASH_FIELD: {"set": None},
+        }
+        for group in field_groups:
+            method, fields = self.index_field_providers[group]
+            data = getattr(self, method)()
+            for field in fields:
+                # a value of None removes the field
+                index_data[field] = {"set": data.get(field)}
+        return index_data
+
+
+class ReindexCoalescer(ContextDecorator):
+    """Context manager and decorator to collect items that need to be
+    reindexed in Solr, so that the same record is only reindexed once
+    when many related records are saved, e.g. an account edited in the
+    admin with a large number of inline events.
+
+    Signal handlers should call :meth:`index_items` instead of
+    :meth:`parasolr.django.indexing.ModelIndexable.index_items`; when a
+    coalescer is active, items are queued by model and primary key and
+    indexed in one batch per model when the outermost coalescer exits, or
+    when the current transaction is committed if it is used inside
+    :func:`django.db.transaction.atomic`. Otherwise items are indexed
+    immediately.
+
+    Handlers may specify the field groups affected by a change for models
+    that support :class:`PartialIndexable`; coalesced items that only need
+    those fields are updated with Solr atomic updates instead of being
+    fully reindexed.
+
+    When **SOLR_INDEX_QUEUE** is enabled in settings, items are added to
+    the database :class:`~mep.common.models.IndexQueueItem` queue instead
+    of being indexed, to be processed by the `index_worker` manage command;
+    queued items are always fully reindexed.
+
+    Cached responses including reindexed items are purged with
+    :class:`SurrogateKeys`.
+
+    Usage::
+
+        with transaction.atomic(), ReindexCoalescer():
+            ...
+    """
+
+    #: thread-local storage for the currently active coalescer
+    _local = threading.local()
+
+    #: running totals across all coalescers in this process, for metrics
+    totals = Counter()
+
+    def __init__(self):
+        # primary keys to reindex with reason queued and field groups
+        # to update (None for all fields), grouped by model
+        self.pending = defaultdict(dict)
+        #: number of items requested for reindexing
+        self.requested = 0
+        #: number of duplicate reindexes suppressed
+        self.suppressed = 0
+        self.nested = False
+
+    def _recreate_cm(self):
+        # use a new instance each time a decorated function is called
+        return self.__class__()
+
+    @classmethod
+    def active(cls):
+        """The currently active coalescer, if any."""
+        return getattr(cls._local, "coalescer", None)
+
+    def __enter__(self):
+        if self.active() is not None:
+            # nested; items are collected by the outermost coalescer
+            self.nested = True
+        else:
+            self._local.coalescer = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.nested:
+            return
+        self._local.coalescer = None
+        # if the transaction is still open, wait until it is committed;
+        # queued items are discarded if it is rolled back
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(self.flush)
+        else:
+            self.flush()
+
+    @staticmethod
+    def queue_enabled():
+        """Check if indexing should be queued in the database for
+        the `index_worker` manage command."""
+        return getattr(settings, "SOLR_INDEX_QUEUE", False)
+
+    @classmethod
+    def index_items(cls, items, reason="", fields=None):
+        """Queue a queryset or list of indexable model instances for
+        reindexing if a coalescer is active or the indexing queue is
+        enabled; otherwise, index them immediately.
+
+        :param reason: optional description of why items are being
+            reindexed, for the indexing queue
+        :param fields: optional list of :class:`PartialIndexable` field
+            groups to update, if a full reindex is not needed
+        """
+        coalescer = cls.active()
+        if coalescer is not None:
+            coalescer.add(items, reason, fields)
+        elif cls.queue_enabled():
+            # add to the database queue as part of the current transaction
+            coalescer = cls()
+            coalescer.add(items, reason)
+            coalescer.flush()
+        else:
+            ModelIndexable.index_items(items)
+            if isinstance(items, models.QuerySet):
+                SurrogateKeys.purge_items(
+                    items.model, list(items.values_list("pk", flat=True))
+                )
+            else:
+                for item in items:
+                    SurrogateKeys.purge_items(type(item), [item.pk])
+
+    def add(self, items, reason="", fields=None):
+        """Add a queryset or list of model instances to be reindexed."""
+        if isinstance(items, models.QuerySet):
+            model = items.model
+            pks = list(items.values_list("pk", flat=True))
+            self.queue(model, pks, reason, fields)
+        else:
+            for item in items:
+                self.queue(type(item), [item.pk], reason, fields)
+
+    def queue(self, model, pks, reason="", fields=None):
+        """Queue primary keys for a model to be reindexed; optionally
+        specify field groups to update instead of all fields."""
+        pending = self.pending[model]
+        fields = set(fields) if fields else None
+        for pk in pks:
+            self.requested += 1
+            if pk in pending:
+                self.suppressed += 1
+                queued_reason, queued_fields = pending[pk]
+                # combine field groups; a full reindex includes everything
+                if queued_fields is not None:
+                    pending[pk] = (
+                        queued_reason,
+                        None if fields is None else queued_fields | fields,
+                    )
+            else:
+                pending[pk] = (reason, fields)
+
+    def flush(self):
+        """Reindex all queued items, in one batch per model, or add them
+        to the database indexing queue if enabled; updates :attr:`totals`."""
+        count = 0
+        for model, pending in self.pending.items():
+            if self.queue_enabled():
+                # group by reason to add to the queue in bulk
+                by_reason = defaultdict(list)
+                for pk, (reason, fields) in pending.items():
+                    by_reason[reason].append(pk)
+                for reason, pks in by_reason.items():
+                    IndexQueueItem.enqueue(model, pks, reason)
+            else:
+                self.index_pending(model, pending)
+            SurrogateKeys.purge_items(model, list(pending))
+            count += len(pending)
+        if self.requested:
+            logger.debug(
+                "%s %d items; suppressed %d duplicate reindexes",
+                "queued" if self.queue_enabled() else "reindexed",
+                count,
+                self.suppressed,
+            )
+        self.totals.update(
+            requested=self.requested, indexed=count, suppressed=self.suppressed
+        )
+        self.pending.clear()
+        self.requested = self.suppressed = 0
+        return count
+
+    def index_pending(self, model, pending):
+        """Index pending items for a single model, using atomic updates
+        for items where only some field groups need to be updated."""
+        full = [pk for pk, (reason, fields) in pending.items() if fields is None]
+        partial = {pk: fields for pk, (reason, fields) in pending.items() if fields}
+        # fetch current records; anything deleted since it
+        # was queued is skipped
+        if full:
+            model.index_items(model.objects.filter(pk__in=full))
+        if partial:
+            objects = model.prep_index_chunk(
+                list(model.objects.filter(pk__in=list(partial)))
+            )
+            ModelIndexable._init_solr()
+            ModelIndexable.solr.update.index(
+                [
+                    obj.partial_index_data(sorted(partial[obj.pk]))
+                    if obj.partial_index_ok()
+                    else obj.index_data()
+                    for obj in objects
+                ]
+            )
+            self.totals.update(partial=len(objects))
+
+
+class ReindexCoalescerMiddleware:
+    """Middleware to coalesce Solr reindexing triggered by signals
+    over the course of a single request; see :class:`ReindexCoalescer`."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with ReindexCoalescer():
+            return self.get_response(request)
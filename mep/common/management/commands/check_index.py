@@ -0,0 +1,193 @@
+"""
+Manage command to check that the Solr index is consistent with the
+database, and repair only the documents that differ.
+
+For each indexable model, the id, last modified date, and content hash of
+every indexed document are retrieved from Solr using cursor-based
+paging, and compared with a hash of the current index data generated
+from the database in bulk. Reports documents that are missing from Solr,
+stale (content has changed since indexing, or was partially updated), or
+orphaned (indexed but no longer in the database or no longer indexable).
+Missing and stale documents are reindexed and orphaned documents are
+deleted, unless ``--dry-run`` is specified.
+
+Intended to be run regularly (e.g. nightly from cron) instead of a full
+reindex.
+
+Example usage::
+
+    python manage.py check_index
+    python manage.py check_index -i person --dry-run -v 2
+
+"""
+
+import itertools
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import QuerySet
+from parasolr.django import SolrClient
+from parasolr.indexing import Indexable
+
+from mep.common.indexing import CONTENT_HASH_FIELD, SurrogateKeys
+
+
+class Command(BaseCommand):
+    """Check and repair Solr index consistency"""
+
+    help = __doc__
+
+    #: default verbosity
+    v_normal = 1
+
+    def add_arguments(self, parser):
+        self.indexables = {
+            model.index_item_type(): model for model in Indexable.all_indexables()
+        }
+        parser.add_argument(
+            "-i",
+            "--index",
+            choices=["all"] + list(self.indexables.keys()),
+            default="all",
+            help="Check all items or one content type (by default checks all)",
+        )
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of documents to retrieve or index at once "
+            + "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report differences without updating the index",
+        )
+
+    def handle(self, *args, **kwargs):
+        self.verbosity = kwargs.get("verbosity", self.v_normal)
+        self.solr = SolrClient()
+        batch_size = kwargs["batch_size"]
+        try:
+            for name, model in self.indexables.items():
+                if kwargs["index"] not in [name, "all"]:
+                    continue
+                indexed = self.indexed_documents(model, batch_size)
+                missing, stale, orphaned, docs = self.compare(
+                    model, indexed, batch_size
+                )
+                self.report(name, missing, stale, orphaned, indexed)
+                if not kwargs["dry_run"]:
+                    self.repair(model, docs, orphaned, batch_size)
+        except requests.exceptions.ConnectionError as err:
+            # bail out if we error connecting to Solr
+            raise CommandError(err)
+
+    def indexed_documents(self, model, batch_size):
+        """Retrieve id, last modified date, and content hash for all
+        documents of the specified model indexed in Solr, using
+        cursorMark to page through results. Returns a dictionary of
+        last modified and hash keyed on id."""
+        documents = {}
+        cursor = "*"
+        while True:
+            response = self.solr.query(
+                wrap=False,
+                q="*:*",
+                # match by id to include documents indexed with id only
+                fq="id:%s.*" % model.index_item_type(),
+                fl="id,last_modified,%s" % CONTENT_HASH_FIELD,
+                sort="id asc",
+                rows=batch_size,
+                cursorMark=cursor,
+            )
+            if response is None:
+                raise CommandError("Error querying Solr")
+            for doc in response.response.docs:
+                documents[doc["id"]] = (
+                    doc.get("last_modified"),
+                    doc.get(CONTENT_HASH_FIELD),
+                )
+            # cursor is unchanged when all results have been retrieved
+            if response.nextCursorMark == cursor:
+                break
+            cursor = response.nextCursorMark
+        return documents
+
+    def current_data(self, model, batch_size):
+        """Generator of current index data for all items of the specified
+        model to be indexed, calculated in chunks from the database."""
+        items = model.items_to_index()
+        if isinstance(items, QuerySet):
+            items = items.iterator(chunk_size=batch_size)
+        else:
+            items = iter(items)
+        chunk = list(itertools.islice(items, batch_size))
+        while chunk:
+            for item in model.prep_index_chunk(chunk):
+                yield item.index_data()
+            chunk = list(itertools.islice(items, batch_size))
+
+    def compare(self, model, indexed, batch_size):
+        """Compare current index data with indexed documents. Returns
+        lists of missing, stale, and orphaned ids, and the index data
+        for documents that need to be reindexed."""
+        missing = []
+        stale = []
+        docs = []
+        seen = set()
+        for data in self.current_data(model, batch_size):
+            doc_id = data["id"]
+            # a joined items queryset may include items more than once
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            if doc_id not in indexed:
+                missing.append(doc_id)
+            elif indexed[doc_id][1] != data[CONTENT_HASH_FIELD]:
+                stale.append(doc_id)
+            else:
+                continue
+            docs.append(data)
+
+        orphaned = [doc_id for doc_id in indexed if doc_id not in seen]
+        return missing, stale, orphaned, docs
+
+    def report(self, name, missing, stale, orphaned, indexed):
+        """Report the number of missing, stale, and orphaned documents
+        for a model; list them at higher verbosity."""
+        if self.verbosity >= self.v_normal:
+            self.stdout.write(
+                "%s: %d missing, %d stale, %d orphaned"
+                % (name, len(missing), len(stale), len(orphaned))
+            )
+        if self.verbosity > self.v_normal:
+            for label, ids in [
+                ("missing", missing),
+                ("stale", stale),
+                ("orphaned", orphaned),
+            ]:
+                for doc_id in ids:
+                    last_modified = indexed.get(doc_id, (None,))[0]
+                    self.stdout.write(
+                        "  %s %s%s"
+                        % (
+                            label,
+                            doc_id,
+                            " (indexed %s)" % last_modified if last_modified else "",
+                        )
+                    )
+
+    def repair(self, model, docs, orphaned, batch_size):
+        """Reindex missing and stale documents and delete orphaned ones;
+        purges cached responses that include them."""
+        for i in range(0, len(docs), batch_size):
+            self.solr.update.index(docs[i : i + batch_size])
+        if orphaned:
+            self.solr.update.delete_by_id(orphaned)
+        if docs or orphaned:
+            # index ids are item type and primary key, e.g. person.12
+            pks = [doc_id.split(".", 1)[-1] for doc_id in orphaned]
+            pks.extend(doc["id"].split(".", 1)[-1] for doc in docs)
+            SurrogateKeys.purge_items(model, pks)
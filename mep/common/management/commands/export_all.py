@@ -0,0 +1,169 @@
+"""
+Manage command to export all datasets in a single run.
+
+Runs the member, creator, book, event, and address exports with shared
+lookups, so that people, absolute URLs, and event dates used by more than
+one export are only loaded once. Generates CSV and JSON files for each
+dataset and a `datapackage.json` describing them, with checksums and field
+statistics, and reports time and number of database queries for each dataset.
+
+"""
+
+import json
+import os.path
+import time
+
+from django.core.management import get_commands, load_command_class
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from mep.common.management.export import ExportCache
+from mep.people.models import Person
+
+
+class QueryCounter:
+    """Database execute wrapper to count queries."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    """Export all datasets."""
+
+    help = __doc__
+
+    #: default verbosity
+    v_normal = 1
+
+    #: export commands to run, in order; members are exported before
+    #: creators so that shared people are loaded with member prefetching
+    exports = [
+        "export_members",
+        "export_creators",
+        "export_books",
+        "export_events",
+        "export_addresses",
+    ]
+
+    #: models whose instances are shared across exports
+    shared_models = [Person]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-d",
+            "--directory",
+            help="Specify the directory where files should be generated. "
+            "The directory will be created if it does not already exist.",
+        )
+        parser.add_argument(
+            "-m",
+            "--max",
+            type=int,
+            help="Maximum number of objects to export (for testing)",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            help="Number of processes to use for generating export data",
+        )
+        parser.add_argument(
+            "--parquet",
+            action="store_true",
+            help="Write Parquet files instead of CSV and JSON",
+        )
+        parser.add_argument(
+            "--datapackage",
+            help="Existing datapackage.json to use for dataset titles and "
+            + "field descriptions",
+        )
+
+    def handle(self, *args, **kwargs):
+        """Run all exports and write a datapackage file."""
+        self.verbosity = kwargs.get("verbosity", self.v_normal)
+        output_dir = kwargs.get("directory") or ""
+        cache = ExportCache(shared_models=self.shared_models)
+        commands = get_commands()
+        resources = []
+        start = time.perf_counter()
+
+        for name in self.exports:
+            export = load_command_class(commands[name], name)
+            export.stdout = self.stdout
+            export.stderr = self.stderr
+            export.cache = cache
+            # use command parser defaults for options not set here
+            options = vars(export.create_parser("manage.py", name).parse_args([]))
+            options.update(
+                {
+                    "directory": kwargs.get("directory"),
+                    "max": kwargs.get("max"),
+                    "workers": kwargs.get("workers"),
+                    "parquet": kwargs.get("parquet"),
+                    "verbosity": self.verbosity,
+                }
+            )
+
+            counter = QueryCounter()
+            export_start = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                export.handle(**options)
+            if self.verbosity >= self.v_normal:
+                self.stdout.write(
+                    "%s: %d records in %.2fs; %d queries"
+                    % (
+                        export.get_base_filename(),
+                        export.total,
+                        time.perf_counter() - export_start,
+                        counter.count,
+                    )
+                )
+            resources.append(export)
+
+        self.write_datapackage(resources, output_dir, kwargs.get("datapackage"))
+        if self.verbosity >= self.v_normal:
+            self.stdout.write("Total time: %.2fs" % (time.perf_counter() - start))
+
+    def write_datapackage(self, exports, output_dir, template=None):
+        """Write a datapackage.json for the exported CSV or Parquet files,
+        with checksums and statistics calculated during export, using
+        titles, descriptions, and field information from an existing
+        datapackage when specified."""
+        datapackage = {"profile": "tabular-data-package", "resources": []}
+        template_resources = {}
+        if template:
+            with open(template) as templatefile:
+                datapackage.update(json.load(templatefile))
+            template_resources = {
+                resource["name"]: resource
+                for resource in datapackage.get("resources", [])
+            }
+
+        datapackage["resources"] = []
+        for export in exports:
+            # only tabular resources (i.e., not JSON) for tabular data package
+            for export_resource in export.resources:
+                if "schema" not in export_resource:
+                    continue
+                resource = template_resources.get(export_resource["name"], {}).copy()
+                # existing field details, if any, by name
+                fields = {
+                    field["name"]: field
+                    for field in resource.get("schema", {}).get("fields", [])
+                }
+                resource.update(export_resource)
+                resource["schema"] = {
+                    "fields": [
+                        dict(fields.get(field["name"], {}), **field)
+                        for field in export_resource["schema"]["fields"]
+                    ]
+                }
+                datapackage["resources"].append(resource)
+
+        with open(os.path.join(output_dir, "datapackage.json"), "w") as outfile:
+            json.dump(datapackage, outfile, indent=2)
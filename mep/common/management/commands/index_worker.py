@@ -0,0 +1,179 @@
+"""
+Manage command to process the database indexing queue.
+
+When **SOLR_INDEX_QUEUE** is enabled in settings, records that need to be
+reindexed because related records changed are added to a database queue
+instead of being indexed during the request. This command indexes queued
+records in batches, with a configurable batch size and Solr commitWithin.
+If indexing fails (e.g. Solr is unavailable), items are retried with
+exponential backoff.
+
+Run continuously as a service, or with ``--once`` to process everything
+that is ready and exit (e.g. from cron). Only one worker should be run at
+a time.
+
+Example usage::
+
+    python manage.py index_worker
+    python manage.py index_worker --batch-size 1000 --commit-within 10000
+    python manage.py index_worker --once
+
+"""
+
+import datetime
+import operator
+import time
+from collections import defaultdict
+from functools import reduce
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from parasolr.django.indexing import ModelIndexable
+
+from mep.common.indexing import SurrogateKeys
+from mep.common.models import IndexQueueItem
+
+
+class Command(BaseCommand):
+    """Index records queued for reindexing"""
+
+    help = __doc__
+
+    #: default verbosity
+    v_normal = 1
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of queued records to index at once (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-c",
+            "--commit-within",
+            type=int,
+            default=5000,
+            help="Solr commitWithin for indexed records, in milliseconds "
+            + "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "-i",
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait before checking an empty queue again "
+            + "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "--backoff",
+            type=float,
+            default=10,
+            help="Seconds to wait before retrying after a failure; doubled "
+            + "for each failed attempt (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--max-backoff",
+            type=float,
+            default=600,
+            help="Maximum seconds to wait before retrying (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process all records that are ready and exit",
+        )
+
+    def handle(self, *args, **kwargs):
+        self.verbosity = kwargs.get("verbosity", self.v_normal)
+        self.backoff = kwargs["backoff"]
+        self.max_backoff = kwargs["max_backoff"]
+        total = 0
+        try:
+            while True:
+                indexed, failed = self.process_batch(
+                    kwargs["batch_size"], kwargs["commit_within"]
+                )
+                total += indexed
+                if failed:
+                    # wait before trying again; failed items are
+                    # not ready until their backoff expires
+                    if kwargs["once"]:
+                        break
+                    time.sleep(min(self.backoff, self.max_backoff))
+                elif not indexed:
+                    if kwargs["once"]:
+                        break
+                    time.sleep(kwargs["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        if self.verbosity >= self.v_normal:
+            self.stdout.write(
+                "Indexed %d record%s" % (total, "" if total == 1 else "s")
+            )
+
+    def process_batch(self, batch_size, commit_within):
+        """Index a batch of queued records that are ready. Returns a tuple
+        of the number of queue items processed and the number that failed."""
+        items = list(IndexQueueItem.ready().select_related("content_type")[:batch_size])
+        if not items:
+            return (0, 0)
+
+        by_type = defaultdict(list)
+        for item in items:
+            by_type[item.content_type].append(item)
+
+        # make sure solr client is initialized
+        ModelIndexable._init_solr()
+        processed = failed = 0
+        for content_type, type_items in by_type.items():
+            model = content_type.model_class()
+            try:
+                # records deleted since they were queued are skipped
+                objects = list(
+                    model.objects.filter(pk__in=[item.object_id for item in type_items])
+                )
+                objects = model.prep_index_chunk(objects)
+                if objects:
+                    ModelIndexable.solr.update.index(
+                        [obj.index_data() for obj in objects],
+                        commitWithin=commit_within,
+                    )
+            except Exception as err:
+                self.retry_later(type_items, err)
+                failed += len(type_items)
+                continue
+
+            # remove indexed items, unless they were queued again
+            # after this batch was loaded
+            IndexQueueItem.objects.filter(
+                reduce(
+                    operator.or_,
+                    [Q(pk=item.pk, queued=item.queued) for item in type_items],
+                )
+            ).delete()
+            SurrogateKeys.purge_items(model, [item.object_id for item in type_items])
+            processed += len(type_items)
+            if self.verbosity > self.v_normal:
+                self.stdout.write(
+                    "Indexed %d %s" % (len(objects), model._meta.verbose_name_plural)
+                )
+
+        return (processed, failed)
+
+    def retry_later(self, items, err):
+        """Record a failed indexing attempt and schedule the items to be
+        tried again with exponential backoff."""
+        self.stderr.write("Error indexing %d records: %s" % (len(items), err))
+        now = timezone.now()
+        for item in items:
+            item.attempts += 1
+            delay = min(self.backoff * 2 ** (item.attempts - 1), self.max_backoff)
+            item.next_attempt = now + datetime.timedelta(seconds=delay)
+            item.last_error = str(err)
+        IndexQueueItem.objects.bulk_update(
+            items, ["attempts", "next_attempt", "last_error"]
+        )
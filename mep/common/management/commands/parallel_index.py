@@ -0,0 +1,336 @@
+"""
+Manage command to rebuild the Solr index using multiple processes.
+
+Each indexable model's :meth:`items_to_index` is split into shards by
+primary key range, and shards are indexed in a pool of worker processes.
+Each worker uses its own database connection and Solr session and posts
+documents in batches; changes are committed once, after all shards have
+been indexed. Reports throughput for each model and the documents that
+were slowest to generate.
+
+With ``--rebuild``, the live index is left untouched while everything is
+indexed into a new Solr core created from the configured configset
+(deployed from ``solr_conf/conf``). After document counts for each model
+are validated against the database, the new core is atomically swapped
+with the live core, and the previous index is kept under the new core's
+name so the swap can be reverted with ``--rollback``. Changes indexed in
+the live core while a rebuild is running are not carried over.
+
+Example usage::
+
+    python manage.py parallel_index
+    python manage.py parallel_index -i person --workers 4 --batch-size 1000
+    python manage.py parallel_index --shards 16 --slowest 20
+    python manage.py parallel_index --rebuild
+    python manage.py parallel_index --rollback shxco_20240101120000
+
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.template.defaultfilters import pluralize
+from django.utils import timezone
+from parasolr.django import SolrClient
+from parasolr.indexing import Indexable
+from parasolr.solr import client
+
+from mep.common.indexing import SurrogateKeys
+
+
+#: solr client for the current worker process
+_worker_solr = None
+
+
+def get_solr(collection=None):
+    """Initialize a client for the configured Solr, optionally
+    connecting to a different collection or core."""
+    if collection is None:
+        return SolrClient()
+    return client.SolrClient(settings.SOLR_CONNECTIONS["default"]["URL"], collection)
+
+
+def _init_index_worker(collection=None):
+    """Initialize a worker process for a parallel reindex with its own
+    Solr session, reused for every batch the worker indexes."""
+    global _worker_solr
+    _worker_solr = get_solr(collection)
+    # documents are committed once, when the full reindex is complete
+    _worker_solr.update.params.pop("commitWithin", None)
+
+
+def _index_shard(model, start, end, batch_size, slowest):
+    """Index items for a model with primary keys in the specified range
+    (inclusive). Returns a tuple of model, number of items indexed,
+    seconds elapsed, and a list of seconds and index id for the slowest
+    documents to generate."""
+    begin = time.perf_counter()
+    items = (
+        model.items_to_index()
+        .filter(pk__gte=start, pk__lte=end)
+        .order_by("pk")
+        .iterator(chunk_size=batch_size)
+    )
+    count = 0
+    timings = []
+    chunk = list(itertools.islice(items, batch_size))
+    while chunk:
+        chunk = model.prep_index_chunk(chunk)
+        docs = []
+        for item in chunk:
+            doc_start = time.perf_counter()
+            docs.append(item.index_data())
+            doc_time = time.perf_counter() - doc_start
+            # keep only the slowest documents
+            if len(timings) < slowest:
+                heapq.heappush(timings, (doc_time, docs[-1]["id"]))
+            elif slowest:
+                heapq.heappushpop(timings, (doc_time, docs[-1]["id"]))
+        _worker_solr.update.index(docs)
+        count += len(docs)
+        chunk = list(itertools.islice(items, batch_size))
+    return (model, count, time.perf_counter() - begin, timings)
+
+
+class Command(BaseCommand):
+    """Reindex content in Solr in parallel"""
+
+    help = __doc__
+
+    #: default verbosity
+    v_normal = 1
+
+    def add_arguments(self, parser):
+        self.indexables = {
+            model.index_item_type(): model for model in Indexable.all_indexables()
+        }
+        parser.add_argument(
+            "-i",
+            "--index",
+            choices=["all"] + list(self.indexables.keys()),
+            default="all",
+            help="Index all items or one content type (by default indexes all)",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-s",
+            "--shards",
+            type=int,
+            help="Number of primary key ranges to split each model into "
+            + "(default: four per worker)",
+        )
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of documents to send to Solr at once "
+            + "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "--slowest",
+            type=int,
+            default=10,
+            help="Number of slowest documents to report (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Index into a new core and swap it with the live core "
+            + "when complete",
+        )
+        parser.add_argument(
+            "--rollback",
+            metavar="CORE",
+            help="Swap the live core with a previous index kept by --rebuild",
+        )
+
+    def handle(self, *args, **kwargs):
+        self.verbosity = kwargs.get("verbosity", self.v_normal)
+        self.live_core = settings.SOLR_CONNECTIONS["default"]["COLLECTION"]
+        self.collection = None
+        if kwargs["rollback"]:
+            self.swap_cores(kwargs["rollback"])
+            return
+        if kwargs["rebuild"]:
+            if kwargs["index"] != "all":
+                raise CommandError("Rebuild requires indexing all content")
+            self.collection = self.create_core()
+
+        workers = max(kwargs["workers"] or 1, 1)
+        shards = kwargs["shards"] or workers * 4
+        models = [
+            model
+            for name, model in self.indexables.items()
+            if kwargs["index"] in [name, "all"]
+        ]
+
+        tasks = []
+        for model in models:
+            for start, end in self.shard_ranges(model, shards):
+                tasks.append(
+                    (model, start, end, kwargs["batch_size"], kwargs["slowest"])
+                )
+
+        start_time = time.perf_counter()
+        # prepare data shared by items in different shards once, before
+        # indexing shards in parallel
+        for model in models:
+            if hasattr(model, "prep_index"):
+                model.prep_index()
+        try:
+            results = self.run_tasks(tasks, workers)
+            # commit all the indexed changes at once
+            get_solr(self.collection).update.index([], commit=True)
+        except requests.exceptions.ConnectionError as err:
+            # bail out if we error connecting to Solr
+            raise CommandError(err)
+        elapsed = time.perf_counter() - start_time
+
+        if self.verbosity >= self.v_normal:
+            self.report(results, kwargs["slowest"])
+            total = sum(count for model, count, seconds, timings in results)
+            self.stdout.write(
+                "Indexed {:,} item{} in {:.2f}s ({:.1f} docs/sec)".format(
+                    total, pluralize(total), elapsed, total / elapsed if elapsed else 0
+                )
+            )
+
+        if self.collection:
+            self.validate_counts(models)
+            self.swap_cores(self.collection)
+        else:
+            SurrogateKeys.purge([SurrogateKeys.all])
+
+    def create_core(self):
+        """Create a new, empty Solr core for a rebuild, using the same
+        configset as the live core. Returns the name of the new core."""
+        name = "%s_%s" % (self.live_core, timezone.now().strftime("%Y%m%d%H%M%S"))
+        solr = get_solr()
+        try:
+            if solr.core_admin.ping(name):
+                raise CommandError("Solr core %s already exists" % name)
+            solr.core_admin.create(
+                name, configSet=settings.SOLR_CONNECTIONS["default"]["CONFIGSET"]
+            )
+        except requests.exceptions.ConnectionError as err:
+            raise CommandError(err)
+        if not solr.core_admin.ping(name):
+            raise CommandError("Error creating Solr core %s" % name)
+        if self.verbosity >= self.v_normal:
+            self.stdout.write("Indexing into new core %s" % name)
+        return name
+
+    def validate_counts(self, models):
+        """Check that the number of documents indexed in the new core
+        for each model matches the number of items to index in the
+        database; if not, the live core is left unchanged."""
+        solr = get_solr(self.collection)
+        for model in models:
+            item_type = model.index_item_type()
+            expected = model.items_to_index().order_by().values("pk").distinct().count()
+            response = solr.query(q="*:*", fq="item_type:%s" % item_type, rows=0)
+            indexed = response.numFound if response else 0
+            if indexed != expected:
+                raise CommandError(
+                    "Expected %d %s documents in %s but found %d; "
+                    % (expected, item_type, self.collection, indexed)
+                    + "live core %s was not changed" % self.live_core
+                )
+
+    def swap_cores(self, core):
+        """Atomically swap the specified core with the live core, so that
+        it serves the live index and the previous index is kept under the
+        other name."""
+        solr = get_solr()
+        response = solr.core_admin.make_request(
+            "get",
+            solr.core_admin.url,
+            params={"action": "SWAP", "core": self.live_core, "other": core},
+        )
+        if response is None:
+            raise CommandError(
+                "Error swapping Solr cores %s and %s" % (core, self.live_core)
+            )
+        SurrogateKeys.purge([SurrogateKeys.all])
+        if self.verbosity >= self.v_normal:
+            self.stdout.write(
+                "Swapped %s into %s; previous index is now %s"
+                % (core, self.live_core, core)
+            )
+
+    @staticmethod
+    def shard_ranges(model, shards):
+        """Split a model's items to index into the specified number of
+        primary key ranges with roughly the same number of items. Returns
+        a list of tuples with the first and last primary key in each range."""
+        pks = sorted(set(model.items_to_index().values_list("pk", flat=True)))
+        if not pks:
+            return []
+        size = -(-len(pks) // shards)  # ceiling division
+        return [
+            (pks[i], pks[min(i + size, len(pks)) - 1]) for i in range(0, len(pks), size)
+        ]
+
+    def run_tasks(self, tasks, workers):
+        """Index all shards, in a pool of worker processes if more than one
+        worker is requested. Returns a list of results for each shard."""
+        if workers == 1:
+            _init_index_worker(self.collection)
+            return [_index_shard(*task) for task in tasks]
+
+        # close database connections before forking so that each worker
+        # process opens its own connection
+        connections.close_all()
+        results = []
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_index_worker,
+            initargs=(self.collection,),
+        ) as executor:
+            futures = [executor.submit(_index_shard, *task) for task in tasks]
+            for future in as_completed(futures):
+                results.append(future.result())
+        return results
+
+    def report(self, results, slowest):
+        """Report documents per second for each model, based on the
+        total time worker processes spent indexing it, and the slowest
+        documents to generate."""
+        totals = defaultdict(lambda: [0, 0])
+        timings = []
+        for model, count, seconds, shard_timings in results:
+            totals[model][0] += count
+            totals[model][1] += seconds
+            timings.extend(shard_timings)
+
+        for model, (count, seconds) in totals.items():
+            self.stdout.write(
+                "{}: {:,} item{} in {:.2f}s of worker time ({:.1f} docs/sec)".format(
+                    model.index_item_type(),
+                    count,
+                    pluralize(count),
+                    seconds,
+                    count / seconds if seconds else 0,
+                )
+            )
+        if slowest and timings:
+            self.stdout.write("Slowest documents:")
+            for doc_time, index_id in heapq.nlargest(slowest, timings):
+                self.stdout.write("  %s: %.3fs" % (index_id, doc_time))
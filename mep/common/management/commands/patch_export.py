@@ -0,0 +1,117 @@
+"""
+Manage command to patch a previous dataset export into a new one.
+
+Uses the delta CSV and JSON files and manifests generated by running
+an export command with ``--since`` and a previous export directory, and
+writes full CSV and JSON files matching the new export.
+
+"""
+
+import codecs
+import csv
+import glob
+import json
+import os.path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mep.common.management.export import apply_delta
+
+
+class Command(BaseCommand):
+    """Patch a previous export with delta files."""
+
+    help = __doc__
+
+    #: default verbosity
+    v_normal = 1
+
+    #: suffix for delta manifest files
+    manifest_suffix = "_manifest.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument("previous", help="Directory with the previous export")
+        parser.add_argument(
+            "delta", help="Directory with delta files and manifests to apply"
+        )
+        parser.add_argument(
+            "-d",
+            "--directory",
+            help="Specify the directory where patched files should be generated. "
+            "The directory will be created if it does not already exist.",
+        )
+
+    def handle(self, *args, **kwargs):
+        """Patch each export with a manifest in the delta directory."""
+        self.verbosity = kwargs.get("verbosity", self.v_normal)
+        output_dir = kwargs.get("directory") or "."
+        os.makedirs(output_dir, exist_ok=True)
+
+        manifests = sorted(
+            glob.glob(os.path.join(kwargs["delta"], "*%s" % self.manifest_suffix))
+        )
+        if not manifests:
+            raise CommandError("No delta manifests found in %s" % kwargs["delta"])
+
+        for manifest_file in manifests:
+            base_filename = os.path.basename(manifest_file)[
+                : -len(self.manifest_suffix)
+            ]
+            with open(manifest_file) as manifestfile:
+                manifest = json.load(manifestfile)
+            # manifests for timestamp-based exports can't be used to patch
+            if "ops" not in manifest:
+                raise CommandError(
+                    "%s was not generated from a previous export" % manifest_file
+                )
+
+            self.patch_json(base_filename, manifest, kwargs["previous"], **kwargs)
+            self.patch_csv(base_filename, manifest, kwargs["previous"], **kwargs)
+            if self.verbosity >= self.v_normal:
+                self.stdout.write(
+                    "Patched %s: %d records" % (base_filename, manifest["total"])
+                )
+
+    def patch_json(self, base_filename, manifest, previous_dir, **kwargs):
+        """Patch the previous JSON export and write it to the output directory."""
+        with open(os.path.join(previous_dir, "%s.json" % base_filename)) as prevfile:
+            previous = json.load(prevfile)
+        with open(
+            os.path.join(kwargs["delta"], "%s_delta.json" % base_filename)
+        ) as deltafile:
+            delta = json.load(deltafile)
+
+        records = list(apply_delta(previous, delta, manifest["ops"]))
+        output_dir = kwargs.get("directory") or "."
+        with open(os.path.join(output_dir, "%s.json" % base_filename), "w") as outfile:
+            json.dump(records, outfile, indent=2)
+
+    def patch_csv(self, base_filename, manifest, previous_dir, **kwargs):
+        """Patch the previous CSV export and write it to the output directory."""
+        # read with utf-8-sig to skip the byte order mark
+        with open(
+            os.path.join(previous_dir, "%s.csv" % base_filename),
+            encoding="utf-8-sig",
+            newline="",
+        ) as prevfile:
+            reader = csv.reader(prevfile)
+            header = next(reader)
+            previous = list(reader)
+
+        output_dir = kwargs.get("directory") or "."
+        with (
+            open(
+                os.path.join(kwargs["delta"], "%s_delta.csv" % base_filename),
+                encoding="utf-8-sig",
+                newline="",
+            ) as deltafile,
+            open(os.path.join(output_dir, "%s.csv" % base_filename), "w") as outfile,
+        ):
+            delta = csv.reader(deltafile)
+            # skip delta header
+            next(delta)
+            # write utf-8 byte order mark, header, and patched rows
+            outfile.write(codecs.BOM_UTF8.decode())
+            csvwriter = csv.writer(outfile)
+            csvwriter.writerow(header)
+            csvwriter.writerows(apply_delta(previous, delta, manifest["ops"]))
@@ -5,14 +5,29 @@ Common logic to export models.
 
 import codecs
 import csv
+import hashlib
 import json
+import multiprocessing
 import os.path
-from itertools import chain
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain, islice
 
-
-from django.core.management.base import BaseCommand, ImproperlyConfigured
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError, ImproperlyConfigured
+from django.db import connections
+from django.db.models.query import QuerySet
 import progressbar
 
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from mep.common.utils import absolutize_url
+
 
 class ExportEncoder(json.JSONEncoder):
     """Extend :class`json.JsonEncoder`  so that generator content
@@ -20,12 +35,19 @@ class ExportEncoder(json.JSONEncoder):
     at the same time.
 
     :param csvwriter: instance of `class:csv.DictWriter` for CSV ouptut
+    :param flatten: optional callable to convert each item into a CSV row;
+        defaults to :meth:`BaseExport.flatten_dict`. Use with
+        :class:`FlattenSchema` and a `class:csv.writer`.
+    :param stats: optional :class:`ExportStats` to update with each CSV row;
+        requires rows as sequences (e.g. from :class:`FlattenSchema`)
     :param progress: instance of `class:rich.progress.Progress` for tracking
         progress of the data used for JSON outupt
     """
 
-    def __init__(self, csvwriter, *args, **kwargs):
+    def __init__(self, csvwriter, *args, flatten=None, stats=None, **kwargs):
         self.csvwriter = csvwriter
+        self.flatten = flatten or BaseExport.flatten_dict
+        self.stats = stats
         super().__init__(*args, **kwargs)
 
     def iterencode(self, data):
@@ -40,7 +62,10 @@ class ExportEncoder(json.JSONEncoder):
         """Generator: output each item in the data as CSV, then yield"""
         for element in data:
             # export to csv
-            self.csvwriter.writerow(BaseExport.flatten_dict(element))
+            row = self.flatten(element)
+            self.csvwriter.writerow(row)
+            if self.stats is not None:
+                self.stats.update(row)
             yield element
 
 
@@ -66,6 +91,36 @@ class BaseExport(BaseCommand):
     #: fields for CSV output, should be list of str
     csv_fields = None
 
+    #: number of objects to load (with prefetches) at a time when streaming
+    #: a queryset for export
+    chunk_size = 1000
+
+    #: number of worker processes for generating export data
+    workers = 1
+
+    #: field used to identify records when comparing with a previous
+    #: export; records are compared by content only when not in csv fields
+    delta_key = "id"
+
+    #: :class:`ExportCache` for data used by many exported records;
+    #: initialized when export data is generated, or may be set to share
+    #: lookups across multiple exports
+    cache = None
+
+    #: write a Parquet file instead of CSV and JSON
+    parquet = False
+
+    #: column types for Parquet output, keyed on CSV field name; see
+    #: :class:`ColumnarWriter`. Fields not listed are written as strings.
+    column_types = {}
+
+    #: number of rows per Parquet row group
+    row_group_size = 10000
+
+    #: datapackage resource descriptors for the files written by the
+    #: last export, with checksums, sizes, and field statistics
+    resources = None
+
     def add_arguments(self, parser):
         parser.add_argument(
             "-d",
@@ -79,10 +134,41 @@ class BaseExport(BaseCommand):
             type=int,
             help="Maximum number of objects to export (for testing)",
         )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=self.chunk_size,
+            help="Number of objects to load into memory at once "
+            + "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=self.workers,
+            help="Number of processes to use for generating export data "
+            + "(default: %(default)s)",
+        )
+        parser.add_argument(
+            "--since",
+            help="Only export records added, changed, or removed since a "
+            + "previous export (directory); generates delta files and a manifest",
+        )
+        parser.add_argument(
+            "--parquet",
+            action="store_true",
+            help="Write a Parquet file with typed columns instead of CSV "
+            + "and JSON (requires pyarrow)",
+        )
 
     def handle(self, *args, **kwargs):
         """Export all model data into a CSV file and JSON file."""
         self.verbosity = kwargs.get("verbosity", self.v_normal)
+        self.chunk_size = kwargs.get("chunk_size") or self.chunk_size
+        self.workers = kwargs.get("workers") or self.workers
+        self.parquet = kwargs.get("parquet") or self.parquet
+        if self.parquet and pyarrow is None:
+            raise CommandError("Parquet output requires pyarrow")
         # check that CSV export fields are defined before running
         if self.csv_fields is None:
             raise ImproperlyConfigured(
@@ -90,6 +176,10 @@ class BaseExport(BaseCommand):
                 "csv_fields list property." % {"cls": self.__class__.__name__}
             )
 
+        since = kwargs.get("since")
+        if since and not os.path.isdir(since):
+            raise CommandError("--since must be a previous export directory")
+
         # define the output file
         base_filename = self.get_base_filename()
         if kwargs["directory"]:
@@ -97,26 +187,175 @@ class BaseExport(BaseCommand):
 
         # get stream array / generator of data for export
         data = self.get_data(kwargs.get("max"))
+        self.total = data.total
         if self.verbosity >= self.v_normal:
-            self.stdout.write("Exporting JSON and CSV")
+            self.stdout.write(
+                "Exporting Parquet" if self.parquet else "Exporting JSON and CSV"
+            )
         # ensure directory exists (useful to allow command line user to specify dated dir)
         base_dir = os.path.dirname(base_filename)
         if base_dir:
             os.makedirs(os.path.dirname(base_filename), exist_ok=True)
 
+        if since:
+            self.export_delta(base_filename, data, since)
+        else:
+            self.write_files(base_filename, data)
+
+    def write_files(self, base_filename, data):
+        """Write data to CSV and JSON files with the specified base filename,
+        or to a Parquet file if :attr:`parquet` is set. Checksums, sizes,
+        and field statistics are calculated as the files are written and
+        saved to a datapackage file; see :meth:`write_datapackage`."""
+        name = os.path.basename(base_filename)
+        stats = ExportStats(self.csv_fields)
+        if self.parquet:
+            with HashedFile(
+                open("{}.parquet".format(base_filename), "wb")
+            ) as parquetfile:
+                with ColumnarWriter(
+                    parquetfile,
+                    self.csv_fields,
+                    self.column_types,
+                    self.row_group_size,
+                    stats=stats,
+                ) as writer:
+                    for element in data:
+                        writer.writerow(element)
+            self.resources = [
+                dict(
+                    self.resource_info(name, "parquet", parquetfile, stats),
+                    profile="tabular-data-resource",
+                    mediatype="application/vnd.apache.parquet",
+                    schema={"fields": stats.fields()},
+                )
+            ]
+            self.write_datapackage(base_filename)
+            return
+
         # open and initialize CSV file
-        with open("{}.csv".format(base_filename), "w") as csvfile:
+        with HashedFile(
+            open("{}.csv".format(base_filename), "w", encoding="utf-8")
+        ) as csvfile:
             # write utf-8 byte order mark at the beginning of the file
             csvfile.write(codecs.BOM_UTF8.decode())
-            csvwriter = csv.DictWriter(csvfile, fieldnames=self.csv_fields)
-            csvwriter.writeheader()
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(self.csv_fields)
 
             # iteratively export as CSV and JSON
-            with open("{}.json".format(base_filename), "w") as jsonfile:
-                exporter = ExportEncoder(indent=2, csvwriter=csvwriter)
+            with HashedFile(
+                open("{}.json".format(base_filename), "w", encoding="utf-8")
+            ) as jsonfile:
+                exporter = ExportEncoder(
+                    indent=2,
+                    csvwriter=csvwriter,
+                    flatten=FlattenSchema(self.csv_fields),
+                    stats=stats,
+                )
                 for chunk in exporter.iterencode(data):
                     jsonfile.write(chunk)
 
+        self.resources = [
+            dict(
+                self.resource_info(name, "csv", csvfile, stats),
+                profile="tabular-data-resource",
+                mediatype="text/csv",
+                encoding="utf-8",
+                schema={"fields": stats.fields()},
+            ),
+            dict(
+                self.resource_info(name, "json", jsonfile, stats),
+                name="%s_json" % name,
+                mediatype="application/json",
+                encoding="utf-8",
+            ),
+        ]
+        self.write_datapackage(base_filename)
+
+    def resource_info(self, name, extension, hashedfile, stats):
+        """Basic datapackage resource descriptor for an exported file."""
+        return {
+            "name": name,
+            "path": "%s.%s" % (name, extension),
+            "format": extension,
+            "bytes": hashedfile.bytes,
+            "hash": hashedfile.hash,
+            "rows": stats.rows,
+        }
+
+    def write_datapackage(self, base_filename):
+        """Write a datapackage file describing the files written for
+        this export, e.g. "members_datapackage.json"."""
+        with open("%s_datapackage.json" % base_filename, "w") as outfile:
+            json.dump(
+                {"profile": "data-package", "resources": self.resources},
+                outfile,
+                indent=2,
+            )
+
+    def export_delta(self, base_filename, data, since):
+        """
+        Export records that differ from a previous export in the `since`
+        directory to delta CSV and JSON files, and write a manifest describing
+        the changes, including the steps needed to patch the previous export
+        into the new one; see :func:`apply_delta`. The previous export is compared using its JSON
+        file, which is read incrementally.
+        """
+        key = self.delta_key if self.delta_key in self.csv_fields else None
+        previous_file = os.path.join(since, "%s.json" % os.path.basename(base_filename))
+        if not os.path.isfile(previous_file):
+            raise CommandError(
+                "Previous export file %s not found; --since requires a "
+                "directory with a JSON export" % previous_file
+            )
+        try:
+            with open(previous_file, encoding="utf-8") as prevfile:
+                delta = ExportDelta(iter_json_array(prevfile), key=key)
+        except ValueError as err:
+            raise CommandError(
+                "Error reading previous export file %s: %s" % (previous_file, err)
+            )
+
+        self.write_files(
+            "%s_delta" % base_filename,
+            StreamArray(delta.filter(data), data.total, progress=False),
+        )
+
+        manifest = delta.manifest()
+        manifest["since"] = os.path.basename(os.path.normpath(since))
+        if key:
+            manifest["deleted"] = [
+                self.deleted_info(record_id, manifest["added"])
+                for record_id in manifest["deleted"]
+            ]
+        with open("%s_manifest.json" % base_filename, "w") as manifestfile:
+            json.dump(manifest, manifestfile, indent=2)
+
+        if self.verbosity >= self.v_normal:
+            self.stdout.write(
+                "%d records added or changed, %d removed"
+                % (delta.inserted, delta.removed)
+            )
+
+    def deleted_info(self, record_id, added):
+        """Details for a record identifier that is no longer exported;
+        uses past slugs to determine if the record was renamed or merged."""
+        info = {"id": record_id, "status": "deleted"}
+        try:
+            self.model._meta.get_field("past_slugs")
+        except (AttributeError, FieldDoesNotExist):
+            return info
+        current = (
+            self.model._default_manager.filter(past_slugs__slug=record_id)
+            .values_list("slug", flat=True)
+            .first()
+        )
+        if current:
+            info["new_id"] = current
+            # renamed if the new slug is new in this export, otherwise merged
+            info["status"] = "renamed" if current in added else "merged"
+        return info
+
     def get_base_filename(self):
         """
         Base filename to use for export. Uses model's plural verbose name
@@ -152,14 +391,116 @@ class BaseExport(BaseCommand):
         Convert all models into an intermediary object form suitable for
         transforming into export formats.
         """
-        objects = self.get_queryset()
+        if self.cache is None:
+            self.cache = ExportCache()
+        queryset = self.get_queryset()
+        objects = queryset
         # grab the first N if maximum is specified
         if maximum:
             objects = objects[:maximum]
-        total = len(
-            objects
-        )  # fewer assumptions, allows other (multi model/class) objects
-        return StreamArray((self.get_object_data(obj) for obj in objects), total)
+
+        # fewer assumptions, allows other (multi model/class) objects
+        if not isinstance(objects, QuerySet):
+            return StreamArray(
+                (self.get_object_data(obj) for obj in objects), len(objects)
+            )
+
+        # generate object data in multiple processes, if requested
+        if self.workers > 1:
+            pks = list(objects.values_list("pk", flat=True))
+            return StreamArray(self.iter_parallel(pks), len(pks))
+
+        # for querysets, count in the database and load objects in chunks
+        # so that memory use does not depend on the size of the export
+        return StreamArray(
+            (
+                self.get_object_data(obj)
+                for obj in self.iter_chunks(
+                    queryset, objects.values_list("pk", flat=True)
+                )
+            ),
+            objects.count(),
+        )
+
+    def iter_chunks(self, queryset, pks):
+        """
+        Generator: yield objects from the queryset in the order of the
+        specified primary keys, loading and prefetching
+        :attr:`chunk_size` objects at a time.
+
+        :param queryset: queryset with any needed related and prefetch options
+        :param pks: ordered iterable of primary keys (e.g. values list
+            from the same queryset)
+        """
+        # stream primary keys with a server-side cursor where supported
+        if isinstance(pks, QuerySet):
+            pks = pks.iterator(chunk_size=self.chunk_size)
+        else:
+            pks = iter(pks)
+        # instances of some models may be shared with other exports
+        shared = self.cache.shared_instances(queryset.model)
+        while True:
+            chunk = list(islice(pks, self.chunk_size))
+            if not chunk:
+                break
+            if shared is None:
+                objects = {}
+                missing = chunk
+            else:
+                objects = shared
+                missing = [pk for pk in chunk if pk not in shared]
+            if missing:
+                # ordering is restored from the primary key list, so skip it here
+                objects.update(
+                    (obj.pk, obj) for obj in queryset.filter(pk__in=missing).order_by()
+                )
+            # a joined filter may return the same object more than once;
+            # yield once for every primary key to match the full queryset
+            for pk in chunk:
+                yield objects[pk]
+
+    def iter_parallel(self, pks):
+        """
+        Generator: split the ordered list of primary keys into chunks,
+        generate object data for each chunk in a pool of :attr:`workers`
+        processes, and yield the data in the original order.
+
+        :param pks: ordered list of primary keys to export
+        """
+        chunks = (
+            pks[i : i + self.chunk_size] for i in range(0, len(pks), self.chunk_size)
+        )
+        # close database connections before forking so that each worker
+        # process opens its own connection
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_export_worker,
+            initargs=(self,),
+        ) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_export_chunk, chunk))
+                # limit how many completed chunks are held in memory
+                if len(pending) >= self.workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def absolute_url(self, obj):
+        """Absolute URL for an object, via the export cache when set."""
+        if self.cache is None:
+            return absolutize_url(obj.get_absolute_url())
+        return self.cache.absolute_url(obj)
+
+    def event_dates(self, obj):
+        """Event dates for an account or work, via the export cache when
+        set; equivalent to
+        :attr:`~mep.accounts.event_set.EventSetMixin.event_dates`."""
+        if self.cache is None:
+            return obj.event_dates
+        return self.cache.event_dates(obj)
 
     def get_object_data(self, obj):
         """
@@ -212,6 +553,641 @@ class BaseExport(BaseCommand):
         return flat_data
 
 
+class FlattenSchema:
+    """
+    Compiled equivalent of :meth:`BaseExport.flatten_dict` for a fixed
+    list of CSV fields. Calling the schema with an export dict returns
+    a tuple of values in CSV field order, for use with `class:csv.writer`;
+    output matches `class:csv.DictWriter` with :meth:`BaseExport.flatten_dict`.
+
+    The first time a dictionary with a particular set of keys is seen,
+    the field name, row position, and handlers for each key are looked up
+    and stored as a plan, so the structure of each row does not need to
+    be worked out again for every item in the export.
+
+    :param fieldnames: list of CSV field names
+    """
+
+    def __init__(self, fieldnames):
+        self.fieldnames = list(fieldnames)
+        self.index = {field: i for i, field in enumerate(self.fieldnames)}
+        self.empty_row = [""] * len(self.fieldnames)
+        #: lists of steps for each key, keyed on key prefix and dictionary keys
+        self.plans = {}
+        #: value types seen for each field that can be copied as is
+        self.scalar_types = {}
+        #: handlers for list values, keyed on field name
+        self.list_handlers = {}
+
+    def __call__(self, data):
+        row = self.empty_row.copy()
+        self.fill(data, "", row)
+        return tuple(row)
+
+    def fill(self, data, prefix, row):
+        """Set values from a dictionary into a row, prefixing keys
+        as specified (for nested dictionaries)."""
+        keys = tuple(data)
+        try:
+            plan = self.plans[(prefix, keys)]
+        except KeyError:
+            plan = self.plans[(prefix, keys)] = self.compile(prefix, keys)
+        for value, (name, index, scalar_types, set_list) in zip(data.values(), plan):
+            cls = value.__class__
+            # values of known types are copied directly into the row
+            if cls in scalar_types:
+                row[index] = value
+            elif cls is list:
+                set_list(value, row)
+            # anything else (nested dicts, new types) handled generically
+            else:
+                self.handle(name, value, row)
+
+    def compile(self, prefix, keys):
+        """Determine the steps to set values into a row for a dictionary
+        with the specified keys: a list with the field name, row index,
+        value types that can be copied as is, and list handler for each
+        key, in order."""
+        plan = []
+        for key in keys:
+            name = prefix + key
+            index, scalar_types = None, ()
+            if name in self.index:
+                index = self.index[name]
+                scalar_types = self.scalar_types.setdefault(name, set())
+            plan.append((name, index, scalar_types, self.list_handler(name)))
+        return plan
+
+    def handle(self, name, value, row):
+        """Set a value for the named field into the row, based on type."""
+        # nested dictionary: combine key and nested keys
+        if isinstance(value, dict):
+            self.fill(value, "%s_" % name, row)
+        elif isinstance(value, list):
+            self.list_handler(name)(value, row)
+        else:
+            index = self.field_index(name)
+            # copy values of this type directly from now on
+            self.scalar_types.setdefault(name, set()).add(value.__class__)
+            row[index] = value
+
+    def field_index(self, name):
+        """Get the row index for a field; raises a ValueError like
+        `class:csv.DictWriter` for fields not in the list of fields."""
+        try:
+            return self.index[name]
+        except KeyError:
+            raise ValueError("dict contains fields not in fieldnames: %r" % name)
+
+    def list_handler(self, name):
+        """Get a handler to set a list value for the named field."""
+        if name not in self.list_handlers:
+            self.list_handlers[name] = self.compile_list(name)
+        return self.list_handlers[name]
+
+    def compile_list(self, name):
+        """Generate a handler to set a list value for the named field."""
+        # list of dict: one field per subkey, using the same key
+        # convention as flatten_dict (e.g. members.id becomes member_ids)
+        csv_key, suffix = name, ""
+        if name.endswith("s"):
+            csv_key, suffix = name[:-1], "s"
+        prefix = "%s_" % csv_key
+        subfields = {
+            field[len(prefix) : len(field) - len(suffix)]: i
+            for i, field in enumerate(self.fieldnames)
+            if field.startswith(prefix)
+            and field.endswith(suffix)
+            and len(field) > len(prefix) + len(suffix)
+        }
+        subkeys = subfields.keys()
+        field_index = self.field_index
+
+        def check_subkeys(keys):
+            # raise a value error for the first subkey without a field
+            for subkey in sorted(set(keys) - set(subkeys)):
+                field_index("%s%s%s" % (prefix, subkey, suffix))
+
+        def set_list(value, row):
+            # list of values (or empty list): delimited string
+            if not value or not isinstance(value[0], dict):
+                row[field_index(name)] = ";".join([str(v) for v in value])
+            # common case: a single dictionary
+            elif len(value) == 1:
+                item = value[0]
+                if not item.keys() <= subkeys:
+                    check_subkeys(item)
+                for subkey, subval in item.items():
+                    row[subfields[subkey]] = str(subval)
+            else:
+                # only set subkeys present in at least one dictionary
+                present = set()
+                for item in value:
+                    present.update(item)
+                if not present <= subkeys:
+                    check_subkeys(present)
+                for subkey in present:
+                    row[subfields[subkey]] = ";".join(
+                        [str(item.get(subkey, "")) for item in value]
+                    )
+
+        return set_list
+
+
+class ColumnarWriter:
+    """
+    Write export data to a Parquet file with typed columns, one row group
+    at a time as data is generated. Nested data is flattened into the same
+    columns as :meth:`BaseExport.flatten_dict`, but lists are kept as list
+    columns instead of being joined into delimited strings.
+
+    :param path: output filename or binary file object
+    :param fieldnames: list of column names, in order
+    :param column_types: dict of column name to type name (one of
+        :attr:`types`); use a single-item list for list columns,
+        e.g. ``["int"]``. Columns not specified are strings.
+    :param row_group_size: number of rows to write at a time
+    :param stats: optional :class:`ExportStats` to update with each row
+    """
+
+    #: supported type names, with conversion for exported values
+    types = {
+        "string": str,
+        "int": int,
+        "float": float,
+        "bool": bool,
+        "datetime": datetime.fromisoformat,
+    }
+
+    def __init__(
+        self, path, fieldnames, column_types=None, row_group_size=10000, stats=None
+    ):
+        column_types = column_types or {}
+        arrow_types = {
+            "string": pyarrow.string(),
+            "int": pyarrow.int64(),
+            "float": pyarrow.float64(),
+            "bool": pyarrow.bool_(),
+            "datetime": pyarrow.timestamp("us", tz="UTC"),
+        }
+        fields = []
+        self.converters = {}
+        for name in fieldnames:
+            type_name = column_types.get(name, "string")
+            if isinstance(type_name, list):
+                fields.append(
+                    pyarrow.field(name, pyarrow.list_(arrow_types[type_name[0]]))
+                )
+                self.converters[name] = self.list_converter(self.types[type_name[0]])
+            else:
+                fields.append(pyarrow.field(name, arrow_types[type_name]))
+                self.converters[name] = self.converter(self.types[type_name])
+        self.schema = pyarrow.schema(fields)
+        self.row_group_size = row_group_size
+        self.stats = stats
+        self.columns = {name: [] for name in fieldnames}
+        self.rows = 0
+        self.writer = pyarrow.parquet.ParquetWriter(
+            path, self.schema, compression="zstd"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def converter(convert):
+        """Conversion for a scalar column; empty values are null, and lists
+        are joined as for CSV output."""
+
+        def convert_value(value):
+            if isinstance(value, list):
+                value = ";".join(str(v) for v in value)
+            if value is None or value == "":
+                return None
+            return convert(value)
+
+        return convert_value
+
+    @staticmethod
+    def list_converter(convert):
+        """Conversion for a list column; empty items are null."""
+
+        def convert_list(value):
+            if value is None:
+                return None
+            if not isinstance(value, list):
+                value = [value]
+            return [None if v is None or v == "" else convert(v) for v in value]
+
+        return convert_list
+
+    def flatten(self, data, prefix, row):
+        """Flatten nested data into the row dict, with column names
+        matching :meth:`BaseExport.flatten_dict`."""
+        for key, value in data.items():
+            name = prefix + key
+            if isinstance(value, dict):
+                self.flatten(value, name + "_", row)
+            elif isinstance(value, list) and value and isinstance(value[0], dict):
+                # list of dict: one list column per key, e.g. member_ids
+                suffix = ""
+                if name.endswith("s"):
+                    name = name[:-1]
+                    suffix = "s"
+                subkeys = set(chain.from_iterable(v.keys() for v in value))
+                for subkey in subkeys:
+                    row["%s_%s%s" % (name, subkey, suffix)] = [
+                        v.get(subkey) for v in value
+                    ]
+            elif value == [] and name not in self.columns:
+                # empty list of dict; nothing to write
+                continue
+            else:
+                row[name] = value
+        return row
+
+    def writerow(self, data):
+        """Add a record to the current row group, writing the row group
+        when it is full."""
+        row = self.flatten(data, "", {})
+        unknown = row.keys() - self.columns.keys()
+        if unknown:
+            raise ValueError(
+                "dict contains fields not in fieldnames: "
+                + ", ".join([repr(name) for name in unknown])
+            )
+        values = [self.converters[name](row.get(name)) for name in self.columns.keys()]
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+        if self.stats is not None:
+            self.stats.update(values)
+        self.rows += 1
+        if self.rows >= self.row_group_size:
+            self.write_row_group()
+
+    def write_row_group(self):
+        """Write buffered rows as a row group."""
+        if self.rows:
+            self.writer.write_table(
+                pyarrow.table(self.columns, schema=self.schema),
+                row_group_size=self.rows,
+            )
+            for column in self.columns.values():
+                column.clear()
+            self.rows = 0
+
+    def close(self):
+        """Write any remaining rows and close the file."""
+        self.write_row_group()
+        self.writer.close()
+
+
+class HashedFile:
+    """
+    File wrapper that calculates a SHA-256 checksum and size in bytes
+    of the content as it is written. Closes the file when used as a
+    context manager.
+
+    :param fileobj: text or binary file object
+    :param encoding: encoding for text content (should match the file)
+    """
+
+    def __init__(self, fileobj, encoding="utf-8"):
+        self.file = fileobj
+        self.encoding = encoding
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def __getattr__(self, attr):
+        return getattr(self.file, attr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+    def write(self, content):
+        data = content.encode(self.encoding) if isinstance(content, str) else content
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.file.write(content)
+
+    @property
+    def hash(self):
+        """checksum in datapackage format, e.g. `sha256:...`"""
+        return "sha256:%s" % self.sha256.hexdigest()
+
+
+class ExportStats:
+    """
+    Row count and per-field null counts and minimum and maximum values,
+    calculated incrementally as rows are written.
+
+    :param fieldnames: list of field names, in the order of row values
+    """
+
+    def __init__(self, fieldnames):
+        self.fieldnames = list(fieldnames)
+        self.rows = 0
+        self.nulls = [0] * len(self.fieldnames)
+        self.minimum = [None] * len(self.fieldnames)
+        self.maximum = [None] * len(self.fieldnames)
+
+    def update(self, row):
+        """Update statistics with a row, as a sequence of values in field
+        order. Empty values are counted as nulls; list values are not
+        included in minimum and maximum."""
+        self.rows += 1
+        for i, value in enumerate(row):
+            if value is None or value == "" or value == []:
+                self.nulls[i] += 1
+            elif not isinstance(value, list):
+                minimum = self.minimum[i]
+                if minimum is None:
+                    self.minimum[i] = self.maximum[i] = value
+                    continue
+                try:
+                    if value < minimum:
+                        self.minimum[i] = value
+                    elif value > self.maximum[i]:
+                        self.maximum[i] = value
+                except TypeError:
+                    # mixed types; compare as strings
+                    value = str(value)
+                    self.minimum[i] = min(str(minimum), value)
+                    self.maximum[i] = max(str(self.maximum[i]), value)
+
+    def fields(self):
+        """Field descriptors with statistics, for a datapackage schema."""
+        fields = []
+        for name, nulls, minimum, maximum in zip(
+            self.fieldnames, self.nulls, self.minimum, self.maximum
+        ):
+            stats = {"nulls": nulls}
+            if minimum is not None:
+                stats["min"] = self.serialize(minimum)
+                stats["max"] = self.serialize(maximum)
+            fields.append({"name": name, "stats": stats})
+        return fields
+
+    @staticmethod
+    def serialize(value):
+        # dates and times from columnar output are not json serializable
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return value
+
+
+class ExportCache:
+    """
+    Lookups for data needed by many exported records or by more than one
+    export, so that it is only loaded or computed once. Each export has
+    its own cache by default; the ``export_all`` command shares one cache
+    across all datasets.
+
+    :param shared_models: models whose instances should be kept and
+        reused by later exports (instances keep any prefetched data
+        from the export that first loaded them)
+    """
+
+    def __init__(self, shared_models=()):
+        self.shared_models = set(shared_models)
+        #: absolute urls by model label and primary key
+        self.urls = {}
+        #: sorted event dates by event relation and related primary key
+        self.dates = {}
+        #: instances of shared models, by model and primary key
+        self.instances = defaultdict(dict)
+
+    def shared_instances(self, model):
+        """Dictionary of shared instances for a model, or None if the
+        model is not shared."""
+        if model in self.shared_models:
+            return self.instances[model]
+
+    def absolute_url(self, obj):
+        """Absolute URL for an object, calculated once per object."""
+        key = (obj._meta.label, obj.pk)
+        if key not in self.urls:
+            self.urls[key] = absolutize_url(obj.get_absolute_url())
+        return self.urls[key]
+
+    def event_dates(self, obj):
+        """Sorted list of unique known-year event dates for an account or
+        work; dates for all accounts or works are loaded in a single query
+        the first time this is called."""
+        events = obj.event_set
+        key = (events.model._meta.label, events.field.attname)
+        if key not in self.dates:
+            dates = defaultdict(set)
+            for related_id, start_date, end_date in (
+                events.model.objects.known_years()
+                .filter(**{"%s__isnull" % events.field.attname: False})
+                .values_list(events.field.attname, "start_date", "end_date")
+            ):
+                dates[related_id].update(filter(None, (start_date, end_date)))
+            self.dates[key] = {
+                related_id: sorted(values) for related_id, values in dates.items()
+            }
+        return self.dates[key].get(obj.pk, [])
+
+
+def record_hash(record):
+    """Hash of an export record, for comparing export content."""
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ExportDelta:
+    """
+    Compare export records with a previous export as they are generated.
+    Records that were not in the previous export are passed through
+    :meth:`filter` for inclusion in the delta; the position of all other
+    records in the previous export is recorded, so that the previous export
+    can be patched into the new one with :func:`apply_delta`.
+
+    :param previous: iterable of records from the previous export
+    :param key: optional name of a field that identifies records, for
+        reporting which records were added, changed or deleted
+    """
+
+    def __init__(self, previous, key=None):
+        self.key = key
+        self.previous_total = 0
+        #: positions of each record (by hash) in the previous export
+        self.positions = defaultdict(deque)
+        #: record hash by key in the previous export
+        self.previous_keys = {}
+        for i, record in enumerate(previous):
+            record_id = record_hash(record)
+            self.positions[record_id].append(i)
+            if key:
+                self.previous_keys[record.get(key)] = record_id
+            self.previous_total += 1
+        self.ops = []
+        self.inserted = 0
+        self.added = []
+        self.changed = []
+        self.keys = set()
+
+    @property
+    def removed(self):
+        """number of records in the previous export not included in
+        the new export"""
+        return sum(len(positions) for positions in self.positions.values())
+
+    def filter(self, data):
+        """Generator: yield records that are new or changed"""
+        for record in data:
+            if self.key:
+                self.keys.add(record.get(self.key))
+            positions = None
+            if self.positions:
+                positions = self.positions.get(record_hash(record))
+            if positions:
+                self.copy(positions.popleft())
+                continue
+
+            self.inserted += 1
+            if self.ops and self.ops[-1][0] == "insert":
+                self.ops[-1][1] += 1
+            else:
+                self.ops.append(["insert", 1])
+            if self.key:
+                record_id = record.get(self.key)
+                if record_id in self.previous_keys:
+                    self.changed.append(record_id)
+                else:
+                    self.added.append(record_id)
+            yield record
+
+    def copy(self, position):
+        """record that a record is copied from the previous export"""
+        # extend the last copy step if positions are sequential
+        if self.ops and self.ops[-1][0] == "copy" and self.ops[-1][2] == position:
+            self.ops[-1][2] = position + 1
+        else:
+            self.ops.append(["copy", position, position + 1])
+
+    def manifest(self):
+        """Summary of changes, as a dict for output as JSON."""
+        manifest = {
+            "previous_total": self.previous_total,
+            "total": self.previous_total - self.removed + self.inserted,
+            "inserted": self.inserted,
+            "removed": self.removed,
+        }
+        if self.key:
+            manifest["key"] = self.key
+            manifest["added"] = self.added
+            manifest["changed"] = self.changed
+            manifest["deleted"] = sorted(
+                record_id
+                for record_id in self.previous_keys
+                if record_id not in self.keys
+            )
+        manifest["ops"] = self.ops
+        return manifest
+
+
+def iter_json_array(jsonfile, chunk_size=65536):
+    """
+    Generator: yield the items of a JSON array from a file one at a time,
+    reading the file in chunks so that the whole array is not loaded
+    into memory. Raises :class:`ValueError` if the file is not a valid
+    JSON array.
+
+    :param jsonfile: file object opened in text mode
+    :param chunk_size: number of characters to read at a time
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    # what is allowed next: "[" to start, an item or "]" at the start
+    # of the array, an item after a comma, or a separator after an item
+    expected = "start"
+    while True:
+        buffer = buffer.lstrip()
+        # keep at least one chunk in the buffer until the end of the file
+        if not eof and len(buffer) < chunk_size:
+            chunk = jsonfile.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        if not buffer:
+            raise ValueError("Unexpected end of JSON array")
+
+        if expected == "start":
+            if buffer[0] != "[":
+                raise ValueError("Expected a JSON array")
+            buffer = buffer[1:]
+            expected = "first"
+        elif expected in ("first", "separator") and buffer[0] == "]":
+            return
+        elif expected == "separator":
+            if buffer[0] != ",":
+                raise ValueError("Expected ',' or ']' in JSON array")
+            buffer = buffer[1:]
+            expected = "item"
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            # an item at the end of the buffer may continue in the next chunk
+            if end is None or (end == len(buffer) and not eof):
+                chunk = jsonfile.read(chunk_size)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+            expected = "separator"
+
+
+def apply_delta(previous, delta, ops):
+    """
+    Generator: patch records from a previous export into the new export,
+    using the delta records and the steps from an export delta manifest.
+    Works for both JSON records and CSV rows (without header).
+
+    :param previous: list of records or rows from the previous export
+    :param delta: iterable of records or rows from the delta export
+    :param ops: list of steps from the delta manifest
+    """
+    delta = iter(delta)
+    for op in ops:
+        if op[0] == "copy":
+            yield from previous[op[1] : op[2]]
+        else:
+            yield from islice(delta, op[1])
+
+
+#: export command instance for the current worker process
+_worker_export = None
+
+
+def _init_export_worker(export):
+    """Initialize a worker process for a parallel export; the export
+    command is inherited from the parent process when the worker is forked."""
+    global _worker_export
+    _worker_export = export
+
+
+def _export_chunk(pks):
+    """Generate export data for a chunk of primary keys in a worker
+    process, in the order given."""
+    return [
+        _worker_export.get_object_data(obj)
+        for obj in _worker_export.iter_chunks(_worker_export.get_queryset(), pks)
+    ]
+
+
 class StreamArray(list):
     """
     Wrapper for a generator so data can be streamed and encoded as json.
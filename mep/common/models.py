@@ -1,5 +1,7 @@
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 # abstract models with common fields to be
 # used as mix-ins
@@ -177,3 +179,69 @@ class TrackChangesModel(models.Model):
     def initial_value(self, field):
         """return the initial value for a field"""
         return self.__initial[field]
+
+
+class IndexQueueItem(models.Model):
+    """A record waiting to be reindexed in Solr by the `index_worker`
+    manage command, when indexing is queued instead of run as part of
+    the request; see :class:`mep.common.indexing.ReindexCoalescer`."""
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    #: why the record was queued, e.g. the signal handler name
+    reason = models.CharField(max_length=255, blank=True)
+    #: date the record was most recently queued
+    queued = models.DateTimeField(default=timezone.now)
+    #: number of failed indexing attempts
+    attempts = models.PositiveSmallIntegerField(default=0)
+    #: do not retry before this date, after a failed attempt
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+    #: error from the last failed attempt
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "index queue item"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_type", "object_id"], name="unique_index_queue_item"
+            )
+        ]
+
+    def __str__(self):
+        return "%s %s" % (self.content_type, self.object_id)
+
+    @classmethod
+    def enqueue(cls, model, pks, reason=""):
+        """Queue records of the specified model for indexing, by primary
+        key. Records that are already queued are marked as queued again,
+        so they will be reindexed even if they are currently being
+        processed, and any previous failed attempts are reset so they are
+        ready immediately."""
+        content_type = ContentType.objects.get_for_model(model)
+        now = timezone.now()
+        options = {
+            "update_conflicts": True,
+            "update_fields": ["reason", "queued", "attempts", "next_attempt"],
+        }
+        # not all database backends support specifying unique fields
+        if connection.features.supports_update_conflicts_with_target:
+            options["unique_fields"] = ["content_type", "object_id"]
+        cls.objects.bulk_create(
+            [
+                cls(
+                    content_type=content_type,
+                    object_id=pk,
+                    reason=reason,
+                    queued=now,
+                    attempts=0,
+                    next_attempt=now,
+                )
+                for pk in pks
+            ],
+            **options,
+        )
+
+    @classmethod
+    def ready(cls):
+        """Queued items that are ready to be indexed, oldest first."""
+        return cls.objects.filter(next_attempt__lte=timezone.now()).order_by("queued")
@@ -0,0 +1,417 @@
+"""
+Solr querysets, pagination, query caching, and query instrumentation
+shared by the public search views.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter, OrderedDict
+from contextlib import ContextDecorator
+
+from addict import Dict as AttrDict
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from parasolr.django import AliasedSolrQuerySet as BaseAliasedSolrQuerySet
+from parasolr.django import SolrClient
+from parasolr.solr.client import GroupedResponse, QueryResponse
+from parasolr.utils import solr_timestamp_to_datetime
+
+from mep.common.indexing import IndexVersion
+from mep.common.utils import alpha_pagelabels
+
+logger = logging.getLogger(__name__)
+
+
+class SolrQueryCounter(ContextDecorator):
+    """Context manager and decorator to count queries sent to Solr by
+    :class:`CountingSolrClient` in the current thread, e.g. to check the
+    number of Solr requests needed to render a view. Responses returned
+    from :class:`SolrQueryCache` are counted separately as cache hits.
+    Counters may be nested; queries are counted by every active counter.
+
+    Usage::
+
+        with SolrQueryCounter() as counter:
+            ...
+        counter.count
+    """
+
+    #: thread-local storage for the currently active counters
+    _local = threading.local()
+
+    def __init__(self):
+        #: number of queries sent while this counter was active
+        self.count = 0
+        #: number of query responses returned from the cache
+        self.cache_hits = 0
+
+    def _recreate_cm(self):
+        # use a new instance each time a decorated function is called
+        return self.__class__()
+
+    @classmethod
+    def active(cls):
+        """List of currently active counters."""
+        if not hasattr(cls._local, "counters"):
+            cls._local.counters = []
+        return cls._local.counters
+
+    @classmethod
+    def increment(cls, cache_hit=False):
+        """Record a Solr query or cache hit for all active counters."""
+        for counter in cls.active():
+            if cache_hit:
+                counter.cache_hits += 1
+            else:
+                counter.count += 1
+
+    def __enter__(self):
+        self.active().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.active().remove(self)
+
+
+class CountingSolrClient(SolrClient):
+    """:class:`parasolr.django.SolrClient` that records each query with
+    any active :class:`SolrQueryCounter`."""
+
+    def query(self, *args, **kwargs):
+        SolrQueryCounter.increment()
+        return super().query(*args, **kwargs)
+
+
+class SolrQueryCache:
+    """Cache for Solr query responses, with an in-process LRU tier and a
+    shared tier using the Django cache. Responses are cached by Solr
+    connection and normalized query parameters for the current
+    :class:`~mep.common.indexing.IndexVersion`, so they are not reused
+    after the index changes; queries are not cached if the index version
+    is unavailable.
+
+    Enabled with **SOLR_QUERY_CACHE** in settings; the number of responses
+    kept in memory by each process is configured with
+    **SOLR_QUERY_CACHE_SIZE** (0 to only use the Django cache). Hit and
+    miss totals for each process are logged every
+    **SOLR_QUERY_CACHE_LOG_INTERVAL** lookups (default 1000; 0 to disable).
+    """
+
+    #: default number of responses to keep in memory
+    default_size = 500
+
+    #: default number of lookups between log messages with cache totals
+    default_log_interval = 1000
+
+    #: responses in memory, in order of use
+    _responses = OrderedDict()
+    _lock = threading.Lock()
+
+    #: running totals of hits and misses in this process, for monitoring
+    stats = Counter()
+
+    @staticmethod
+    def enabled():
+        """Check if Solr query caching is enabled in settings."""
+        return getattr(settings, "SOLR_QUERY_CACHE", False)
+
+    @classmethod
+    def cache_key(cls, solr, params):
+        """Generate a cache key for a query with the specified parameters
+        on a Solr client's connection. Filter queries are sorted, since
+        their order does not affect the response. Returns None if the
+        index version is unavailable."""
+        version = IndexVersion.get()
+        if version is None:
+            return None
+        params = dict(params)
+        if isinstance(params.get("fq"), (list, tuple)):
+            params["fq"] = sorted(params["fq"])
+        query = json.dumps(
+            [solr.solr_url, solr.collection, params], sort_keys=True, default=str
+        )
+        return "solr-query-%s-%s" % (
+            version,
+            hashlib.sha1(query.encode()).hexdigest(),
+        )
+
+    @classmethod
+    def get(cls, key):
+        """Get a cached response, checking memory first and then the Django
+        cache. Returns None if the response is not cached."""
+        with cls._lock:
+            response = cls._responses.get(key)
+            if response is not None:
+                cls._responses.move_to_end(key)
+        if response is not None:
+            cls.record("memory_hits")
+        else:
+            response = cache.get(key)
+            if response is None:
+                cls.record("misses")
+                return None
+            cls.record("shared_hits")
+            cls.remember(key, response)
+        # return a new copy, so cached responses are not modified
+        return AttrDict(json.loads(response))
+
+    @classmethod
+    def record(cls, stat):
+        """Add a hit or miss to the running totals, periodically logging
+        the totals for monitoring."""
+        with cls._lock:
+            cls.stats.update([stat])
+            lookups = sum(cls.stats.values())
+        interval = getattr(
+            settings, "SOLR_QUERY_CACHE_LOG_INTERVAL", cls.default_log_interval
+        )
+        if interval and lookups % interval == 0:
+            logger.info(
+                "Solr query cache: %(lookups)d lookups, %(memory_hits)d memory "
+                "hits, %(shared_hits)d shared hits, %(misses)d misses "
+                "(%(hit_rate).1f%% hit rate)",
+                cls.totals(),
+            )
+
+    @classmethod
+    def totals(cls):
+        """Running totals of lookups, hits and misses in this process,
+        with the percentage of lookups that were hits."""
+        with cls._lock:
+            totals = {
+                stat: cls.stats[stat]
+                for stat in ["memory_hits", "shared_hits", "misses"]
+            }
+        totals["lookups"] = sum(totals.values())
+        hits = totals["memory_hits"] + totals["shared_hits"]
+        totals["hit_rate"] = 100 * hits / totals["lookups"] if totals["lookups"] else 0
+        return totals
+
+    @classmethod
+    def set(cls, key, response):
+        """Cache a response in memory and in the Django cache."""
+        response = json.dumps(response)
+        cache.set(key, response)
+        cls.remember(key, response)
+
+    @classmethod
+    def remember(cls, key, response):
+        """Keep a serialized response in memory, discarding the least
+        recently used responses if there are too many."""
+        size = getattr(settings, "SOLR_QUERY_CACHE_SIZE", cls.default_size)
+        with cls._lock:
+            cls._responses[key] = response
+            cls._responses.move_to_end(key)
+            while len(cls._responses) > size:
+                cls._responses.popitem(last=False)
+
+    @classmethod
+    def clear(cls):
+        """Clear responses in memory for this process."""
+        with cls._lock:
+            cls._responses.clear()
+
+
+class CachingSolrClient(CountingSolrClient):
+    """:class:`CountingSolrClient` that caches query responses with
+    :class:`SolrQueryCache`, when enabled."""
+
+    def query(self, wrap=True, **kwargs):
+        if not SolrQueryCache.enabled():
+            return super().query(wrap=wrap, **kwargs)
+
+        key = SolrQueryCache.cache_key(self, kwargs)
+        if key is None:
+            return super().query(wrap=wrap, **kwargs)
+
+        response = SolrQueryCache.get(key)
+        if response is not None:
+            SolrQueryCounter.increment(cache_hit=True)
+        else:
+            response = super().query(wrap=False, **kwargs)
+            # errors are not cached
+            if response is None:
+                return None
+            SolrQueryCache.set(key, response)
+
+        # wrap the same way as :meth:`parasolr.solr.client.SolrClient.query`
+        if wrap:
+            result_class = QueryResponse
+            if "grouped" in response:
+                result_class = GroupedResponse
+            response = result_class(response)
+        return response
+
+
+class AliasedSolrQuerySet(BaseAliasedSolrQuerySet):
+    """Extends :class:`parasolr.django.AliasedSolrQuerySet` to cache
+    responses with :class:`SolrQueryCache` when enabled, count queries with
+    :class:`SolrQueryCounter`, and to optionally retrieve the
+    most recent last modified date for a set of documents as part of the
+    main query, using a JSON Facet API aggregate."""
+
+    #: name of the JSON facet for the last modified aggregate
+    last_modified_facet = "last_modified"
+
+    def __init__(self, solr=None):
+        super().__init__(solr=solr or CachingSolrClient())
+
+    def last_modified_aggregate(self, **filters):
+        """Include the maximum last modified date for all documents matching
+        the specified filters (regardless of the current search and filters)
+        in the response. Filters use the same syntax as
+        :meth:`~parasolr.query.SolrQuerySet.filter`, without field aliases."""
+        filter_qs = [
+            self._lookup_to_filter(key, value) for key, value in filters.items()
+        ]
+        facet = {
+            self.last_modified_facet: {
+                "type": "query",
+                "q": "*:*",
+                # replace the domain so that the search doesn't apply
+                "domain": {"query": filter_qs or "*:*"},
+                "facet": {"max": "max(last_modified)"},
+            }
+        }
+        return self.raw_query_parameters(**{"json.facet": json.dumps(facet)})
+
+    def without_facets(self):
+        """Copy of the queryset with the same search, filters, sort and
+        field list but without facets, stats, highlighting, or JSON Facet
+        API parameters such as the last modified aggregate, for queries
+        that only need documents."""
+        qs_copy = self._clone()
+        qs_copy.facet_field_list = []
+        qs_copy.range_facet_fields = []
+        qs_copy.facet_opts = {}
+        qs_copy.stats_field_list = []
+        qs_copy.stats_opts = {}
+        qs_copy.highlight_fields = []
+        qs_copy.highlight_opts = {}
+        qs_copy.raw_params.pop("json.facet", None)
+        return qs_copy
+
+    def get_last_modified(self):
+        """Most recent last modified date requested with
+        :meth:`last_modified_aggregate`, from the cached response; returns
+        None if the query has not been run or the aggregate was not included."""
+        if not self._result_cache:
+            return None
+        facets = self._result_cache.response.get("facets") or {}
+        last_modified = (facets.get(self.last_modified_facet) or {}).get("max")
+        if last_modified:
+            return solr_timestamp_to_datetime(last_modified)
+
+
+class SolrPaginator(Paginator):
+    """Paginator for a :class:`~parasolr.query.SolrQuerySet` that gets the
+    requested page, total count, and facets from a single Solr query instead
+    of querying for the count first. The page response is cached on the full
+    queryset, so count and facets for the full queryset use it; iterating or
+    slicing the full queryset after pagination only returns the current page.
+    Orphans are not supported with a single query; if they are configured,
+    the count is queried first.
+    """
+
+    def page(self, number):
+        """Return a :class:`~django.core.paginator.Page` for the specified
+        1-based page number. The first page requested is retrieved from
+        Solr along with the total count; after that, pages are not queried
+        until they are used."""
+        if self.orphans or "count" in self.__dict__:
+            number = self.validate_number(number)
+            bottom = (number - 1) * self.per_page
+            top = bottom + self.per_page
+            if top + self.orphans >= self.count:
+                top = self.count
+            return self._get_page(self.object_list._clone()[bottom:top], number, self)
+
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+
+        bottom = (number - 1) * self.per_page
+        page_qs = self.object_list._clone()[bottom : bottom + self.per_page]
+        page_qs.get_response()
+        # share the page response with the full queryset
+        self.object_list._result_cache = page_qs._result_cache
+        self.count = self.object_list.count() if page_qs._result_cache else 0
+        if number > self.num_pages:
+            raise EmptyPage(self.error_messages["no_results"])
+        return self._get_page(page_qs, number, self)
+
+
+class PageBoundaries:
+    """Sequence-like access to the documents at the start and end of each
+    page of a Solr queryset, for use with
+    :meth:`~mep.common.utils.alpha_pagelabels`. Documents are retrieved
+    when they are first accessed; the last document on one page and the
+    first document on the next are retrieved together with a single
+    two-row query, so labeling every page takes one small query per page
+    instead of retrieving every result. Facets and other parameters that
+    don't affect which documents are returned are not included."""
+
+    def __init__(self, sqs, per_page):
+        self.sqs = sqs.without_facets()
+        self.per_page = per_page
+        self._docs = {}
+
+    def __getitem__(self, index):
+        if index not in self._docs:
+            start = index
+            # first document on a page: get the end of the previous page too
+            if index and index % self.per_page == 0:
+                start = index - 1
+            docs = list(self.sqs._clone()[start : start + 2])
+            self._docs.update(enumerate(docs, start))
+        return self._docs[index]
+
+
+def solr_pagelabels(paginator, sqs, attr_meth, max_chars=None):
+    """Generate alphabetical page labels for a paginated Solr queryset with
+    :meth:`~mep.common.utils.alpha_pagelabels`, retrieving only the first
+    and last document on each page with :class:`PageBoundaries`. Labels are
+    cached for each query and page size until the
+    :class:`~mep.common.indexing.IndexVersion` changes, if it is available.
+
+    :param paginator: a django paginator for the queryset
+    :param sqs: Solr queryset to label, e.g. limited to the sort field;
+        facets are not included in the queries for labels
+    :param attr_meth: method or lambda to retrieve the label from a document
+    :param max_chars: optional maximum label length
+    :returns: :class:`~collections.OrderedDict` where keys are page
+        numbers and values are page labels
+    """
+    boundaries = PageBoundaries(sqs, paginator.per_page)
+    query = json.dumps(
+        [boundaries.sqs.query_opts(), paginator.per_page, max_chars],
+        sort_keys=True,
+        default=str,
+    )
+    version = IndexVersion.get()
+    cache_key = None
+    page_labels = None
+    if version is not None:
+        cache_key = "pagelabels-%s-%s" % (
+            version,
+            hashlib.sha1(query.encode()).hexdigest(),
+        )
+        page_labels = cache.get(cache_key)
+    if page_labels is None:
+        page_labels = alpha_pagelabels(
+            paginator,
+            boundaries,
+            attr_meth,
+            max_chars=max_chars,
+        )
+        if cache_key:
+            cache.set(cache_key, page_labels)
+    return page_labels
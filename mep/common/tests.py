@@ -1,25 +1,48 @@
+import csv
+import datetime
+import hashlib
+import json
+import os.path
 import re
 import uuid
 from collections import OrderedDict
+from io import StringIO
+from operator import itemgetter
+from tempfile import TemporaryDirectory
 from unittest.mock import Mock, patch
 
+from addict import Dict as AttrDict
+from csp.constants import NONCE
+from csp.middleware import CSPMiddleware
+from parasolr.django.indexing import ModelIndexable
+from parasolr.indexing import Indexable
+from parasolr.solr.client import GroupedResponse
+
 import pytest
 import rdflib
+import requests
+from rdflib.compare import isomorphic
 from django.contrib.auth.models import Group, User
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.paginator import Paginator
-from django.http import Http404, HttpRequest, JsonResponse, QueryDict
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse, QueryDict
 from django.template.loader import get_template
 from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
 from django.urls import reverse
+from django.utils import timezone
+from django.views.generic.base import View
 from django.views.generic.list import ListView
 from piffle.image import IIIFImageClient
 
 from mep.accounts.models import Account, Event
 from mep.common import SCHEMA_ORG, views
 from mep.common.admin import LocalUserAdmin
+from mep.common.checks import response_cache_check
 from mep.common.forms import (
     CheckboxFieldset,
     FacetChoiceField,
@@ -27,13 +50,53 @@ from mep.common.forms import (
     RangeField,
     RangeWidget,
 )
-from mep.common.management.export import BaseExport, StreamArray
-from mep.common.models import AliasIntegerField, DateRange, Named, Notable
+from mep.common.management.commands import (
+    check_index,
+    index_worker,
+    parallel_index,
+)
+from mep.common.management.export import (
+    BaseExport,
+    ColumnarWriter,
+    ExportCache,
+    ExportDelta,
+    ExportStats,
+    FlattenSchema,
+    HashedFile,
+    StreamArray,
+    apply_delta,
+    iter_json_array,
+)
+from mep.common.indexing import (
+    CONTENT_HASH_FIELD,
+    IndexVersion,
+    ReindexCoalescer,
+    ReindexCoalescerMiddleware,
+    SurrogateKeys,
+    content_hash,
+)
+from mep.common.models import (
+    AliasIntegerField,
+    DateRange,
+    IndexQueueItem,
+    Named,
+    Notable,
+)
+from mep.common.solr import (
+    AliasedSolrQuerySet,
+    CachingSolrClient,
+    CountingSolrClient,
+    PageBoundaries,
+    SolrPaginator,
+    SolrQueryCache,
+    SolrQueryCounter,
+    solr_pagelabels,
+)
 from mep.common.templatetags import mep_tags
 from mep.common.utils import absolutize_url, alpha_pagelabels
 from mep.common.validators import verify_latlon
 from mep.people.forms import MemberSearchForm
-from mep.people.models import Person
+from mep.people.models import Person, PersonSignalHandlers
 
 
 class TestNamed(TestCase):
@@ -597,7 +660,9 @@ def test_formfield_selected_filter():
     bad_form2.is_valid()
     querystring = QueryDict("membership_dates_1=test")
     context = {"request": Mock(GET=querystring)}
-    assert mep_tags.formfield_selected_filter(context, bad_form2["membership_dates"]) == ""
+    assert (
+        mep_tags.formfield_selected_filter(context, bad_form2["membership_dates"]) == ""
+    )
 
 
 class TestCheckboxFieldset(TestCase):
@@ -755,6 +820,23 @@ class TestAjaxTemplateMixin(TestCase):
         myview.request.headers = {"x-requested-with": "XMLHttpRequest"}
         assert myview.get_template_names() == MyAjaxyView.ajax_template_name
 
+    @patch("mep.common.views.VaryOnHeadersMixin.dispatch")
+    def test_dispatch(self, mock_dispatch):
+        class MyAjaxyView(views.AjaxTemplateMixin):
+            get_queryset = Mock()
+
+        mock_dispatch.return_value = HttpResponse()
+        myview = MyAjaxyView()
+        myview.get_queryset.return_value.count.return_value = 5
+        response = myview.dispatch(Mock())
+        assert response["X-Total-Results"] == "5"
+        # uses the view's queryset if already set
+        myview.object_list = Mock()
+        myview.object_list.count.return_value = 3
+        response = myview.dispatch(Mock())
+        assert response["X-Total-Results"] == "3"
+        assert myview.get_queryset.call_count == 1
+
 
 class TestFacetJSONMixin(TestCase):
     def test_render_response(self):
@@ -838,6 +920,254 @@ def test_range_field():
     assert end_widget.attrs["placeholder"] == 1930
 
 
+class TestRangeStatsMixin(TestCase):
+    def setUp(self):
+        views.RangeStatsMixin._range_stats.clear()
+
+    @patch.object(IndexVersion, "get")
+    def test_get_range_stats(self, mock_version):
+        mock_version.return_value = 1
+
+        class RangeView(views.RangeStatsMixin):
+            stats_fields = ("account_years",)
+            range_field_map = {"account_years": "membership_dates"}
+            get_stats_queryset = Mock()
+
+        mock_stats = RangeView.get_stats_queryset.return_value.stats.return_value
+        mock_stats.get_stats.return_value = {
+            "stats_fields": {"account_years": {"min": 1919.0, "max": 1941.0}}
+        }
+        assert RangeView().get_range_stats() == {"membership_dates": (1919, 1941)}
+        # cached until the index version changes
+        assert RangeView().get_range_stats() == {"membership_dates": (1919, 1941)}
+        assert mock_stats.get_stats.call_count == 1
+        # shared via django cache for other processes
+        views.RangeStatsMixin._range_stats.clear()
+        RangeView().get_range_stats()
+        assert mock_stats.get_stats.call_count == 1
+
+        mock_version.return_value = 2
+        mock_stats.get_stats.return_value = None
+        assert RangeView().get_range_stats() == {}
+        assert mock_stats.get_stats.call_count == 2
+
+        # not cached if the index version is unavailable
+        mock_version.return_value = None
+        RangeView().get_range_stats()
+        RangeView().get_range_stats()
+        assert mock_stats.get_stats.call_count == 4
+
+
+class TestSolrLastModifiedMixin(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch.object(IndexVersion, "get")
+    @patch("mep.common.views.SolrQuerySet")
+    def test_last_modified(self, mock_sqs, mock_version):
+        mock_version.return_value = 1
+        view = views.SolrLastModifiedMixin()
+        mock_only = mock_sqs.return_value.filter.return_value.order_by.return_value
+        mock_only.only.return_value = [{"last_modified": "2018-07-02T21:08:46Z"}]
+        assert view.last_modified().year == 2018
+        # cached until the index changes
+        assert view.last_modified().year == 2018
+        assert mock_sqs.call_count == 1
+
+        # use the aggregate from the view's main query if available
+        view.object_list = AliasedSolrQuerySet()
+        with patch.object(view.object_list, "get_last_modified") as mock_get:
+            mock_get.return_value = datetime.datetime(2020, 1, 1)
+            assert view.last_modified() == datetime.datetime(2020, 1, 1)
+            # otherwise falls back to querying
+            mock_get.return_value = None
+            mock_version.return_value = 2
+            assert view.last_modified().year == 2018
+            assert mock_sqs.call_count == 2
+
+        # not cached if the index version is unavailable
+        mock_version.return_value = None
+        assert view.last_modified().year == 2018
+        assert view.last_modified().year == 2018
+        assert mock_sqs.call_count == 4
+
+        # no date if not found
+        mock_only.only.return_value = []
+        mock_version.return_value = 3
+        assert view.last_modified() is None
+
+    @patch.object(views.SolrLastModifiedMixin, "last_modified")
+    def test_dispatch(self, mock_last_modified):
+        class ModifiedView(views.SolrLastModifiedMixin, View):
+            get = Mock(side_effect=lambda request: HttpResponse())
+
+        mock_last_modified.return_value = datetime.datetime(2020, 5, 1, 12, 30, 15, 5)
+        view = ModifiedView.as_view()
+        factory = RequestFactory()
+        response = view(factory.get("/"))
+        assert response.status_code == 200
+        assert response["Last-Modified"] == "Fri, 01 May 2020 12:30:15 GMT"
+        etag = response["ETag"]
+        assert etag.startswith('W/"')
+        assert ModifiedView.get.call_count == 1
+
+        # not modified without running the view
+        for headers in [
+            {"If-Modified-Since": response["Last-Modified"]},
+            {"If-None-Match": etag},
+        ]:
+            response = view(factory.get("/", headers=headers))
+            assert response.status_code == 304
+            assert response["ETag"] == etag
+        assert ModifiedView.get.call_count == 1
+        assert mock_last_modified.call_count == 3
+
+        # ETag varies on request details the response varies on
+        response = view(factory.get("/", {"page": 2}, headers={"If-None-Match": etag}))
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+        response = view(
+            factory.get("/", headers={"If-None-Match": etag, "Accept": "text/json"})
+        )
+        assert response.status_code == 200
+        assert ModifiedView.get.call_count == 3
+        # last modified date is only checked once
+        assert mock_last_modified.call_count == 5
+
+        # modified since
+        mock_last_modified.return_value = datetime.datetime(2020, 6, 1)
+        response = view(factory.get("/", headers={"If-None-Match": etag}))
+        assert response.status_code == 200
+        assert ModifiedView.get.call_count == 4
+
+        # no last modified date: view runs, no headers
+        mock_last_modified.return_value = None
+        response = view(factory.get("/", headers={"If-None-Match": etag}))
+        assert response.status_code == 200
+        assert "ETag" not in response
+        assert ModifiedView.get.call_count == 5
+
+
+class TestSolrQueryCountMixin(TestCase):
+    def test_dispatch(self):
+        class CountedView(views.SolrQueryCountMixin, View):
+            def get(self, request, *args, **kwargs):
+                CountingSolrClient().query(q="*:*")
+                CountingSolrClient().query(q="*:*")
+                return HttpResponse()
+
+        view = CountedView()
+        view.setup(RequestFactory().get("/"))
+        with patch.object(CountingSolrClient, "make_request") as mock_request:
+            mock_request.return_value = None
+            response = view.dispatch(view.request)
+            assert view.solr_query_count == 2
+            assert "X-Solr-Queries" not in response
+            with override_settings(DEBUG=True):
+                response = view.dispatch(view.request)
+            assert response["X-Solr-Queries"] == "2"
+
+
+class TestCachedResponseMixin(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(RESPONSE_CACHE=True)
+    def test_dispatch(self):
+        class CachedView(views.CachedResponseMixin, View):
+            surrogate_keys = ["person"]
+
+            def get(self, request, *args, **kwargs):
+                CachedView.calls += 1
+                response = HttpResponse("content")
+                response["ETag"] = '"abc"'
+                return response
+
+        CachedView.calls = 0
+        view = CachedView.as_view()
+        factory = RequestFactory()
+        response = view(factory.get("/"))
+        assert response.content == b"content"
+        # served from the cache
+        response = view(factory.get("/"))
+        assert response.content == b"content"
+        assert CachedView.calls == 1
+        # cached responses are used for conditional requests
+        response = view(factory.get("/", headers={"If-None-Match": '"abc"'}))
+        assert response.status_code == 304
+        assert CachedView.calls == 1
+
+        # cached separately by query string and headers
+        view(factory.get("/", {"page": 2}))
+        view(factory.get("/", headers={"Accept": "application/json"}))
+        assert CachedView.calls == 3
+
+        # not used after a surrogate key is purged
+        SurrogateKeys.purge(["person"])
+        view(factory.get("/"))
+        assert CachedView.calls == 4
+        view(factory.get("/"))
+        assert CachedView.calls == 4
+
+        # not cached for logged in users
+        request = factory.get("/")
+        request.user = Mock(is_authenticated=True)
+        view(request)
+        assert CachedView.calls == 5
+
+        # not cached when disabled
+        with override_settings(RESPONSE_CACHE=False):
+            view(factory.get("/"))
+        assert CachedView.calls == 6
+
+    @override_settings(
+        RESPONSE_CACHE=True,
+        CONTENT_SECURITY_POLICY={"DIRECTIVES": {"script-src": ["'self'", NONCE]}},
+    )
+    def test_csp_nonce(self):
+        class NonceView(views.CachedResponseMixin, View):
+            def get(self, request, *args, **kwargs):
+                NonceView.calls += 1
+                return HttpResponse('<script nonce="%s"></script>' % request.csp_nonce)
+
+        NonceView.calls = 0
+        view = CSPMiddleware(NonceView.as_view())
+        nonces = []
+        for i in range(2):
+            response = view(RequestFactory().get("/"))
+            # header nonce matches the nonce in the content
+            nonce = re.search(r"'nonce-([^']+)'", response["Content-Security-Policy"])
+            assert nonce
+            assert response.content.decode() == '<script nonce="%s"></script>' % (
+                nonce.group(1)
+            )
+            nonces.append(nonce.group(1))
+        # second response served from the cache with a new nonce
+        assert NonceView.calls == 1
+        assert nonces[0] != nonces[1]
+
+    @override_settings(RESPONSE_CACHE=True)
+    def test_dispatch_template_response(self):
+        class CachedListView(views.CachedResponseMixin, ListView):
+            model = Person
+            template_name = "base.html"
+
+            def render_to_response(self, context, **kwargs):
+                response = super().render_to_response(context, **kwargs)
+                response.template_name = None
+                response.content = b"rendered"
+                return response
+
+        with patch.object(ListView, "get_queryset") as mock_get_queryset:
+            mock_get_queryset.return_value = Person.objects.none()
+            view = CachedListView.as_view()
+            response = view(RequestFactory().get("/"))
+            response.render()
+            response = view(RequestFactory().get("/"))
+            assert response.content == b"rendered"
+            assert mock_get_queryset.call_count == 1
+
+
 class TestRdfViewMixin(TestCase):
     def test_get_absolute_url(self):
         class MyRdfView(views.RdfViewMixin):
@@ -893,6 +1223,41 @@ class TestRdfViewMixin(TestCase):
         assert (crumb_list, SCHEMA_ORG.itemListElement, home_crumb) in graph
         assert (crumb_list, SCHEMA_ORG.itemListElement, page_crumb) in graph
 
+    def test_as_jsonld(self):
+        class MyRdfView(views.RdfViewMixin):
+            rdf_type = SCHEMA_ORG.ProfilePage
+            breadcrumbs = [("Home", "/"), ("Sylvia & <Co>", "/my-page")]
+
+            def get_absolute_url(self):
+                return "http://jimcasey.lifestyle/my-page"
+
+        view = MyRdfView()
+        jsonld = view.as_jsonld()
+        assert jsonld["@type"] == "schema:ProfilePage"
+        crumbs = jsonld["schema:breadcrumb"]["schema:itemListElement"]
+        assert [crumb["schema:position"] for crumb in crumbs] == [1, 2]
+        # describes the same graph as the rdflib version
+        graph = rdflib.Graph().parse(data=json.dumps(jsonld), format="json-ld")
+        assert isomorphic(graph, view.as_rdf())
+
+        # no breadcrumbs
+        view.breadcrumbs = []
+        graph = rdflib.Graph().parse(
+            data=json.dumps(view.as_jsonld()), format="json-ld"
+        )
+        assert isomorphic(graph, view.as_rdf())
+
+        # escaped for embedding in a script tag
+        view.breadcrumbs = MyRdfView.breadcrumbs
+        context = view.get_context_data()
+        assert "<Co>" not in context["page_jsonld"]
+        assert json.loads(context["page_jsonld"]) == view.as_jsonld()
+        # rdflib serialization can be enabled in settings
+        with override_settings(RDF_JSONLD_RDFLIB=True):
+            context = view.get_context_data()
+        graph = rdflib.Graph().parse(data=context["page_jsonld"], format="json-ld")
+        assert isomorphic(graph, view.as_rdf())
+
 
 class TestBreadcrumbsTemplate(TestCase):
     def setUp(self):
@@ -964,6 +1329,186 @@ class TestBaseExport(TestCase):
         assert BaseExport.flatten_dict({"empty": []}) == {"empty": ""}
 
 
+class TestFlattenSchema(TestCase):
+    fields = [
+        "event_type",
+        "member_ids",
+        "member_sort_names",
+        "subscription_price_paid",
+        "subscription_duration",
+        "subscription_duration_days",
+        "item_title",
+        "item_authors",
+        "source_type",
+        "source_image",
+        "nationalities",
+        "empty",
+    ]
+
+    rows = [
+        {
+            "event_type": "Subscription",
+            "members": [
+                {"id": "hemingway", "sort_name": "Hemingway, Ernest"},
+                {"id": "gay", "sort_name": "Gay, Francisque"},
+            ],
+            "subscription": OrderedDict(
+                [
+                    ("price_paid", "10.00"),
+                    ("duration", "1 month"),
+                    ("duration_days", 31),
+                ]
+            ),
+            "source": [{"type": "card"}, {"type": "logbook", "image": "foo"}],
+        },
+        {
+            "event_type": "Borrow",
+            "members": [{"id": "gay"}],
+            "item": {"title": "Ulysses", "authors": ["Joyce, James", "Other"]},
+            "nationalities": [],
+            "empty": None,
+        },
+        {"event_type": "Generic", "source": [{"type": "card"}]},
+    ]
+
+    def dictwriter_rows(self, rows):
+        # csv output from flatten_dict with a dict writer, for comparison
+        output = StringIO()
+        writer = csv.DictWriter(output, fieldnames=self.fields)
+        for row in rows:
+            writer.writerow(BaseExport.flatten_dict(row))
+        return output.getvalue()
+
+    def test_call(self):
+        flatten = FlattenSchema(self.fields)
+        output = StringIO()
+        writer = csv.writer(output)
+        for row in self.rows:
+            writer.writerow(flatten(row))
+        assert output.getvalue() == self.dictwriter_rows(self.rows)
+
+        flat = flatten(self.rows[0])
+        assert isinstance(flat, tuple)
+        assert len(flat) == len(self.fields)
+        assert flat[self.fields.index("member_ids")] == "hemingway;gay"
+        assert flat[self.fields.index("source_image")] == ";foo"
+        assert flat[self.fields.index("subscription_duration_days")] == 31
+        # not present in this row
+        assert flat[self.fields.index("item_title")] == ""
+        # list of values
+        flat = flatten(self.rows[1])
+        assert flat[self.fields.index("item_authors")] == "Joyce, James;Other"
+        assert flat[self.fields.index("nationalities")] == ""
+        assert flat[self.fields.index("source_image")] == ""
+
+    def test_compile(self):
+        flatten = FlattenSchema(self.fields)
+        plan = flatten.compile("", ("event_type", "members", "subscription"))
+        names = [step[0] for step in plan]
+        assert names == ["event_type", "members", "subscription"]
+        # row index for csv fields, none for keys that are flattened
+        assert plan[0][1] == self.fields.index("event_type")
+        assert plan[1][1] is None
+        # value types copied as is are shared and learned as rows are seen
+        flatten(self.rows[0])
+        assert str in plan[0][2]
+        assert not plan[1][2]
+
+    def test_unknown_field(self):
+        flatten = FlattenSchema(self.fields)
+        # fields not in the list raise a value error, like DictWriter
+        with pytest.raises(ValueError):
+            flatten({"foo": "bar"})
+        with pytest.raises(ValueError):
+            flatten({"members": [{"id": "gay", "uri": "http://example.com"}]})
+        with pytest.raises(ValueError):
+            flatten({"tags": ["one", "two"]})
+
+
+class TestExportDelta(TestCase):
+    previous = [
+        {"id": "a", "name": "A"},
+        {"id": "b", "name": "B"},
+        {"id": "c", "name": "C"},
+        {"id": "d", "name": "D"},
+    ]
+    # b changed, c removed, e added
+    current = [
+        {"id": "a", "name": "A"},
+        {"id": "b", "name": "Bee"},
+        {"id": "d", "name": "D"},
+        {"id": "e", "name": "E"},
+    ]
+
+    def test_filter(self):
+        delta = ExportDelta(self.previous, key="id")
+        changes = list(delta.filter(self.current))
+        assert changes == [self.current[1], self.current[3]]
+        assert delta.inserted == 2
+        assert delta.removed == 2
+        assert delta.added == ["e"]
+        assert delta.changed == ["b"]
+        assert delta.ops == [
+            ["copy", 0, 1],
+            ["insert", 1],
+            ["copy", 3, 4],
+            ["insert", 1],
+        ]
+
+    def test_manifest(self):
+        delta = ExportDelta(self.previous, key="id")
+        list(delta.filter(self.current))
+        manifest = delta.manifest()
+        assert manifest["previous_total"] == 4
+        assert manifest["total"] == 4
+        assert manifest["deleted"] == ["c"]
+        assert manifest["ops"] == delta.ops
+
+        # without key, only counts and steps
+        delta = ExportDelta(self.previous)
+        list(delta.filter(self.current))
+        manifest = delta.manifest()
+        assert "key" not in manifest
+        assert manifest["inserted"] == 2
+
+    def test_duplicate_records(self):
+        # identical records without key are matched in order
+        previous = [{"n": 1}, {"n": 1}, {"n": 2}]
+        current = [{"n": 1}, {"n": 2}, {"n": 1}]
+        delta = ExportDelta(previous)
+        changes = list(delta.filter(current))
+        assert changes == []
+        assert list(apply_delta(previous, changes, delta.ops)) == current
+
+    def test_apply_delta(self):
+        delta = ExportDelta(self.previous, key="id")
+        changes = list(delta.filter(self.current))
+        assert list(apply_delta(self.previous, changes, delta.ops)) == self.current
+
+    def test_previous_iterator(self):
+        # previous records may be streamed
+        delta = ExportDelta(iter(self.previous), key="id")
+        assert delta.previous_total == 4
+        assert list(delta.filter(self.current)) == [self.current[1], self.current[3]]
+
+
+def test_iter_json_array():
+    records = [
+        {"id": i, "name": "name%d" % i, "years": [1920, 1921]} for i in range(50)
+    ]
+    for indent in [None, 2]:
+        export = json.dumps(records, indent=indent)
+        # items split across chunks are decoded when complete
+        for chunk_size in [1, 7, 1000]:
+            assert list(iter_json_array(StringIO(export), chunk_size)) == records
+    assert list(iter_json_array(StringIO(" [ ] "))) == []
+    # numbers are not split at chunk boundaries
+    assert list(iter_json_array(StringIO("[12345, 6]"), 3)) == [12345, 6]
+    for invalid in ["", "{}", "[1", "[1, 2", "[1 2]", "[1,]", '[{"a": 1']:
+        with pytest.raises(ValueError):
+            list(iter_json_array(StringIO(invalid), 2))
+
+
 @patch("mep.common.management.export.progressbar")
 class TestStreamArray(TestCase):
     def test_init(self, mockprogbar):
@@ -1002,6 +1547,254 @@ class TestStreamArray(TestCase):
         assert streamer.progbar.finish.call_count == 1
 
 
+class TestColumnarWriter(TestCase):
+    fields = [
+        "event_type",
+        "start_date",
+        "member_ids",
+        "member_names",
+        "subscription_price_paid",
+        "subscription_duration_days",
+        "item_year",
+        "updated",
+    ]
+    column_types = {
+        "member_ids": ["string"],
+        "member_names": ["string"],
+        "subscription_price_paid": "float",
+        "subscription_duration_days": "int",
+        "item_year": "int",
+        "updated": "datetime",
+    }
+
+    def test_writerow(self):
+        pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+        tempdir = TemporaryDirectory()
+        path = os.path.join(tempdir.name, "events.parquet")
+        with ColumnarWriter(
+            path, self.fields, self.column_types, row_group_size=2
+        ) as writer:
+            writer.writerow(
+                {
+                    "event_type": "Subscription",
+                    "start_date": "1920-05-01",
+                    "members": [
+                        {"id": "hemingway", "name": "Ernest Hemingway"},
+                        {"id": "gay"},
+                    ],
+                    "subscription": {"price_paid": "12.50", "duration_days": 31},
+                    "updated": "2020-01-01T10:15:00+00:00",
+                }
+            )
+            writer.writerow({"event_type": "Borrow", "start_date": "", "item": {}})
+            writer.writerow({"event_type": "Purchase", "item": {"year": 1922}})
+            # fields not in column names are an error, as for DictWriter
+            with pytest.raises(ValueError):
+                writer.writerow({"event_type": "Borrow", "item": {"uri": "foo"}})
+
+        parquet = pyarrow_parquet.ParquetFile(path)
+        # written in row groups
+        assert parquet.metadata.num_row_groups == 2
+        table = parquet.read()
+        assert table.schema.names == self.fields
+        assert str(table.schema.field("member_ids").type) == "list<element: string>"
+        assert str(table.schema.field("updated").type) == "timestamp[us, tz=UTC]"
+        rows = table.to_pylist()
+        assert rows[0]["member_ids"] == ["hemingway", "gay"]
+        # missing values in list of dict are null
+        assert rows[0]["member_names"] == ["Ernest Hemingway", None]
+        assert rows[0]["subscription_price_paid"] == 12.5
+        assert rows[0]["subscription_duration_days"] == 31
+        assert rows[0]["updated"] == datetime.datetime(
+            2020, 1, 1, 10, 15, tzinfo=datetime.timezone.utc
+        )
+        # empty and missing values are null
+        assert rows[1]["start_date"] is None
+        assert rows[1]["member_ids"] is None
+        assert rows[2]["item_year"] == 1922
+
+    def test_scalar_list(self):
+        pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+        tempdir = TemporaryDirectory()
+        path = os.path.join(tempdir.name, "members.parquet")
+        with ColumnarWriter(path, ["years", "names"], {"years": ["int"]}) as writer:
+            writer.writerow({"years": [1920, 1921], "names": ["a", "b"]})
+            writer.writerow({"years": 1935, "names": []})
+        rows = pyarrow_parquet.read_table(path).to_pylist()
+        assert rows[0] == {"years": [1920, 1921], "names": "a;b"}
+        # single value in a list column, empty list in a string column
+        assert rows[1] == {"years": [1935], "names": None}
+
+
+class TestHashedFile(TestCase):
+    def test_write(self):
+        content = "Shakespeare and Company, 12 rue de l’Odéon"
+        output = StringIO()
+        with HashedFile(output) as hashedfile:
+            hashedfile.write(content)
+            assert output.getvalue() == content
+            # other attributes are passed through to the file
+            assert hashedfile.tell() == len(content)
+        assert output.closed
+        expected = content.encode("utf-8")
+        assert hashedfile.bytes == len(expected)
+        assert hashedfile.hash == "sha256:%s" % hashlib.sha256(expected).hexdigest()
+
+
+class TestExportStats(TestCase):
+    def test_update(self):
+        stats = ExportStats(["id", "year", "members", "updated"])
+        stats.update(("b", 1922, "x;y", datetime.date(2020, 1, 2)))
+        stats.update(("a", None, "", datetime.date(2020, 1, 1)))
+        stats.update(("c", 1920, ["z"], datetime.date(2021, 1, 1)))
+        assert stats.rows == 3
+        fields = stats.fields()
+        assert fields[0] == {
+            "name": "id",
+            "stats": {"nulls": 0, "min": "a", "max": "c"},
+        }
+        assert fields[1]["stats"] == {"nulls": 1, "min": 1920, "max": 1922}
+        # lists are not included in min and max
+        assert fields[2]["stats"] == {"nulls": 1, "min": "x;y", "max": "x;y"}
+        # dates are serialized
+        assert fields[3]["stats"]["max"] == "2021-01-01"
+
+        # mixed types are compared as strings
+        stats.update(("d", "1925?", "", None))
+        assert stats.fields()[1]["stats"]["max"] == "1925?"
+
+
+class TestExportCache(TestCase):
+    fixtures = ["sample_people"]
+
+    def test_absolute_url(self):
+        cache = ExportCache()
+        gay = Person.objects.get(name="Francisque Gay")
+        assert cache.absolute_url(gay) == absolutize_url(gay.get_absolute_url())
+        # calculated only once per object
+        with self.assertNumQueries(0):
+            assert cache.absolute_url(gay) == absolutize_url(
+                reverse("people:member-detail", args=[gay.slug])
+            )
+
+    def test_event_dates(self):
+        cache = ExportCache()
+        account = Person.objects.get(name="Francisque Gay").account_set.first()
+        other_account = Account.objects.create()
+        Event.objects.create(
+            account=account,
+            start_date=datetime.date(1920, 5, 1),
+            end_date=datetime.date(1921, 2, 1),
+        )
+        Event.objects.create(account=account, start_date=datetime.date(1920, 5, 1))
+        Event.objects.create(
+            account=other_account, start_date=datetime.date(1935, 5, 1)
+        )
+        assert cache.event_dates(account) == account.event_dates
+        # dates for all accounts loaded in a single query
+        expected = other_account.event_dates
+        with self.assertNumQueries(0):
+            assert cache.event_dates(other_account) == expected
+        assert cache.event_dates(Account(pk=-1)) == []
+
+    def test_shared_instances(self):
+        cache = ExportCache(shared_models=[Person])
+        assert cache.shared_instances(Person) == {}
+        assert cache.shared_instances(Account) is None
+
+
+class TestExportAll(TestCase):
+    fixtures = ["sample_people"]
+
+    def test_command_line(self):
+        tempdir = TemporaryDirectory()
+        stdout = StringIO()
+        call_command("export_all", "-d", tempdir.name, stdout=stdout)
+        output = stdout.getvalue()
+        for name in [
+            "members",
+            "book_creators",
+            "books",
+            "events",
+            "member_addresses",
+        ]:
+            assert os.path.exists(os.path.join(tempdir.name, "%s.csv" % name))
+            assert os.path.exists(os.path.join(tempdir.name, "%s.json" % name))
+            assert re.search(r"%s: \d+ records in [\d.]+s; \d+ queries" % name, output)
+        assert "Total time" in output
+
+        with open(os.path.join(tempdir.name, "datapackage.json")) as datapackage:
+            info = json.load(datapackage)
+        assert len(info["resources"]) == 5
+        members = info["resources"][0]
+        assert members["name"] == "members"
+        assert members["path"] == "members.csv"
+        assert members["schema"]["fields"][0]["name"] == "id"
+        # checksum and size calculated during export
+        with open(os.path.join(tempdir.name, "members.csv"), "rb") as csvfile:
+            content = csvfile.read()
+        assert members["bytes"] == len(content)
+        assert members["hash"] == "sha256:%s" % hashlib.sha256(content).hexdigest()
+        assert members["rows"] == Person.objects.library_members().count()
+
+        # members and creators should match individual exports
+        individual = TemporaryDirectory()
+        call_command("export_members", "-d", individual.name, stdout=stdout)
+        call_command("export_creators", "-d", individual.name, stdout=stdout)
+        for filename in ["members.json", "book_creators.csv"]:
+            with open(os.path.join(tempdir.name, filename)) as combined:
+                with open(os.path.join(individual.name, filename)) as single:
+                    assert combined.read() == single.read()
+
+    def test_parquet(self):
+        pytest.importorskip("pyarrow")
+        tempdir = TemporaryDirectory()
+        call_command("export_all", "-d", tempdir.name, "--parquet", stdout=StringIO())
+        assert os.path.exists(os.path.join(tempdir.name, "members.parquet"))
+        assert not os.path.exists(os.path.join(tempdir.name, "members.csv"))
+        with open(os.path.join(tempdir.name, "datapackage.json")) as datapackage:
+            info = json.load(datapackage)
+        assert info["resources"][0]["path"] == "members.parquet"
+
+    def test_datapackage_template(self):
+        tempdir = TemporaryDirectory()
+        template = os.path.join(tempdir.name, "template.json")
+        with open(template, "w") as templatefile:
+            json.dump(
+                {
+                    "title": "Dataset",
+                    "resources": [
+                        {
+                            "name": "members",
+                            "path": "old.csv",
+                            "title": "Members",
+                            "schema": {
+                                "fields": [{"name": "id", "title": "Member id"}]
+                            },
+                        }
+                    ],
+                },
+                templatefile,
+            )
+        call_command(
+            "export_all",
+            "-d",
+            tempdir.name,
+            "--datapackage",
+            template,
+            stdout=StringIO(),
+        )
+        with open(os.path.join(tempdir.name, "datapackage.json")) as datapackage:
+            info = json.load(datapackage)
+        assert info["title"] == "Dataset"
+        members = info["resources"][0]
+        assert members["title"] == "Members"
+        assert members["path"] == "members.csv"
+        assert members["schema"]["fields"][0]["title"] == "Member id"
+        assert members["schema"]["fields"][0]["stats"]["nulls"] == 0
+        assert "title" not in members["schema"]["fields"][1]
+
+
 class TestTrackChangesModel(TestCase):
     # track changes functions tested via Person subclass
 
@@ -1030,3 +1823,910 @@ class TestTrackChangesModel(TestCase):
         person.save()
         # should not detect as changed after save
         assert not person.has_changed("slug")
+
+
+def test_response_cache_check():
+    with override_settings(RESPONSE_CACHE=False):
+        assert response_cache_check(None) == []
+    # local memory cache is not shared between processes
+    with override_settings(RESPONSE_CACHE=True):
+        errors = response_cache_check(None)
+        assert len(errors) == 1
+        assert errors[0].id == "common.E001"
+    with override_settings(
+        RESPONSE_CACHE=True,
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}},
+    ):
+        assert response_cache_check(None) == []
+
+
+class TestIndexVersion(TestCase):
+    def setUp(self):
+        IndexVersion.clear()
+
+    def tearDown(self):
+        IndexVersion.clear()
+
+    @patch("mep.common.indexing.SolrClient")
+    def test_fetch(self, mock_solrclient):
+        mock_solr = mock_solrclient.return_value
+        mock_solr.make_request.return_value = AttrDict(
+            {"index": {"version": 1234, "numDocs": 10}}
+        )
+        assert IndexVersion.fetch() == 1234
+        mock_solr.build_url.assert_called_with(
+            mock_solr.solr_url, mock_solr.collection, "admin/luke"
+        )
+        args, kwargs = mock_solr.make_request.call_args
+        assert args == ("get", mock_solr.build_url.return_value)
+        assert kwargs["params"] == {"numTerms": 0, "show": "index"}
+
+        # unavailable if solr returns an error or can't be reached
+        mock_solr.make_request.return_value = None
+        assert IndexVersion.fetch() is None
+        mock_solr.make_request.side_effect = requests.exceptions.ConnectionError
+        assert IndexVersion.fetch() is None
+
+    @patch("mep.common.indexing.time.monotonic")
+    @patch.object(IndexVersion, "fetch")
+    def test_get(self, mock_fetch, mock_monotonic):
+        mock_monotonic.return_value = 100
+        mock_fetch.return_value = 1
+        assert IndexVersion.get() == 1
+        # reused until the ttl has passed
+        mock_fetch.return_value = 2
+        mock_monotonic.return_value = 105
+        assert IndexVersion.get() == 1
+        assert mock_fetch.call_count == 1
+        mock_monotonic.return_value = 106
+        assert IndexVersion.get() == 2
+        assert mock_fetch.call_count == 2
+
+        # failures are not remembered
+        mock_fetch.return_value = None
+        mock_monotonic.return_value = 112
+        assert IndexVersion.get() is None
+        mock_fetch.return_value = 3
+        assert IndexVersion.get() == 3
+        assert mock_fetch.call_count == 4
+
+        # ttl is configurable
+        with override_settings(SOLR_INDEX_VERSION_TTL=0):
+            mock_monotonic.return_value = 113
+            IndexVersion.get()
+            assert mock_fetch.call_count == 5
+
+        # cleared to check again
+        IndexVersion.clear()
+        IndexVersion.get()
+        assert mock_fetch.call_count == 6
+
+
+@patch.object(ModelIndexable, "index_items")
+class TestReindexCoalescer(TestCase):
+    def setUp(self):
+        self.person = Person.objects.create(name="Sylvia", slug="sylvia")
+        self.account = Account.objects.create()
+        self.account.persons.add(self.person)
+
+    def test_not_active(self, mock_indexitems):
+        # no coalescer active, index immediately
+        assert ReindexCoalescer.active() is None
+        ReindexCoalescer.index_items([self.person])
+        mock_indexitems.assert_called_with([self.person])
+
+    def test_coalesce(self, mock_indexitems):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with ReindexCoalescer() as coalescer:
+                assert ReindexCoalescer.active() == coalescer
+                # signal handlers for multiple events
+                for i in range(5):
+                    event = Event.objects.create(account=self.account)
+                    PersonSignalHandlers.event_save(Event, event)
+                    ReindexCoalescer.index_items([self.person])
+                ReindexCoalescer.index_items(Person.objects.all())
+                # nothing indexed yet
+                mock_indexitems.assert_not_called()
+                # nested coalescer adds to the outer one
+                with ReindexCoalescer() as nested:
+                    ReindexCoalescer.index_items([self.person])
+                assert ReindexCoalescer.active() == coalescer
+                assert coalescer.suppressed == 11
+            # inside a transaction, flushed when committed
+            assert ReindexCoalescer.active() is None
+            mock_indexitems.assert_not_called()
+
+        assert len(callbacks) == 1
+        # indexed once, with current records from the database
+        mock_indexitems.assert_called_once()
+        assert list(mock_indexitems.call_args[0][0]) == [self.person]
+        assert ReindexCoalescer.totals["suppressed"] >= 11
+
+    def test_flush(self, mock_indexitems):
+        coalescer = ReindexCoalescer()
+        coalescer.add([self.person, self.person])
+        coalescer.add(Person.objects.none())
+        assert coalescer.requested == 2
+        assert coalescer.suppressed == 1
+        assert coalescer.flush() == 1
+        assert not coalescer.pending
+        assert coalescer.requested == 0
+        # deleted items are skipped
+        coalescer.add([self.person])
+        self.person.delete()
+        coalescer.flush()
+        assert list(mock_indexitems.call_args[0][0]) == []
+
+    def test_decorator(self, mock_indexitems):
+        @ReindexCoalescer()
+        def save_events():
+            for i in range(3):
+                ReindexCoalescer.index_items([self.person])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            save_events()
+        # person reindexed once
+        assert mock_indexitems.call_count == 1
+
+    def test_middleware(self, mock_indexitems):
+        def get_response(request):
+            for i in range(3):
+                ReindexCoalescer.index_items([self.person])
+            return "response"
+
+        middleware = ReindexCoalescerMiddleware(get_response)
+        with self.captureOnCommitCallbacks(execute=True):
+            assert middleware(Mock()) == "response"
+        assert mock_indexitems.call_count == 1
+
+    @override_settings(SOLR_INDEX_QUEUE=True)
+    def test_queue(self, mock_indexitems):
+        # no coalescer active, add to the queue immediately
+        ReindexCoalescer.index_items(Person.objects.all(), reason="test")
+        item = IndexQueueItem.objects.get()
+        assert item.object_id == self.person.pk
+        assert item.reason == "test"
+        # coalesced, added when flushed
+        with self.captureOnCommitCallbacks(execute=True):
+            with ReindexCoalescer():
+                ReindexCoalescer.index_items([self.person], reason="event save")
+                ReindexCoalescer.index_items([self.person])
+        # not duplicated; marked as queued again
+        item2 = IndexQueueItem.objects.get()
+        assert item2.reason == "event save"
+        assert item2.queued > item.queued
+        mock_indexitems.assert_not_called()
+
+    @patch.object(ModelIndexable, "solr")
+    def test_partial(self, mock_solr, mock_indexitems):
+        coalescer = ReindexCoalescer()
+        coalescer.add([self.person], fields=["activity"])
+        coalescer.add([self.person], fields=["nationality"])
+        assert coalescer.pending[Person][self.person.pk] == (
+            "",
+            {"activity", "nationality"},
+        )
+        coalescer.flush()
+        # atomic update only, no full reindex
+        mock_indexitems.assert_not_called()
+        doc = mock_solr.update.index.call_args[0][0][0]
+        assert doc["id"] == self.person.index_id()
+        assert doc["last_modified"] == {"set": "NOW"}
+        assert doc["nationality"] == {"set": []}
+        assert doc["account_start_i"] == {"set": None}
+        assert "sort_name_isort" not in doc
+
+        # full reindex takes precedence over partial update
+        coalescer.add([self.person], fields=["activity"])
+        coalescer.add([self.person])
+        coalescer.add([self.person], fields=["nationality"])
+        assert coalescer.pending[Person][self.person.pk] == ("", None)
+        mock_solr.reset_mock()
+        coalescer.flush()
+        mock_indexitems.assert_called_once()
+        mock_solr.update.index.assert_not_called()
+
+    def test_partial_index_data(self, mock_indexitems):
+        event = Event.objects.create(
+            account=self.account, start_date=datetime.date(1920, 1, 5)
+        )
+        doc = self.person.partial_index_data(["activity"])
+        full_data = self.person.index_data()
+        # partial update matches the full index data for those fields
+        for field in Person.index_field_providers["activity"][1]:
+            assert doc[field] == {"set": full_data.get(field)}
+        assert doc["account_start_i"] == {"set": 1920}
+        assert Person.index_fields("accounts.Event") == ["activity"]
+        assert Person.index_fields("accounts.Account") is None
+
+
+class TestIndexWorker(TestCase):
+    def setUp(self):
+        self.person = Person.objects.create(name="Sylvia", slug="sylvia")
+        self.account = Account.objects.create()
+        self.account.persons.add(self.person)
+        self.other = Person.objects.create(name="Adrienne", slug="adrienne")
+        IndexQueueItem.enqueue(Person, [self.person.pk, self.other.pk], "test")
+
+    @patch.object(ModelIndexable, "solr")
+    def test_command_line(self, mock_solr):
+        stdout = StringIO()
+        call_command("index_worker", "--once", "-c", "1000", stdout=stdout)
+        assert "Indexed 2 records" in stdout.getvalue()
+        indexed = mock_solr.update.index.call_args[0][0]
+        assert set(doc["id"] for doc in indexed) == {
+            self.person.index_id(),
+            self.other.index_id(),
+        }
+        assert mock_solr.update.index.call_args[1]["commitWithin"] == 1000
+        assert not IndexQueueItem.objects.exists()
+
+    @patch.object(ModelIndexable, "solr")
+    def test_batches(self, mock_solr):
+        stdout = StringIO()
+        call_command("index_worker", "--once", "-b", "1", stdout=stdout)
+        assert "Indexed 2 records" in stdout.getvalue()
+        assert mock_solr.update.index.call_count == 2
+
+    @patch.object(ModelIndexable, "solr")
+    def test_retry(self, mock_solr):
+        mock_solr.update.index.side_effect = ConnectionError("solr is down")
+        stdout = StringIO()
+        stderr = StringIO()
+        call_command("index_worker", "--once", stdout=stdout, stderr=stderr)
+        assert "Indexed 0 records" in stdout.getvalue()
+        assert "solr is down" in stderr.getvalue()
+        # items are retried later
+        for item in IndexQueueItem.objects.all():
+            assert item.attempts == 1
+            assert item.last_error == "solr is down"
+            assert item.next_attempt > timezone.now()
+        assert not IndexQueueItem.ready().exists()
+
+        # backoff doubles for each attempt, up to the maximum
+        cmd = index_worker.Command(stderr=stderr)
+        cmd.backoff = 10
+        cmd.max_backoff = 30
+        items = list(IndexQueueItem.objects.all())
+        cmd.retry_later(items, "error")
+        cmd.retry_later(items, "error")
+        item = IndexQueueItem.objects.first()
+        assert item.attempts == 3
+        delay = (item.next_attempt - timezone.now()).total_seconds()
+        assert 25 < delay <= 30
+
+        # queueing again resets failed attempts
+        IndexQueueItem.enqueue(Person, [self.person.pk], "changed")
+        item = IndexQueueItem.objects.get(object_id=self.person.pk)
+        assert item.reason == "changed"
+        assert item.attempts == 0
+        assert item.next_attempt <= timezone.now()
+        assert list(IndexQueueItem.ready()) == [item]
+
+    @patch.object(ModelIndexable, "solr")
+    def test_requeued(self, mock_solr):
+        # records queued again while being indexed are not removed
+        def requeue(*args, **kwargs):
+            IndexQueueItem.enqueue(Person, [self.person.pk])
+
+        mock_solr.update.index.side_effect = requeue
+        cmd = index_worker.Command(stdout=StringIO())
+        cmd.verbosity = 1
+        assert cmd.process_batch(100, 1000) == (2, 0)
+        assert IndexQueueItem.objects.get().object_id == self.person.pk
+
+        # deleted records are skipped
+        self.person.delete()
+        assert cmd.process_batch(100, 1000) == (1, 0)
+        assert not IndexQueueItem.objects.exists()
+
+
+class TestParallelIndex(TestCase):
+    def setUp(self):
+        self.people = []
+        for i in range(3):
+            person = Person.objects.create(name="Member %d" % i, slug="member-%d" % i)
+            account = Account.objects.create()
+            account.persons.add(person)
+            self.people.append(person)
+        # not a library member, so not indexed
+        Person.objects.create(name="Author", slug="author")
+
+    def test_shard_ranges(self):
+        pks = [person.pk for person in self.people]
+        assert parallel_index.Command.shard_ranges(Person, 2) == [
+            (pks[0], pks[1]),
+            (pks[2], pks[2]),
+        ]
+        assert parallel_index.Command.shard_ranges(Person, 5) == [
+            (pk, pk) for pk in pks
+        ]
+        with patch.object(Person, "items_to_index", return_value=Person.objects.none()):
+            assert parallel_index.Command.shard_ranges(Person, 2) == []
+
+    @patch("mep.common.management.commands.parallel_index.SolrClient")
+    def test_command_line(self, mock_solrclient):
+        mock_solr = mock_solrclient.return_value
+        mock_solr.update.params = {"commitWithin": 1000}
+        stdout = StringIO()
+        with patch.object(Person, "prep_index") as mock_prep_index:
+            call_command(
+                "parallel_index",
+                "-i",
+                "person",
+                "-w",
+                "1",
+                "-s",
+                "2",
+                "-b",
+                "1",
+                "--slowest",
+                "2",
+                stdout=stdout,
+            )
+        # models are prepared once, before indexing shards
+        mock_prep_index.assert_called_once_with()
+        # one batch per document, and a single commit at the end
+        index_calls = mock_solr.update.index.call_args_list
+        assert len(index_calls) == 4
+        indexed = [call.args[0][0]["id"] for call in index_calls[:3]]
+        assert indexed == [person.index_id() for person in self.people]
+        assert index_calls[-1].args[0] == []
+        assert index_calls[-1].kwargs == {"commit": True}
+        # documents are not committed by workers
+        assert "commitWithin" not in mock_solr.update.params
+
+        output = stdout.getvalue()
+        assert "person: 3 items" in output
+        assert "docs/sec" in output
+        assert "Slowest documents:" in output
+        assert len(re.findall(r"person\.\d+: ", output)) == 2
+        assert "Indexed 3 items" in output
+
+    @patch("mep.common.management.commands.parallel_index.get_solr")
+    def test_rebuild(self, mock_get_solr):
+        # local stand-in for solr cores, keyed on core name
+        cores = {"shxco": {"person.old": {"id": "person.old"}}}
+
+        def get_solr(collection=None):
+            solr = Mock()
+            core = cores.setdefault(collection or "shxco", {})
+            solr.update.params = {}
+            solr.update.index.side_effect = lambda docs, **kwargs: core.update(
+                (doc["id"], doc) for doc in docs
+            )
+            solr.core_admin.create.side_effect = (
+                lambda name, **kwargs: cores.setdefault(name, {})
+            )
+            solr.core_admin.ping.side_effect = lambda name: name in cores
+
+            def swap(meth, url, params):
+                live, other = params["core"], params["other"]
+                cores[live], cores[other] = cores[other], cores[live]
+                return {"responseHeader": {"status": 0}}
+
+            solr.core_admin.make_request.side_effect = swap
+            solr.query.side_effect = lambda fq, **kwargs: Mock(
+                numFound=len(
+                    [
+                        doc
+                        for doc in core.values()
+                        if "item_type:%s" % doc.get("item_type") == fq
+                    ]
+                )
+            )
+            return solr
+
+        mock_get_solr.side_effect = get_solr
+        stdout = StringIO()
+        with override_settings(
+            SOLR_CONNECTIONS={
+                "default": {"URL": "", "COLLECTION": "shxco", "CONFIGSET": "shxco"}
+            }
+        ):
+            with patch.object(Indexable, "all_indexables", return_value=[Person]):
+                call_command("parallel_index", "--rebuild", "-w", "1", stdout=stdout)
+        # live core swapped with the rebuilt index; previous index kept
+        assert set(cores["shxco"]) == {person.index_id() for person in self.people}
+        previous = [name for name in cores if name != "shxco"][0]
+        assert set(cores[previous]) == {"person.old"}
+        assert "Swapped %s into shxco" % previous in stdout.getvalue()
+
+        # roll back
+        with override_settings(
+            SOLR_CONNECTIONS={"default": {"URL": "", "COLLECTION": "shxco"}}
+        ):
+            call_command("parallel_index", "--rollback", previous, stdout=stdout)
+        assert set(cores["shxco"]) == {"person.old"}
+
+        # existing core is not reused
+        with override_settings(
+            SOLR_CONNECTIONS={
+                "default": {"URL": "", "COLLECTION": "shxco", "CONFIGSET": "shxco"}
+            }
+        ):
+            with patch(
+                "mep.common.management.commands.parallel_index.timezone"
+            ) as mock_tz:
+                mock_tz.now.return_value.strftime.return_value = previous[6:]
+                with self.assertRaises(CommandError):
+                    call_command("parallel_index", "--rebuild", "-w", "1")
+
+        # counts don't match; live core is not swapped
+        del cores[previous]
+        cores["shxco"] = {}
+        with override_settings(
+            SOLR_CONNECTIONS={
+                "default": {"URL": "", "COLLECTION": "shxco", "CONFIGSET": "shxco"}
+            }
+        ):
+            with patch.object(Indexable, "all_indexables", return_value=[Person]):
+                with patch.object(Person, "index_data", return_value={"id": "x"}):
+                    with self.assertRaises(CommandError):
+                        call_command("parallel_index", "--rebuild", "-w", "1")
+        assert cores["shxco"] == {}
+
+        # rebuild requires all content
+        with self.assertRaises(CommandError):
+            call_command("parallel_index", "--rebuild", "-i", "person")
+
+
+class TestCheckIndex(TestCase):
+    def setUp(self):
+        self.people = []
+        for i in range(3):
+            person = Person.objects.create(name="Member %d" % i, slug="member-%d" % i)
+            account = Account.objects.create()
+            account.persons.add(person)
+            self.people.append(person)
+
+    def test_content_hash(self):
+        data = self.people[0].index_data()
+        assert data[CONTENT_HASH_FIELD] == content_hash(data)
+        # independent of key order and the hash itself
+        assert content_hash(dict(reversed(data.items()))) == data[CONTENT_HASH_FIELD]
+        data["name_t"] = "Someone else"
+        assert content_hash(data) != data[CONTENT_HASH_FIELD]
+        # cleared by partial updates
+        assert self.people[0].partial_index_data(["nationality"])[
+            CONTENT_HASH_FIELD
+        ] == {"set": None}
+
+    @patch("mep.common.management.commands.check_index.SolrClient")
+    def test_command_line(self, mock_solrclient):
+        current, stale, missing = self.people
+        mock_solr = mock_solrclient.return_value
+        # results returned in two pages
+        mock_solr.query.side_effect = [
+            AttrDict(
+                nextCursorMark="page2",
+                response={
+                    "docs": [
+                        {
+                            "id": current.index_id(),
+                            "last_modified": "2020-01-01T00:00:00Z",
+                            CONTENT_HASH_FIELD: current.index_data()[
+                                CONTENT_HASH_FIELD
+                            ],
+                        },
+                        {"id": stale.index_id(), CONTENT_HASH_FIELD: "old"},
+                    ]
+                },
+            ),
+            AttrDict(nextCursorMark="page3", response={"docs": [{"id": "person.0"}]}),
+            AttrDict(nextCursorMark="page3", response={"docs": []}),
+        ]
+        stdout = StringIO()
+        call_command("check_index", "-i", "person", "-b", "2", "-v", "2", stdout=stdout)
+        assert mock_solr.query.call_count == 3
+        assert mock_solr.query.call_args_list[1].kwargs["cursorMark"] == "page2"
+        assert mock_solr.query.call_args.kwargs["fq"] == "id:person.*"
+        output = stdout.getvalue()
+        assert "person: 1 missing, 1 stale, 1 orphaned" in output
+        assert "missing %s" % missing.index_id() in output
+        assert "stale %s" % stale.index_id() in output
+        assert "orphaned person.0" in output
+        # only missing and stale documents are reindexed
+        reindexed = mock_solr.update.index.call_args[0][0]
+        assert set(doc["id"] for doc in reindexed) == {
+            stale.index_id(),
+            missing.index_id(),
+        }
+        mock_solr.update.delete_by_id.assert_called_with(["person.0"])
+
+        # dry run
+        mock_solr.reset_mock()
+        mock_solr.query.side_effect = [
+            AttrDict(nextCursorMark="*", response={"docs": []})
+        ]
+        call_command("check_index", "-i", "person", "--dry-run", stdout=stdout)
+        assert "person: 3 missing, 0 stale, 0 orphaned" in stdout.getvalue()
+        mock_solr.update.index.assert_not_called()
+        mock_solr.update.delete_by_id.assert_not_called()
+
+
+class TestSurrogateKeys(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_versions(self):
+        person = Person.objects.create(name="Sylvia", slug="sylvia")
+        key = SurrogateKeys.for_item(person)
+        assert key == "person:%s" % person.pk
+        versions = SurrogateKeys.versions(["all", key])
+        assert set(versions) == {"all", key}
+        assert SurrogateKeys.versions(["all", key]) == versions
+        SurrogateKeys.purge([key])
+        new_versions = SurrogateKeys.versions(["all", key])
+        assert new_versions["all"] == versions["all"]
+        assert new_versions[key] != versions[key]
+
+    def test_purge_items(self):
+        person = Person.objects.create(name="Sylvia", slug="sylvia")
+        key = SurrogateKeys.for_item(person)
+        versions = SurrogateKeys.versions(["all", "person", key])
+        SurrogateKeys.purge_items(Person, [person.pk])
+        new_versions = SurrogateKeys.versions(["all", "person", key])
+        assert new_versions["all"] == versions["all"]
+        assert new_versions["person"] != versions["person"]
+        assert new_versions[key] != versions[key]
+
+        # purged by signal handlers when indexed records change
+        person.save()
+        assert SurrogateKeys.versions([key])[key] != new_versions[key]
+
+
+def solr_response(docs=None, num_found=None, **kwargs):
+    # minimal Solr query response for testing
+    docs = docs or []
+    return AttrDict(
+        responseHeader={"params": {}},
+        response={
+            "numFound": len(docs) if num_found is None else num_found,
+            "start": 0,
+            "docs": docs,
+        },
+        **kwargs,
+    )
+
+
+@patch.object(CountingSolrClient, "make_request")
+class TestSolrQueryCounter(TestCase):
+    def test_count(self, mock_request):
+        mock_request.return_value = solr_response()
+        with SolrQueryCounter() as counter:
+            CountingSolrClient().query(q="*:*")
+            # nested counters count queries while active
+            with SolrQueryCounter() as nested:
+                AliasedSolrQuerySet().count()
+            assert nested.count == 1
+        assert counter.count == 2
+        # not counted when no counter is active
+        AliasedSolrQuerySet().count()
+        assert counter.count == 2
+        assert SolrQueryCounter.active() == []
+
+        # decorated functions count with a new counter each time
+        @SolrQueryCounter()
+        def query():
+            CountingSolrClient().query(q="*:*")
+            return SolrQueryCounter.active()[0].count
+
+        assert query() == 1
+        assert query() == 1
+
+
+@patch.object(CountingSolrClient, "make_request")
+class TestAliasedSolrQuerySet(TestCase):
+    def test_last_modified_aggregate(self, mock_request):
+        sqs = AliasedSolrQuerySet().last_modified_aggregate(item_type="person")
+        facet = json.loads(sqs.raw_params["json.facet"])
+        assert facet["last_modified"]["domain"] == {"query": ["item_type:person"]}
+        assert facet["last_modified"]["facet"] == {"max": "max(last_modified)"}
+        # domain is all documents if no filters
+        sqs = AliasedSolrQuerySet().last_modified_aggregate()
+        facet = json.loads(sqs.raw_params["json.facet"])
+        assert facet["last_modified"]["domain"] == {"query": "*:*"}
+
+    def test_get_last_modified(self, mock_request):
+        sqs = AliasedSolrQuerySet().last_modified_aggregate(item_type="person")
+        # not queried yet
+        assert sqs.get_last_modified() is None
+        assert not mock_request.call_count
+
+        mock_request.return_value = solr_response(
+            facets={
+                "count": 1,
+                "last_modified": {"count": 1, "max": "2020-05-01T12:30:00.123Z"},
+            }
+        )
+        sqs.get_results()
+        assert sqs.get_last_modified() == datetime.datetime(2020, 5, 1, 12, 30)
+
+        # aggregate not requested or no matching documents
+        mock_request.return_value = solr_response()
+        sqs = AliasedSolrQuerySet()
+        sqs.get_results()
+        assert sqs.get_last_modified() is None
+
+    def test_without_facets(self, mock_request):
+        sqs = (
+            AliasedSolrQuerySet()
+            .filter(item_type="person")
+            .facet_field("gender")
+            .facet_range("birth_year", start=1900, end=1950, gap=10)
+            .stats("birth_year")
+            .highlight("name")
+            .last_modified_aggregate()
+            .raw_query_parameters(name_query="A")
+        )
+        plain_sqs = sqs.without_facets()
+        assert plain_sqs.filter_qs == sqs.filter_qs
+        assert not plain_sqs.facet_field_list
+        assert not plain_sqs.range_facet_fields
+        assert not plain_sqs.facet_opts
+        assert not plain_sqs.stats_field_list
+        assert not plain_sqs.highlight_fields
+        assert plain_sqs.raw_params == {"name_query": "A"}
+        # original queryset is unchanged
+        assert sqs.facet_field_list
+        assert "json.facet" in sqs.raw_params
+
+
+@patch.object(CountingSolrClient, "make_request")
+class TestSolrPaginator(TestCase):
+    def test_page(self, mock_request):
+        docs = [{"id": "person.%d" % i} for i in range(10)]
+        mock_request.return_value = solr_response(
+            docs=docs,
+            num_found=25,
+            facet_counts={"facet_fields": {"gender": ["Female", 12]}},
+        )
+        sqs = AliasedSolrQuerySet().facet_field("gender")
+        paginator = SolrPaginator(sqs, 10)
+        with SolrQueryCounter() as counter:
+            page = paginator.page("2")
+            assert list(page.object_list) == docs
+            # count and facets come from the same response
+            assert paginator.count == 25
+            assert paginator.num_pages == 3
+            assert sqs.count() == 25
+            assert sqs.get_facets()["facet_fields"]["gender"] == {"Female": 12}
+        assert counter.count == 1
+        params = mock_request.call_args.kwargs["params"]
+        assert params["start"] == 10
+        assert params["rows"] == 10
+
+        # other pages are not queried until used
+        with SolrQueryCounter() as counter:
+            page = paginator.page(3)
+            assert page.start_index() == 21
+            assert page.end_index() == 25
+        assert counter.count == 0
+        with pytest.raises(EmptyPage):
+            paginator.page(4)
+
+    def test_invalid_page(self, mock_request):
+        mock_request.return_value = solr_response(num_found=5)
+        paginator = SolrPaginator(AliasedSolrQuerySet(), 10)
+        with pytest.raises(PageNotAnInteger):
+            paginator.page("one")
+        with pytest.raises(EmptyPage):
+            paginator.page(0)
+        assert not mock_request.call_count
+        # beyond the last page
+        with pytest.raises(EmptyPage):
+            paginator.page(2)
+
+        # empty first page is allowed
+        mock_request.return_value = solr_response()
+        paginator = SolrPaginator(AliasedSolrQuerySet(), 10)
+        assert paginator.page(1).number == 1
+        assert paginator.count == 0
+
+        # solr error
+        mock_request.return_value = None
+        paginator = SolrPaginator(AliasedSolrQuerySet(), 10)
+        assert paginator.page(1).number == 1
+        assert paginator.count == 0
+
+
+@patch.object(CountingSolrClient, "make_request")
+class TestSolrPageLabels(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def mock_results(self, mock_request, names):
+        # respond with the requested rows from a list of sort names
+        def query(method, url, params=None, **kwargs):
+            start = params.get("start", 0)
+            docs = [{"sort_s": name} for name in names[start : start + params["rows"]]]
+            return solr_response(docs=docs, num_found=len(names))
+
+        mock_request.side_effect = query
+
+    def test_page_boundaries(self, mock_request):
+        names = ["name%03d" % i for i in range(25)]
+        self.mock_results(mock_request, names)
+        boundaries = PageBoundaries(AliasedSolrQuerySet(), 10)
+        with SolrQueryCounter() as counter:
+            assert boundaries[0] == {"sort_s": "name000"}
+            # end of one page and start of the next are retrieved together
+            assert boundaries[9] == {"sort_s": "name009"}
+            assert boundaries[10] == {"sort_s": "name010"}
+            assert boundaries[24] == {"sort_s": "name024"}
+        assert counter.count == 3
+
+        # only search, filters, sort and fields are used for boundaries
+        sqs = (
+            AliasedSolrQuerySet()
+            .search("name:A*")
+            .filter(item_type="person")
+            .order_by("sort_s")
+            .only("sort_s")
+            .facet_field("gender")
+            .stats("birth_year")
+            .last_modified_aggregate(item_type="person")
+            .raw_query_parameters(name_query="A")
+        )
+        PageBoundaries(sqs, 10)[0]
+        params = mock_request.call_args[1]["params"]
+        assert params["q"] == "name:A*"
+        assert params["fq"] == ["item_type:person"]
+        assert params["sort"] == "sort_s asc"
+        assert params["fl"] == "sort_s:sort_s"
+        assert params["name_query"] == "A"
+        for param in ["facet", "facet.field", "stats", "stats.field", "json.facet"]:
+            assert param not in params
+
+    @patch.object(IndexVersion, "get")
+    def test_solr_pagelabels(self, mock_version, mock_request):
+        mock_version.return_value = 1
+        names = ["Abbot", "Adams", "Baker", "Barnes", "Carter"]
+        self.mock_results(mock_request, names)
+        sqs = AliasedSolrQuerySet().order_by("sort_s")
+        paginator = SolrPaginator(sqs, 2)
+        paginator.page(1)
+        with SolrQueryCounter() as counter:
+            labels = solr_pagelabels(
+                paginator, sqs.only("sort_s"), itemgetter("sort_s")
+            )
+        # matches labels generated from all results
+        assert labels == alpha_pagelabels(
+            Paginator(names, 2),
+            [{"sort_s": name} for name in names],
+            itemgetter("sort_s"),
+        )
+        # no more than one query for each page
+        assert counter.count == 3
+
+        # cached for the same query until the index changes
+        with SolrQueryCounter() as counter:
+            assert (
+                solr_pagelabels(paginator, sqs.only("sort_s"), itemgetter("sort_s"))
+                == labels
+            )
+            assert counter.count == 0
+            solr_pagelabels(
+                paginator, sqs.only("sort_s"), itemgetter("sort_s"), max_chars=2
+            )
+            assert counter.count == 3
+            mock_version.return_value = 2
+            solr_pagelabels(paginator, sqs.only("sort_s"), itemgetter("sort_s"))
+            assert counter.count == 6
+            # not cached if the index version is unavailable
+            mock_version.return_value = None
+            solr_pagelabels(paginator, sqs.only("sort_s"), itemgetter("sort_s"))
+            solr_pagelabels(paginator, sqs.only("sort_s"), itemgetter("sort_s"))
+            assert counter.count == 12
+
+
+@override_settings(SOLR_QUERY_CACHE=True)
+@patch.object(CountingSolrClient, "make_request")
+class TestSolrQueryCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        SolrQueryCache.clear()
+        SolrQueryCache.stats.clear()
+        version_patcher = patch.object(IndexVersion, "get", return_value=1)
+        self.mock_version = version_patcher.start()
+        self.addCleanup(version_patcher.stop)
+
+    def test_query(self, mock_request):
+        mock_request.return_value = solr_response(docs=[{"id": "person.1"}])
+
+        def person_qs():
+            return (
+                AliasedSolrQuerySet().filter(item_type="person").filter(id="person.1")
+            )
+
+        with SolrQueryCounter() as counter:
+            assert person_qs().get_results() == [{"id": "person.1"}]
+            AliasedSolrQuerySet().filter(item_type="person").get_results()
+            # cached in memory
+            results = person_qs().get_results()
+            assert results == [{"id": "person.1"}]
+        assert counter.count == 2
+        assert counter.cache_hits == 1
+        assert mock_request.call_count == 2
+        # changes to results don't affect the cache
+        results[0]["id"] = "changed"
+        # normalized so filter order doesn't matter
+        sqs = AliasedSolrQuerySet().filter(id="person.1").filter(item_type="person")
+        assert sqs.get_results() == [{"id": "person.1"}]
+
+        # shared through the django cache
+        SolrQueryCache.clear()
+        assert person_qs().get_results() == [{"id": "person.1"}]
+        assert mock_request.call_count == 2
+        assert SolrQueryCache.stats == {
+            "misses": 2,
+            "memory_hits": 2,
+            "shared_hits": 1,
+        }
+
+        # not reused when the index changes
+        self.mock_version.return_value = 2
+        person_qs().get_results()
+        assert mock_request.call_count == 3
+
+        # not cached if the index version is unavailable
+        self.mock_version.return_value = None
+        person_qs().get_results()
+        person_qs().get_results()
+        assert mock_request.call_count == 5
+        self.mock_version.return_value = 2
+
+        # errors are not cached
+        mock_request.return_value = None
+        assert AliasedSolrQuerySet().filter(id="person.2").get_results() == []
+        assert AliasedSolrQuerySet().filter(id="person.2").get_results() == []
+        assert mock_request.call_count == 7
+
+        # not cached if disabled
+        mock_request.return_value = solr_response()
+        with override_settings(SOLR_QUERY_CACHE=False):
+            CachingSolrClient().query(q="*:*")
+            CachingSolrClient().query(q="*:*")
+        assert mock_request.call_count == 9
+
+    @override_settings(SOLR_QUERY_CACHE_LOG_INTERVAL=4)
+    def test_totals(self, mock_request):
+        mock_request.return_value = solr_response()
+        assert SolrQueryCache.totals()["hit_rate"] == 0
+        solr = CachingSolrClient()
+        with self.assertLogs("mep.common.solr", level="INFO") as logs:
+            solr.query(q="one")
+            solr.query(q="one")
+            solr.query(q="two")
+            SolrQueryCache.clear()
+            solr.query(q="one")
+        assert SolrQueryCache.totals() == {
+            "lookups": 4,
+            "memory_hits": 1,
+            "shared_hits": 1,
+            "misses": 2,
+            "hit_rate": 50,
+        }
+        # logged once every interval
+        assert len(logs.output) == 1
+        assert "4 lookups, 1 memory hits, 1 shared hits, 2 misses" in logs.output[0]
+        assert "50.0% hit rate" in logs.output[0]
+
+    @override_settings(SOLR_QUERY_CACHE_SIZE=1)
+    def test_lru(self, mock_request):
+        mock_request.return_value = solr_response()
+        solr = CachingSolrClient()
+        solr.query(q="one")
+        solr.query(q="two")
+        assert len(SolrQueryCache._responses) == 1
+        # least recently used is only in the django cache
+        solr.query(q="one")
+        assert SolrQueryCache.stats["shared_hits"] == 1
+        solr.query(q="one")
+        assert SolrQueryCache.stats["memory_hits"] == 1
+        # grouped responses are wrapped the same way
+        mock_request.return_value = solr_response(grouped={})
+        assert isinstance(solr.query(q="three"), GroupedResponse)
+        assert isinstance(solr.query(q="three"), GroupedResponse)
+        assert isinstance(solr.query(q="three", wrap=False), AttrDict)
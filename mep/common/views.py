@@ -1,14 +1,26 @@
 import calendar
+import hashlib
+import json
+import logging
 
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import Http404, JsonResponse
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, JsonResponse
 from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
 from django.views.generic.base import ContextMixin, TemplateResponseMixin, View
 from parasolr.django.queryset import SolrQuerySet
 from parasolr.utils import solr_timestamp_to_datetime
 import rdflib
 
+from mep import __version__
 from mep.common import SCHEMA_ORG
+from mep.common.indexing import IndexVersion, SurrogateKeys
+from mep.common.solr import AliasedSolrQuerySet, CountingSolrClient, SolrQueryCounter
+
+
+logger = logging.getLogger(__name__)
 
 
 class LoginRequiredOr404Mixin(LoginRequiredMixin):
@@ -69,15 +81,26 @@ class LabeledPagesMixin(ContextMixin):
         return response
 
 
+#: characters to escape in JSON-LD embedded in a script tag; same as
+#: :func:`django.utils.html.json_script`
+JSONLD_ESCAPES = {ord(">"): "\\u003E", ord("<"): "\\u003C", ord("&"): "\\u0026"}
+
+
 class RdfViewMixin(ContextMixin):
     """View mixin to add an RDF linked data graph to context for use in serializing
-    and embedding structured data in templates."""
+    and embedding structured data in templates.
+
+    JSON-LD is generated directly from plain dictionaries with
+    :meth:`as_jsonld`; set **RDF_JSONLD_RDFLIB** in settings to serialize
+    the :mod:`rdflib` graph from :meth:`as_rdf` instead."""
 
     #: default schema.org type for a View
     rdf_type = SCHEMA_ORG.WebPage
     #: breadcrumbs, used to render breadcrumb navigation. they should be a list
     #: of tuples like ('Title', '/url')
     breadcrumbs = []
+    #: JSON-LD context for :meth:`as_jsonld`
+    jsonld_context = {"schema": str(SCHEMA_ORG)}
 
     def get_context_data(self, *args, **kwargs):
         """Add generated breadcrumbs and an RDF graph to the view context."""
@@ -91,16 +114,52 @@ class RdfViewMixin(ContextMixin):
 
     def add_rdf_to_context(self, context):
         """add jsonld and breadcrumb list to context dictionary"""
+        if getattr(settings, "RDF_JSONLD_RDFLIB", False):
+            page_jsonld = self.as_rdf().serialize(format="json-ld", auto_compact=True)
+        else:
+            page_jsonld = json.dumps(self.as_jsonld()).translate(JSONLD_ESCAPES)
         context.update(
             {
-                "page_jsonld": self.as_rdf().serialize(
-                    format="json-ld", auto_compact=True
-                ),
+                "page_jsonld": page_jsonld,
                 "breadcrumbs": self.get_breadcrumbs(),
             }
         )
         return context
 
+    def jsonld_term(self, uri):
+        """Compact a schema.org URI to a term for :meth:`as_jsonld`;
+        other URIs are returned unchanged."""
+        uri = str(uri)
+        if uri.startswith(str(SCHEMA_ORG)):
+            return "schema:%s" % uri[len(str(SCHEMA_ORG)) :]
+        return uri
+
+    def as_jsonld(self):
+        """Generate JSON-LD representing the page, as a dictionary. Describes
+        the same graph as :meth:`as_rdf`, with breadcrumbs as nested
+        (blank) nodes, without the overhead of building an :mod:`rdflib`
+        graph."""
+        page = {
+            "@context": self.jsonld_context,
+            "@id": self.get_absolute_url(),
+            "@type": self.jsonld_term(self.rdf_type),
+        }
+        breadcrumbs = self.get_breadcrumbs()
+        if breadcrumbs:
+            page["schema:breadcrumb"] = {
+                "@type": "schema:BreadcrumbList",
+                "schema:itemListElement": [
+                    {
+                        "@type": "schema:ListItem",
+                        "schema:name": str(crumb[0]),
+                        "schema:item": str(crumb[1]),
+                        "schema:position": pos + 1,
+                    }
+                    for pos, crumb in enumerate(breadcrumbs)
+                ],
+            }
+        return page
+
     def get_absolute_url(self):
         """Get a URI for this page to use for making RDF assertions. Note that
         this should return a full absolute path, e.g. with absolutize_url()."""
@@ -179,7 +238,12 @@ class AjaxTemplateMixin(TemplateResponseMixin, VaryOnHeadersMixin):
     def dispatch(self, request, *args, **kwargs):
         """Set a total result header on the response"""
         response = super(AjaxTemplateMixin, self).dispatch(request, *args, **kwargs)
-        response["X-Total-Results"] = self.get_queryset().count()
+        # use the view's queryset if it has already been evaluated,
+        # rather than querying for the count again
+        object_list = getattr(self, "object_list", None)
+        if object_list is None:
+            object_list = self.get_queryset()
+        response["X-Total-Results"] = object_list.count()
         return response
 
 
@@ -207,8 +271,115 @@ class FacetJSONMixin(TemplateResponseMixin, VaryOnHeadersMixin):
 # last modified view mixin adapted from ppa
 
 
+class RangeStatsMixin:
+    """View mixin to get minimum and maximum values for range fields from
+    Solr stats. Values only change when the index changes, so they are
+    calculated once for each :class:`~mep.common.indexing.IndexVersion`,
+    shared through the Django cache, and kept in memory until the version
+    changes; they are not cached if the version is unavailable."""
+
+    #: mappings for Solr field names to form aliases
+    range_field_map = {}
+    #: fields to generate stats on
+    stats_fields = ()
+
+    #: range stats in memory, as a tuple of index version and stats
+    #: keyed on view class name
+    _range_stats = {}
+
+    def get_stats_queryset(self):
+        """Solr queryset to use for calculating range stats."""
+        raise NotImplementedError
+
+    def get_range_stats(self):
+        """Return the min and max for fields specified in
+        :attr:`stats_fields` for the current index version, calculating
+        them if needed.
+
+        :returns: Dictionary keyed on form field name with a tuple of
+            (min, max) as integers.
+        :rtype: dict
+        """
+        name = self.__class__.__name__
+        version = IndexVersion.get()
+        if version is None:
+            return self.calculate_range_stats()
+        cached_version, stats = self._range_stats.get(name, (None, None))
+        if cached_version != version:
+            cache_key = "range-stats-%s-%s" % (name, version)
+            stats = cache.get(cache_key)
+            if stats is None:
+                stats = self.calculate_range_stats()
+                cache.set(cache_key, stats)
+            RangeStatsMixin._range_stats[name] = (version, stats)
+        return dict(stats)
+
+    def calculate_range_stats(self):
+        """Calculate the min and max for fields specified in
+        :attr:`stats_fields` with a Solr stats query.
+
+        :returns: Dictionary keyed on form field name with a tuple of
+            (min, max) as integers. If stats are not returned from the field,
+            the key is not added to a dictionary.
+        :rtype: dict
+        """
+        stats = self.get_stats_queryset().stats(*self.stats_fields).get_stats()
+        min_max_ranges = {}
+        if not stats:
+            return min_max_ranges
+        for name in self.stats_fields:
+            try:
+                min_year = int(stats["stats_fields"][name]["min"])
+                max_year = int(stats["stats_fields"][name]["max"])
+                # map to form field name if an alias is provided
+                min_max_ranges[self.range_field_map.get(name, name)] = (
+                    min_year,
+                    max_year,
+                )
+            # If the field stats are missing, min and max will be NULL,
+            # rendered as None.
+            # The TypeError will catch and pass returning an empty entry
+            # for that field but allowing others to be passed on.
+            except TypeError:
+                pass
+        return min_max_ranges
+
+
+class SolrQueryCountMixin(View):
+    """View mixin to count the Solr queries made while handling a request,
+    so that changes to the number of queries a view needs are noticed.
+    The count and number of cached responses used are logged and, when
+    **DEBUG** is enabled, added to the response as ``X-Solr-Queries`` and
+    ``X-Solr-Cache-Hits`` headers. Should be listed first so that queries
+    made by other mixins are included."""
+
+    #: number of Solr queries made for the current request
+    solr_query_count = None
+
+    def dispatch(self, request, *args, **kwargs):
+        """Wrap the dispatch method to count Solr queries."""
+        with SolrQueryCounter() as counter:
+            response = super(SolrQueryCountMixin, self).dispatch(
+                request, *args, **kwargs
+            )
+        self.solr_query_count = counter.count
+        logger.debug(
+            "%s made %d Solr queries; %d cached",
+            self.__class__.__name__,
+            counter.count,
+            counter.cache_hits,
+        )
+        if settings.DEBUG:
+            response["X-Solr-Queries"] = counter.count
+            response["X-Solr-Cache-Hits"] = counter.cache_hits
+        return response
+
+
 class SolrLastModifiedMixin(View):
-    """View mixin to add last modified headers based on Solr"""
+    """View mixin to add last modified and ETag headers based on Solr, and
+    return a not modified response for conditional requests. When a request
+    includes conditional headers, the last modified date is determined
+    before the view runs, so that unchanged content is not generated."""
 
     #: solr query filter for getting last modified date
     solr_lastmodified_filters = {}  # by default, find all
@@ -221,42 +392,236 @@ class SolrLastModifiedMixin(View):
     def last_modified(self):
         """Return last modified :class:`datetime.datetime` from the
         specified Solr query"""
+        # use the last modified aggregate from the view's main query,
+        # if it was included
+        object_list = getattr(self, "object_list", None)
+        if isinstance(object_list, AliasedSolrQuerySet):
+            last_modified = object_list.get_last_modified()
+            if last_modified:
+                return last_modified
+
         filter_qs = self.get_solr_lastmodified_filters()
+        # cached until the index changes, if the index version is known
+        version = IndexVersion.get()
+        cache_key = None
+        if version is not None:
+            cache_key = "last-modified-%s-%s" % (
+                version,
+                hashlib.sha1(
+                    json.dumps(filter_qs, sort_keys=True).encode()
+                ).hexdigest(),
+            )
+            last_modified = cache.get(cache_key)
+            if last_modified:
+                return last_modified
+
         sqs = (
-            SolrQuerySet()
+            SolrQuerySet(solr=CountingSolrClient())
             .filter(**filter_qs)
             .order_by("-last_modified")
             .only("last_modified")
         )
         try:
             # Solr stores date in isoformat; convert to datetime
-            return solr_timestamp_to_datetime(sqs[0]["last_modified"])
+            last_modified = solr_timestamp_to_datetime(sqs[0]["last_modified"])
             # skip extra call to Solr to check count and just grab the first
             # item if it exists
         except (IndexError, KeyError):
             # if a syntax or other solr error happens, no date to return
-            pass
+            return None
+        if cache_key:
+            cache.set(cache_key, last_modified)
+        return last_modified
+
+    def get_etag(self, last_modified):
+        """Generate a weak ETag from the last modified date and the
+        request details that the response varies on."""
+        user = getattr(self.request, "user", None)
+        etag_data = [
+            last_modified.isoformat(),
+            self.request.get_full_path(),
+            self.request.headers.get("accept", ""),
+            self.request.headers.get("x-requested-with", ""),
+            str(bool(user and user.is_authenticated)),
+            __version__,
+        ]
+        return 'W/"%s"' % hashlib.sha1("|".join(etag_data).encode()).hexdigest()
+
+    def conditional_headers(self, last_modified):
+        """Last modified and ETag headers for a response with the specified
+        last modified date. Returns a dictionary of headers and the last
+        modified date as a timestamp, for use with
+        :meth:`django.utils.cache.get_conditional_response`."""
+        # remove microseconds so that comparison will pass,
+        # since microseconds are not included in the last-modified header
+        last_modified = last_modified.replace(microsecond=0)
+        headers = {
+            "Last-Modified": last_modified.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+            "ETag": self.get_etag(last_modified),
+        }
+        # convert the same way django does so that they will
+        # compare correctly
+        return headers, calendar.timegm(last_modified.utctimetuple())
 
     def dispatch(self, request, *args, **kwargs):
-        """Wrap the dispatch method to add a last modified header if
-        one is available, then return a conditional response."""
-
-        # NOTE: this doesn't actually skip view processing,
-        # but without it we could return a not modified for a non-200 response
+        """Wrap the dispatch method to add last modified and ETag headers
+        if a last modified date is available, then return a conditional
+        response. If the request is conditional, checks the last modified
+        date first and returns a not modified response without running
+        the view when possible."""
+        last_modified = None
+        conditional = request.method in ("GET", "HEAD") and (
+            "if-modified-since" in request.headers or "if-none-match" in request.headers
+        )
+        if conditional:
+            last_modified = self.last_modified()
+            if last_modified:
+                headers, timestamp = self.conditional_headers(last_modified)
+                # returns None if the view should be run
+                response = get_conditional_response(
+                    request, etag=headers["ETag"], last_modified=timestamp
+                )
+                if response is not None:
+                    for header, value in headers.items():
+                        response[header] = value
+                    return response
+
+        # without a last modified date, content is generated before
+        # responding, so that not modified is only returned for a 200 response
         response = super(SolrLastModifiedMixin, self).dispatch(request, *args, **kwargs)
 
-        last_modified = self.last_modified()
+        if not conditional:
+            last_modified = self.last_modified()
+        etag = timestamp = None
         if last_modified:
-            # remove microseconds so that comparison will pass,
-            # since microseconds are not included in the last-modified header
-            last_modified = last_modified.replace(microsecond=0)
-            response["Last-Modified"] = last_modified.strftime(
-                "%a, %d %b %Y %H:%M:%S GMT"
-            )
-            # convert the same way django does so that they will
-            # compare correctly
-            last_modified = calendar.timegm(last_modified.utctimetuple())
+            headers, timestamp = self.conditional_headers(last_modified)
+            for header, value in headers.items():
+                response[header] = value
+            etag = headers["ETag"]
 
         return get_conditional_response(
-            request, last_modified=last_modified, response=response
+            request, etag=etag, last_modified=timestamp, response=response
         )
+
+
+class CachedResponseMixin(View):
+    """View mixin to cache full responses for anonymous users in the Django
+    cache, keyed on the full URL and the request headers that responses vary
+    on. Cached responses are tagged with the versions of their surrogate
+    keys (see :class:`~mep.common.indexing.SurrogateKeys`) and are not used
+    after any of those keys are purged, e.g. when an included record is
+    reindexed.
+
+    Enabled with **RESPONSE_CACHE** in settings; cached responses expire
+    after **RESPONSE_CACHE_TIMEOUT** seconds (default one hour). Should be
+    listed before :class:`SolrLastModifiedMixin`, so that conditional
+    requests can be answered from the cache.
+
+    If the content security policy nonce for the request is included in
+    the response, it is cached with a placeholder that is replaced with
+    the nonce for each request served from the cache."""
+
+    #: surrogate keys for all responses from this view, e.g. an item type
+    #: for search pages; :attr:`SurrogateKeys.all` is always included
+    surrogate_keys = []
+
+    #: default number of seconds to keep cached responses
+    default_timeout = 3600
+
+    #: placeholder for the content security policy nonce in cached responses
+    csp_nonce_placeholder = b"__csp_nonce__"
+
+    def get_surrogate_keys(self):
+        """Surrogate keys for the current response, determined after the
+        view runs. By default returns :attr:`surrogate_keys`."""
+        return [SurrogateKeys.all] + list(self.surrogate_keys)
+
+    def response_cache_key(self):
+        """Cache key for the current request."""
+        key_data = [
+            self.request.build_absolute_uri(),
+            self.request.headers.get("accept", ""),
+            self.request.headers.get("x-requested-with", ""),
+        ]
+        return "response-%s" % hashlib.sha1("|".join(key_data).encode()).hexdigest()
+
+    def response_cacheable(self, request):
+        """Check if responses should be cached for the current request."""
+        user = getattr(request, "user", None)
+        return (
+            getattr(settings, "RESPONSE_CACHE", False)
+            and request.method in ("GET", "HEAD")
+            and not (user and user.is_authenticated)
+        )
+
+    def cached_response(self, request, cache_key):
+        """Get the cached response for the current request, if there is
+        one and none of its surrogate keys have been purged."""
+        cached = cache.get(cache_key)
+        if cached is None:
+            return None
+        versions, response = cached
+        if SurrogateKeys.versions(versions.keys()) != versions:
+            return None
+        if self.csp_nonce_placeholder in response.content:
+            # accessing the nonce adds it to this request's policy header
+            nonce = str(getattr(request, "csp_nonce", ""))
+            response.content = response.content.replace(
+                self.csp_nonce_placeholder, nonce.encode()
+            )
+            if response.has_header("Content-Length"):
+                response["Content-Length"] = str(len(response.content))
+        return get_conditional_response(
+            request,
+            etag=response.get("ETag"),
+            last_modified=parse_http_date_safe(response.get("Last-Modified", "")),
+            response=response,
+        )
+
+    def cache_response(self, cache_key, response):
+        """Cache a successful response with the current versions of its
+        surrogate keys."""
+        if (
+            response.status_code != 200
+            or response.streaming
+            or response.cookies
+            or response.has_header("Set-Cookie")
+        ):
+            return
+        # nonce is only set if it was used when generating the response
+        nonce = getattr(self.request, "csp_nonce", None)
+        if nonce:
+            response = HttpResponse(
+                response.content.replace(
+                    str(nonce).encode(), self.csp_nonce_placeholder
+                ),
+                status=response.status_code,
+                headers=dict(response.items()),
+            )
+        versions = SurrogateKeys.versions(self.get_surrogate_keys())
+        cache.set(
+            cache_key,
+            (versions, response),
+            getattr(settings, "RESPONSE_CACHE_TIMEOUT", self.default_timeout),
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        """Wrap the dispatch method to return a cached response if
+        available, and cache the response otherwise."""
+        if not self.response_cacheable(request):
+            return super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+
+        cache_key = self.response_cache_key()
+        response = self.cached_response(request, cache_key)
+        if response is not None:
+            return response
+
+        response = super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+        # template responses must be rendered before they can be cached
+        if hasattr(response, "render") and callable(response.render):
+            response.add_post_render_callback(
+                lambda rendered: self.cache_response(cache_key, rendered)
+            )
+        else:
+            self.cache_response(cache_key, response)
+        return response
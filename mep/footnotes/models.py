@@ -11,6 +11,12 @@ from django.utils.safestring import mark_safe
 from djiffy.models import Canvas, Manifest
 from parasolr.django.indexing import ModelIndexable
 
+from mep.common.indexing import (
+    CONTENT_HASH_FIELD,
+    PartialIndexable,
+    ReindexCoalescer,
+    content_hash,
+)
 from mep.common.models import Named, Notable
 
 
@@ -43,7 +49,11 @@ class BibliographySignalHandlers:
         cards = Bibliography.objects.filter(account__persons__pk=instance.pk)
         if cards.exists():
             BibliographySignalHandlers.debug_log("person", cards.count())
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(
+                cards,
+                reason="person save",
+                fields=Bibliography.index_fields("account_set__persons"),
+            )
 
     @staticmethod
     def person_delete(sender, instance, **kwargs):
@@ -59,7 +69,11 @@ class BibliographySignalHandlers:
             # clear the assocation so items will index without this person
             instance.account_set.clear()
             BibliographySignalHandlers.debug_log("person", cards.count(), mode="delete")
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(
+                cards,
+                reason="person delete",
+                fields=Bibliography.index_fields("account_set__persons"),
+            )
 
     @staticmethod
     def account_save(sender=None, instance=None, raw=False, **_kwargs):
@@ -72,7 +86,7 @@ class BibliographySignalHandlers:
         cards = Bibliography.objects.filter(account__pk=instance.pk)
         if cards.exists():
             BibliographySignalHandlers.debug_log("account", cards.count())
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(cards, reason="account save")
 
     @staticmethod
     def account_delete(sender, instance, **kwargs):
@@ -91,7 +105,7 @@ class BibliographySignalHandlers:
             BibliographySignalHandlers.debug_log(
                 "account", cards.count(), mode="delete"
             )
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(cards, reason="account delete")
 
     @staticmethod
     def manifest_save(sender=None, instance=None, raw=False, **kwargs):
@@ -104,7 +118,11 @@ class BibliographySignalHandlers:
         cards = Bibliography.objects.filter(manifest__pk=instance.pk)
         if cards.exists():
             BibliographySignalHandlers.debug_log("manifest", cards.count())
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(
+                cards,
+                reason="manifest save",
+                fields=Bibliography.index_fields("djiffy.Manifest"),
+            )
 
     @staticmethod
     def manifest_delete(sender, instance, **kwargs):
@@ -121,7 +139,7 @@ class BibliographySignalHandlers:
             BibliographySignalHandlers.debug_log(
                 "manifest", cards.count(), mode="delete"
             )
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(cards, reason="manifest delete")
 
     @staticmethod
     def canvas_save(sender=None, instance=None, raw=False, **kwargs):
@@ -135,7 +153,11 @@ class BibliographySignalHandlers:
         cards = Bibliography.objects.filter(manifest__pk=instance.manifest.pk)
         if cards.exists():
             BibliographySignalHandlers.debug_log("canvas", cards.count())
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(
+                cards,
+                reason="canvas save",
+                fields=Bibliography.index_fields("djiffy.Canvas"),
+            )
 
     @staticmethod
     def canvas_delete(sender, instance, **kwargs):
@@ -144,7 +166,11 @@ class BibliographySignalHandlers:
         cards = Bibliography.objects.filter(manifest__pk=instance.manifest.pk)
         if cards.exists():
             BibliographySignalHandlers.debug_log("canvas", cards.count(), mode="delete")
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(
+                cards,
+                reason="canvas delete",
+                fields=Bibliography.index_fields("djiffy.Canvas"),
+            )
 
     @staticmethod
     def event_save(sender=None, instance=None, raw=False, **_kwargs):
@@ -158,7 +184,11 @@ class BibliographySignalHandlers:
         cards = Bibliography.objects.filter(account__pk=instance.account.pk)
         if cards.exists():
             BibliographySignalHandlers.debug_log("event", cards.count())
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(
+                cards,
+                reason="event save",
+                fields=Bibliography.index_fields("accounts.Event"),
+            )
 
     @staticmethod
     def event_delete(sender, instance, **kwargs):
@@ -167,7 +197,11 @@ class BibliographySignalHandlers:
         cards = Bibliography.objects.filter(account__pk=instance.account.pk)
         if cards.exists():
             BibliographySignalHandlers.debug_log("event", cards.count(), mode="delete")
-            ModelIndexable.index_items(cards)
+            ReindexCoalescer.index_items(
+                cards,
+                reason="event delete",
+                fields=Bibliography.index_fields("accounts.Event"),
+            )
 
 
 class SourceType(Named, Notable):
@@ -180,7 +214,7 @@ class SourceType(Named, Notable):
     item_count.short_description = "# items"
 
 
-class Bibliography(Notable, ModelIndexable):
+class Bibliography(Notable, PartialIndexable, ModelIndexable):
     # Note: citation might be better singular
     bibliographic_note = models.TextField(help_text="Full bibliographic citation")
     source_type = models.ForeignKey(SourceType, on_delete=models.CASCADE)
@@ -221,6 +255,23 @@ class Bibliography(Notable, ModelIndexable):
         records associated with an account and with a IIIF manifest."""
         return cls.objects.filter(account__isnull=False, manifest__isnull=False)
 
+    #: methods that generate index data for groups of Solr fields, for
+    #: partial updates; see :class:`~mep.common.indexing.PartialIndexable`
+    index_field_providers = {
+        "thumbnail": ("index_thumbnail_data", ["thumbnail_t", "thumbnail2x_t"]),
+        "cardholders": ("index_cardholder_data", ["cardholder_t", "cardholder_sort_s"]),
+        "years": ("index_years_data", ["years_is", "start_i", "end_i"]),
+    }
+
+    #: field groups affected by each index dependency; changes to
+    #: accounts require a full reindex
+    index_depends_on_fields = {
+        "account_set__persons": ["cardholders"],
+        "djiffy.Manifest": ["thumbnail"],
+        "djiffy.Canvas": ["thumbnail"],
+        "accounts.Event": ["years"],
+    }
+
     index_depends_on = {
         "account_set": {
             "post_save": BibliographySignalHandlers.account_save,
@@ -278,41 +329,60 @@ class Bibliography(Notable, ModelIndexable):
         # This will blank out any previously indexed values, and item
         # will not be findable by any public searchable fields.
         account = self.account_set.all().first()
-        if not self.manifest or not self.account_set.all().exists():
+        if not self.partial_index_ok():
             del index_data["item_type"]
             return index_data
 
+        index_data.update(self.index_thumbnail_data())
+        index_data.update(self.index_cardholder_data())
+        index_data.update(self.index_years_data())
+        index_data[CONTENT_HASH_FIELD] = content_hash(index_data)
+        return index_data
+
+    def partial_index_ok(self):
+        """only cards with a manifest and an account are indexed with
+        full data, so other cards can't be updated partially"""
+        return bool(self.manifest) and self.account_set.all().exists()
+
+    def index_thumbnail_data(self):
+        """IIIF thumbnail urls for indexing in Solr"""
         # we expect a thumbnail, but possible there is none
         if self.manifest.thumbnail:
             iiif_thumbnail = self.manifest.thumbnail.image
 
             # for now, store iiif thumbnail urls directly
-            index_data["thumbnail_t"] = str(iiif_thumbnail.size(width=225))
-            index_data["thumbnail2x_t"] = str(iiif_thumbnail.size(width=225 * 2))
+            return {
+                "thumbnail_t": str(iiif_thumbnail.size(width=225)),
+                "thumbnail2x_t": str(iiif_thumbnail.size(width=225 * 2)),
+            }
+        return {}
+
+    def index_cardholder_data(self):
+        """cardholder names for indexing in Solr"""
+        # ordered so that the content hash and sort value are stable
+        names = [
+            person.sort_name
+            for account in self.account_set.order_by("pk")
+            for person in account.persons.order_by("sort_name", "pk")
+        ]
+        if names:
+            return {"cardholder_t": names, "cardholder_sort_s": names[0]}
+        return {}
 
-        names = []
+    def index_years_data(self):
+        """account activity years for indexing in Solr"""
         account_years = set()
         for account in self.account_set.all():
-            for person in account.persons.all():
-                names.append(person.sort_name)
-            account_years.update(set(date.year for date in account.event_dates))
-        if names:
-            index_data.update(
-                {
-                    "cardholder_t": names,
-                    "cardholder_sort_s": names[0],
-                }
+            account_years.update(
+                set(date.year for date in account.activity.event_dates)
             )
-
         if account_years:
-            index_data.update(
-                {
-                    "years_is": list(account_years),
-                    "start_i": min(account_years),
-                    "end_i": max(account_years),
-                }
-            )
-        return index_data
+            return {
+                "years_is": sorted(account_years),
+                "start_i": min(account_years),
+                "end_i": max(account_years),
+            }
+        return {}
 
 
 class FootnoteQuerySet(models.QuerySet):
@@ -82,8 +82,15 @@ class TestBibliography(TestCase):
             Event.objects.create(account=acct, start_date=date(1936, 5, 3))
             index_data = bibl.index_data()
 
-            assert leon.sort_name in index_data["cardholder_t"]
-            assert bertha.sort_name in index_data["cardholder_t"]
+            # ordered by account, then by name
+            assert index_data["cardholder_t"] == [bertha.sort_name, leon.sort_name]
+            assert index_data["cardholder_sort_s"] == bertha.sort_name
+            other = Account.objects.create(card=bibl)
+            other.persons.add(
+                Person.objects.create(sort_name="Adams, Ann", slug="adams")
+            )
+            index_data = bibl.index_data()
+            assert index_data["cardholder_t"][-1] == "Adams, Ann"
             assert index_data["cardholder_sort_s"] == bertha.sort_name
             for year in (1919, 1922, 1936):
                 assert year in index_data["years_is"]
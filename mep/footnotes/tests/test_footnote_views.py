@@ -74,6 +74,7 @@ class TestCardList(TestCase):
         # simulate fluent interface
         mock_qs = mock_card_solrqueryset.return_value
         for meth in [
+            "last_modified_aggregate",
             "facet_field",
             "filter",
             "only",
@@ -140,7 +141,7 @@ class TestCardList(TestCase):
         # trigger form valid check to ensure cleaned data is available
         view.get_form().is_valid()
         view.queryset = Mock()
-        with patch("mep.footnotes.views.alpha_pagelabels") as mock_alpha_pglabels:
+        with patch("mep.footnotes.views.solr_pagelabels") as mock_alpha_pglabels:
             works = range(101)
             paginator = Paginator(works, per_page=50)
             result = view.get_page_labels(paginator)
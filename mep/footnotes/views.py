@@ -4,13 +4,17 @@ from django.views.generic import ListView
 from django.views.generic.edit import FormMixin
 
 from mep.common import SCHEMA_ORG
-from mep.common.utils import absolutize_url, alpha_pagelabels
+from mep.common.solr import SolrPaginator, solr_pagelabels
+from mep.common.utils import absolutize_url
 from mep.common.views import (
     AjaxTemplateMixin,
+    CachedResponseMixin,
     FacetJSONMixin,
     LabeledPagesMixin,
     LoginRequiredOr404Mixin,
     RdfViewMixin,
+    SolrLastModifiedMixin,
+    SolrQueryCountMixin,
 )
 from mep.footnotes.forms import CardSearchForm
 from mep.footnotes.models import Bibliography
@@ -30,8 +34,11 @@ class BibliographyAutocomplete(autocomplete.Select2QuerySetView):
 
 
 class CardList(
+    SolrQueryCountMixin,
+    CachedResponseMixin,
     LoginRequiredOr404Mixin,
     LabeledPagesMixin,
+    SolrLastModifiedMixin,
     ListView,
     FormMixin,
     AjaxTemplateMixin,
@@ -48,6 +55,11 @@ class CardList(
     paginate_by = 30
     context_object_name = "cards"
     rdf_type = SCHEMA_ORG.SearchResultsPage
+    solr_lastmodified_filters = {"item_type": "card"}
+    #: retrieve each page and count with a single Solr query
+    paginator_class = SolrPaginator
+    #: purge cached responses when any card is reindexed
+    surrogate_keys = ["card"]
 
     form_class = CardSearchForm
     # cached form instance for current request
@@ -88,7 +100,10 @@ class CardList(
         return kwargs
 
     def get_queryset(self):
-        sqs = CardSolrQuerySet()
+        # include last modified date for the last modified header
+        sqs = CardSolrQuerySet().last_modified_aggregate(
+            **self.get_solr_lastmodified_filters()
+        )
         form = self.get_form()
 
         # empty queryset if not valid
@@ -119,9 +134,10 @@ class CardList(
         #    return super().get_page_labels(paginator)
 
         # otherwise, when sorting by alpha, generate alpha page labels
-        pagination_qs = self.queryset.only("cardholder_sort")
-        alpha_labels = alpha_pagelabels(
-            paginator, pagination_qs, lambda x: x["cardholder_sort"]
+        alpha_labels = solr_pagelabels(
+            paginator,
+            self.queryset.only("cardholder_sort"),
+            lambda x: x["cardholder_sort"],
         )
         # alpha labels is a dict; use items to return list of tuples
         return alpha_labels.items()
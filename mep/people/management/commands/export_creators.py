@@ -6,6 +6,9 @@ Generates a CSV and JSON file including details on every creator
 on creator nationality, gender, and other information.
 """
 
+from django.db.models import Prefetch
+
+from mep.accounts.models import Account
 from mep.people.models import Person
 from mep.people.management.commands import export_members
 
@@ -39,7 +42,8 @@ class Command(export_members.Command):
             Person.objects.filter(creator__isnull=False)
             .prefetch_related(
                 "nationalities",
-                "account_set",  # needed to determine if member, for member uri
+                # needed to determine if member, for member uri
+                Prefetch("account_set", queryset=Account.objects.order_by("pk")),
                 "urls",
             )
             .distinct()
@@ -7,9 +7,12 @@ database, with summary details and coordinates for associated addresses.
 """
 
 from collections import OrderedDict
+
+from django.db.models import Prefetch
+
+from mep.accounts.models import Account
 from mep.common.management.export import BaseExport
 from mep.common.templatetags.mep_tags import domain
-from mep.common.utils import absolutize_url
 from mep.people.models import Person
 
 
@@ -47,13 +50,28 @@ class Command(BaseExport):
         "updated",
     ]
 
+    column_types = {
+        "is_organization": "bool",
+        "has_card": "bool",
+        "birth_year": "int",
+        "death_year": "int",
+        "membership_years": ["int"],
+        "nationalities": ["string"],
+        "addresses": ["string"],
+        "postal_codes": ["string"],
+        "arrondissements": ["int"],
+        "coordinates": ["string"],
+        "updated": "datetime",
+    }
+
     def get_queryset(self):
         """filter to library members"""
         return Person.objects.library_members().prefetch_related(
             "nationalities",
-            "account_set",
-            # prefetching currently doesn't help with membership years
+            # ordered so the first account matches account_set.first()
+            Prefetch("account_set", queryset=Account.objects.order_by("pk")),
             "account_set__locations",
+            "account_set__activity_summary",
             "urls",
         )
 
@@ -67,6 +85,8 @@ class Command(BaseExport):
         :class:`~mep.people.models.Person`
         """
         field_set = set(self.csv_fields)
+        # use prefetched accounts instead of querying for the first one
+        account = next(iter(obj.account_set.all()), None)
 
         # since JSON export currently relies on order,
         # all configured fields are added to data dict here in desired order
@@ -79,10 +99,10 @@ class Command(BaseExport):
 
         # uri
         if "uri" in field_set:
-            data["uri"] = absolutize_url(obj.get_absolute_url())
+            data["uri"] = self.absolute_url(obj)
         # optional member uri
-        elif "member_uri" in field_set and obj.has_account():
-            data["member_uri"] = absolutize_url(obj.get_absolute_url())
+        elif "member_uri" in field_set and account:
+            data["member_uri"] = self.absolute_url(obj)
 
         # name
         if "name" in field_set:
@@ -98,7 +118,7 @@ class Command(BaseExport):
 
         # has card
         if "has_card" in field_set:
-            data["has_card"] = obj.has_card()
+            data["has_card"] = any(acct.card_id for acct in obj.account_set.all())
 
         # add title if set
         if "title" in field_set and obj.title:
@@ -117,7 +137,7 @@ class Command(BaseExport):
         # set for unique, list for json serialization
         if "membership_years" in field_set:
             data["membership_years"] = list(
-                set(d.year for d in obj.account_set.first().event_dates)
+                set(d.year for d in account.activity.event_dates) if account else []
             )
 
         # viaf & wikipedia URLs
@@ -137,15 +157,14 @@ class Command(BaseExport):
 
         # add ordered list of addresses & coordinates
         if "addresses" in field_set:
-            locations_obj = obj.account_set.first()
-            if locations_obj:
-                locations = locations_obj.locations
-                if locations.exists():
+            if account:
+                locations = account.locations.all()
+                if locations:
                     data["addresses"] = []
                     data["coordinates"] = []
                     data["postal_codes"] = []
                     data["arrondissements"] = []
-                    for location in locations.all():
+                    for location in locations:
                         data["addresses"].append(str(location))
                         data["coordinates"].append(
                             "%s, %s" % (location.latitude, location.longitude)
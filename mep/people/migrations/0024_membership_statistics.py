@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("people", "0023_person_viaf_date_override"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MembershipStatistics",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("data", models.BinaryField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "membership statistics",
+                "verbose_name_plural": "membership statistics",
+            },
+        ),
+    ]
@@ -14,6 +14,12 @@ from django.utils.safestring import mark_safe
 from parasolr.django.indexing import ModelIndexable
 from viapy.api import ViafEntity
 
+from mep.common.indexing import (
+    CONTENT_HASH_FIELD,
+    PartialIndexable,
+    ReindexCoalescer,
+    content_hash,
+)
 from mep.common.models import (
     AliasIntegerField,
     DateRange,
@@ -147,6 +153,7 @@ class PersonQuerySet(models.QuerySet):
         based on associated account."""
         return self.exclude(account=None)
 
+    @ReindexCoalescer()
     @transaction.atomic
     def merge_with(self, person):
         """Merge all person records in the current queryset with the
@@ -194,6 +201,7 @@ class PersonQuerySet(models.QuerySet):
         merge_people = self.exclude(id=person.id)
 
         Creator = apps.get_model("books", "Creator")  # prevents circular import issue
+        AccountActivitySummary = apps.get_model("accounts", "AccountActivitySummary")
 
         for merge_person in merge_people:
             if merge_person.has_account():  # if the merged person had an account
@@ -236,6 +244,10 @@ class PersonQuerySet(models.QuerySet):
                     primary_account.card = account_card
                     primary_account.save()
 
+                # events reassociated in bulk don't update the activity
+                # summary, so recalculate it for the combined events
+                AccountActivitySummary.update_account(primary_account)
+
             if merge_person.is_creator():  # if the merged person was a creator
                 for creator in merge_person.creator_set.all():
                     creator.person = person  # reassociate the creator relationship to the primary person
@@ -325,7 +337,11 @@ class PersonSignalHandlers:
         members = instance.person_set.library_members().all()
         if members.exists():
             PersonSignalHandlers.debug_log("country", members.count())
-            ModelIndexable.index_items(members)
+            ReindexCoalescer.index_items(
+                members,
+                reason="country save",
+                fields=Person.index_fields("nationalities"),
+            )
 
     @staticmethod
     def country_delete(sender, instance, **kwargs):
@@ -342,7 +358,11 @@ class PersonSignalHandlers:
             # NOTE: this sends pre/post clear signal, but it's not obvious
             # how to take advantage of that
             instance.person_set.clear()
-            ModelIndexable.index_items(members)
+            ReindexCoalescer.index_items(
+                members,
+                reason="country delete",
+                fields=Person.index_fields("nationalities"),
+            )
 
     @staticmethod
     def account_save(sender=None, instance=None, raw=False, **kwargs):
@@ -355,7 +375,7 @@ class PersonSignalHandlers:
         members = instance.persons.library_members().all()
         if members.exists():
             PersonSignalHandlers.debug_log("account", members.count())
-            ModelIndexable.index_items(members)
+            ReindexCoalescer.index_items(members, reason="account save")
 
     @staticmethod
     def account_delete(sender, instance, **kwargs):
@@ -369,7 +389,7 @@ class PersonSignalHandlers:
             # NOTE: this sends pre/post clear signal, but it's not obvious
             # how to take advantage of that
             instance.persons.clear()
-            ModelIndexable.index_items(members)
+            ReindexCoalescer.index_items(members, reason="account delete")
 
     @staticmethod
     def event_save(sender=None, instance=None, raw=False, **kwargs):
@@ -382,7 +402,11 @@ class PersonSignalHandlers:
         members = instance.account.persons.library_members().all()
         if members.exists():
             PersonSignalHandlers.debug_log("event", members.count())
-            ModelIndexable.index_items(members)
+            ReindexCoalescer.index_items(
+                members,
+                reason="event save",
+                fields=Person.index_fields("accounts.Event"),
+            )
 
     @staticmethod
     def event_delete(sender, instance, **kwargs):
@@ -391,7 +415,11 @@ class PersonSignalHandlers:
         # get a list of ids for deleted event
         members = instance.account.persons.library_members()
         if members.exists():
-            ModelIndexable.index_items(members)
+            ReindexCoalescer.index_items(
+                members,
+                reason="event delete",
+                fields=Person.index_fields("accounts.Event"),
+            )
 
     @staticmethod
     def address_save(sender=None, instance=None, raw=False, **kwargs):
@@ -407,7 +435,11 @@ class PersonSignalHandlers:
             members = instance.account.persons.library_members()
             if members.exists():
                 PersonSignalHandlers.debug_log("address", members.count())
-                ModelIndexable.index_items(members)
+                ReindexCoalescer.index_items(
+                    members,
+                    reason="address save",
+                    fields=Person.index_fields("accounts.Address"),
+                )
 
     @staticmethod
     def address_delete(sender, instance, **kwargs):
@@ -417,10 +449,14 @@ class PersonSignalHandlers:
         if instance.account:
             members = instance.account.persons.library_members()
             if members.exists():
-                ModelIndexable.index_items(members)
+                ReindexCoalescer.index_items(
+                    members,
+                    reason="address delete",
+                    fields=Person.index_fields("accounts.Address"),
+                )
 
 
-class Person(TrackChangesModel, Notable, DateRange, ModelIndexable):
+class Person(TrackChangesModel, Notable, DateRange, PartialIndexable, ModelIndexable):
     """Model for people in the MEP dataset"""
 
     #: MEP xml id
@@ -701,6 +737,32 @@ class Person(TrackChangesModel, Notable, DateRange, ModelIndexable):
 
     admin_url.verbose_name = "Admin Link"
 
+    #: methods that generate index data for groups of Solr fields, for
+    #: partial updates; see :class:`~mep.common.indexing.PartialIndexable`
+    index_field_providers = {
+        "nationality": ("index_nationality_data", ["nationality"]),
+        "activity": (
+            "index_activity_data",
+            [
+                "account_years_is",
+                "account_yearmonths_is",
+                "logbook_yearmonths_is",
+                "card_yearmonths_is",
+                "account_start_i",
+                "account_end_i",
+            ],
+        ),
+        "arrondissements": ("index_arrondissement_data", ["arrondissement_is"]),
+    }
+
+    #: field groups affected by each index dependency; changes to
+    #: accounts require a full reindex
+    index_depends_on_fields = {
+        "nationalities": ["nationality"],
+        "accounts.Event": ["activity"],
+        "accounts.Address": ["arrondissements"],
+    }
+
     index_depends_on = {
         "nationalities": {
             "post_save": PersonSignalHandlers.country_save,
@@ -745,6 +807,44 @@ class Person(TrackChangesModel, Notable, DateRange, ModelIndexable):
         bulk; only include library members."""
         return cls.objects.library_members()
 
+    @classmethod
+    def update_activity_summaries(cls, members):
+        """Calculate any missing account activity summaries for the
+        specified members, using a single events query."""
+        # prevents circular import issue
+        Account = apps.get_model("accounts", "Account")
+        AccountActivitySummary = apps.get_model("accounts", "AccountActivitySummary")
+        missing = Account.objects.filter(
+            persons__in=members, activity_summary__isnull=True
+        )
+        if missing.exists():
+            AccountActivitySummary.rebuild(missing)
+
+    @classmethod
+    def prep_index_chunk(cls, chunk):
+        """Calculate any missing account activity summaries for a chunk of
+        members being indexed in bulk, and store precomputed data for
+        their member detail pages."""
+        # prevents circular import issue
+        from mep.people.views import MemberDetail
+
+        cls.update_activity_summaries(chunk)
+        MemberDetail.store_payloads(chunk)
+        return chunk
+
+    @classmethod
+    def prep_index(cls):
+        """Calculate all missing account activity summaries before members
+        are indexed in parallel (see the `parallel_index` manage command),
+        so that worker processes don't calculate summaries for accounts
+        shared by members in different shards at the same time, and
+        update stored membership statistics from the summaries."""
+        # prevents circular import issue
+        from mep.people.stats import MembershipStats
+
+        cls.update_activity_summaries(cls.items_to_index())
+        MembershipStats.update()
+
     def index_data(self):
         """data for indexing in Solr"""
 
@@ -758,7 +858,7 @@ class Person(TrackChangesModel, Notable, DateRange, ModelIndexable):
         # account, return id only.
         # This will blank out any previously indexed values, and item
         # will not be findable by any public searchable fields.
-        if not self.has_account():
+        if not self.partial_index_ok():
             del index_data["item_type"]
             return index_data
 
@@ -776,55 +876,75 @@ class Person(TrackChangesModel, Notable, DateRange, ModelIndexable):
                 "birth_year_i": self.birth_year,
                 "death_year_i": self.death_year,
                 "has_card_b": self.has_card(),
-                "nationality": list(
-                    self.nationalities.all().values_list("name", flat=True)
-                ),
             }
         )
+        index_data.update(self.index_nationality_data())
 
         # conditionally set fields that are not always present
         # to avoid storing 'None' in Solr
         if self.gender:
             index_data["gender_s"] = self.get_gender_display()
 
-        account_dates = account.event_dates
-        if account_dates:
-            # use active date ranges to get a list of all years + months
-            # that this person was an active member
-            # (includes subscription spans without events in that month)
-
-            months = account.active_months()
-            logbook_months = account.active_months("membership")
-            card_months = account.active_months("books")
-
-            # index all years covered by account activity
-            account_years = account.event_years
-
-            # convert sets back to list for json serialization
-            index_data.update(
-                {
-                    "account_years_is": account_years,
-                    "account_yearmonths_is": list(months),
-                    "logbook_yearmonths_is": list(logbook_months),
-                    "card_yearmonths_is": list(card_months),
-                    # use min and max because set order is not guaranteed
-                    "account_start_i": min(account_years),
-                    "account_end_i": max(account_years),
-                }
-            )
-        if self.gender:
-            index_data["gender_s"] = self.get_gender_display()
+        index_data.update(self.index_activity_data(account))
+        index_data.update(self.index_arrondissement_data(account))
+        index_data[CONTENT_HASH_FIELD] = content_hash(index_data)
+        return index_data
 
+    def partial_index_ok(self):
+        """only library members are indexed with full data, so
+        other people can't be updated partially"""
+        return self.has_account()
+
+    def index_nationality_data(self):
+        """nationality data for indexing in Solr"""
+        # ordered so that the content hash is stable
+        return {
+            "nationality": list(
+                self.nationalities.order_by("name").values_list("name", flat=True)
+            )
+        }
+
+    def index_activity_data(self, account=None):
+        """account activity years and months for indexing in Solr"""
+        account = account or self.account_set.first()
+        # use precalculated account activity instead of querying events
+        activity = account.activity
+        if not activity.dates:
+            return {}
+
+        # use active date ranges to get a list of all years + months
+        # that this person was an active member
+        # (includes subscription spans without events in that month)
+        months = activity.active_months()
+        logbook_months = activity.active_months("membership")
+        card_months = activity.active_months("books")
+
+        # index all years covered by account activity
+        account_years = activity.event_years
+
+        # convert sets back to list for json serialization
+        return {
+            "account_years_is": account_years,
+            "account_yearmonths_is": sorted(months),
+            "logbook_yearmonths_is": sorted(logbook_months),
+            "card_yearmonths_is": sorted(card_months),
+            # use min and max because set order is not guaranteed
+            "account_start_i": min(account_years),
+            "account_end_i": max(account_years),
+        }
+
+    def index_arrondissement_data(self, account=None):
+        """arrondissement data for indexing in Solr"""
         # if the Person has associated Addresses through their account, get
         # the corresponding Paris arrondissements via their postal codes. If
         # we find any, add the unique ones for searching.
         if self.address_count() > 0:
+            account = account or self.account_set.first()
             locs = Location.objects.filter(address__in=account.address_set.all())
-            arrs = list(set(filter(None, [l.arrondissement() for l in locs])))
+            arrs = sorted(set(filter(None, [l.arrondissement() for l in locs])))
             if arrs:
-                index_data["arrondissement_is"] = arrs
-
-        return index_data
+                return {"arrondissement_is": arrs}
+        return {}
 
 
 class PastPersonSlug(models.Model):
@@ -894,3 +1014,23 @@ class Relationship(Notable):
             self.relationship_type.name,
             self.to_person.name,
         )
+
+
+class MembershipStatistics(models.Model):
+    """Monthly membership statistics as calculated by
+    :class:`~mep.people.stats.MembershipStats`, stored as gzip-compressed
+    JSON so that they can be served without calculating them in a request.
+    A single record is updated when members are reindexed or account
+    activity summaries are rebuilt."""
+
+    #: statistics as gzip-compressed JSON
+    data = models.BinaryField()
+    #: date last updated
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "membership statistics"
+        verbose_name_plural = "membership statistics"
+
+    def __str__(self):
+        return "Membership statistics updated %s" % self.updated_at
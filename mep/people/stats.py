@@ -0,0 +1,121 @@
+"""
+Monthly membership statistics for library members, materialized from
+account activity summaries and used for the membership graphs page and
+the public stats endpoint.
+"""
+
+import gzip
+import json
+from collections import Counter, defaultdict
+
+from mep.people.models import MembershipStatistics, Person
+
+
+class MembershipStats:
+    """Monthly counts of active library members, members with logbook
+    (membership) activity, and members with lending card (book) activity,
+    in the same form as the ``account_yearmonths``, ``logbook_yearmonths``
+    and ``card_yearmonths`` facets on the member index.
+
+    Statistics are calculated from :class:`~mep.accounts.models.AccountActivitySummary`
+    records with a single query, serialized as gzip-compressed JSON, and
+    stored as :class:`~mep.people.models.MembershipStatistics` by
+    :meth:`update`, which is called when members are reindexed or activity
+    summaries are rebuilt. Requests only read the stored statistics.
+    """
+
+    #: series names and the activity summary field each is counted from
+    series = {
+        "members": "months",
+        "logbooks": "membership_months",
+        "cards": "book_months",
+    }
+
+    #: years included in tabular data
+    years = range(1919, 1942)
+
+    @classmethod
+    def calculate(cls):
+        """Count library members active in each month for each series.
+        Returns a dictionary keyed on series name, with counts keyed on
+        year and month in YYYYMM format, in order. Accounts without
+        activity summaries are not counted."""
+        fields = list(cls.series.values())
+        rows = (
+            Person.objects.library_members()
+            .values_list(
+                "pk", *["account__activity_summary__%s" % field for field in fields]
+            )
+            .order_by()
+        )
+        # members are counted once per month, even with multiple accounts
+        months = defaultdict(lambda: [set() for field in fields])
+        for pk, *values in rows:
+            for member_months, value in zip(months[pk], values):
+                member_months.update(value or [])
+
+        counts = [Counter() for field in fields]
+        for member_months in months.values():
+            for counter, value in zip(counts, member_months):
+                counter.update(str(month) for month in value)
+
+        return {
+            name: dict(sorted(counter.items()))
+            for name, counter in zip(cls.series, counts)
+        }
+
+    @classmethod
+    def as_data(cls, counts):
+        """Convert counts into the format used by the membership graphs:
+        time series with a start date and count for each month, and tables
+        of counts by year with one column for each month and the maximum
+        monthly count."""
+        data = {}
+        tables = {}
+        for name, series_counts in counts.items():
+            data[name] = [
+                {
+                    "startDate": "%s-%s-01" % (yearmonth[:4], yearmonth[-2:]),
+                    "count": count,
+                }
+                for yearmonth, count in series_counts.items()
+            ]
+            table = defaultdict(lambda: [0] * 12)
+            for yearmonth, count in series_counts.items():
+                table[yearmonth[:4]][int(yearmonth[-2:]) - 1] = count
+            tables[name] = {
+                "years": table,
+                "month_max": max(series_counts.values(), default=0),
+            }
+        return {"data": data, "tables": tables}
+
+    @classmethod
+    def update(cls):
+        """Calculate statistics and store them as gzip-compressed JSON.
+        Returns the stored record."""
+        compressed = gzip.compress(json.dumps(cls.as_data(cls.calculate())).encode())
+        stats, _ = MembershipStatistics.objects.update_or_create(
+            pk=1, defaults={"data": compressed}
+        )
+        return stats
+
+    @classmethod
+    def compressed_json(cls):
+        """Stored statistics as gzip-compressed JSON, or None if they
+        have not been calculated."""
+        compressed = (
+            MembershipStatistics.objects.filter(pk=1)
+            .values_list("data", flat=True)
+            .first()
+        )
+        return bytes(compressed) if compressed is not None else None
+
+    @classmethod
+    def get(cls):
+        """Stored statistics as a dictionary with time series data and
+        tables for each series (see :meth:`as_data`); series are empty if
+        statistics have not been calculated."""
+        compressed = cls.compressed_json()
+        if compressed is None:
+            return cls.as_data({name: {} for name in cls.series})
+        return json.loads(gzip.decompress(compressed))
@@ -10,7 +10,14 @@ from django.utils import timezone
 import pytest
 from viapy.api import ViafEntity
 
-from mep.accounts.models import Account, Address, Borrow, Reimbursement, Subscription
+from mep.accounts.models import (
+    Account,
+    AccountActivitySummary,
+    Address,
+    Borrow,
+    Reimbursement,
+    Subscription,
+)
 from mep.books.models import Creator, CreatorType, Work
 from mep.footnotes.models import Bibliography, Footnote, SourceType
 from mep.people.models import (
@@ -23,6 +30,8 @@ from mep.people.models import (
     Relationship,
     RelationshipType,
 )
+from mep.people.stats import MembershipStats
+from mep.people.views import MemberDetail
 
 
 class TestLocation(TestCase):
@@ -383,6 +392,44 @@ class TestPerson(TestCase):
             Person.items_to_index()
             assert mock_lib_members.call_count == 1
 
+    def test_prep_index_chunk(self):
+        pers = Person.objects.create(name="John Smith", slug="smith")
+        acct = Account.objects.create()
+        acct.persons.add(pers)
+        Subscription.objects.create(
+            account=acct,
+            start_date=datetime.date(1921, 1, 1),
+            end_date=datetime.date(1921, 2, 1),
+        )
+        # calculates missing activity summaries
+        AccountActivitySummary.objects.all().delete()
+        assert Person.prep_index_chunk([pers]) == [pers]
+        summary = AccountActivitySummary.objects.get(account=acct)
+        assert summary.event_years == [1921]
+        # no changes when summaries exist
+        with self.assertNumQueries(1):
+            Person.update_activity_summaries([pers])
+        # member detail page data is stored
+        with patch.object(MemberDetail, "store_payloads") as mock_store:
+            Person.prep_index_chunk([pers])
+            mock_store.assert_called_once_with([pers])
+
+    def test_prep_index(self):
+        pers = Person.objects.create(name="John Smith", slug="smith")
+        jane = Person.objects.create(name="Jane Smith", slug="jane-smith")
+        acct = Account.objects.create()
+        # shared account
+        acct.persons.add(pers, jane)
+        Subscription.objects.create(account=acct, start_date=datetime.date(1921, 1, 1))
+        AccountActivitySummary.objects.all().delete()
+        # calculates missing summaries for all members
+        Person.prep_index()
+        assert AccountActivitySummary.objects.get(account=acct).event_years == [1921]
+        # membership statistics are stored from the summaries
+        assert MembershipStats.get()["data"]["members"][0]["count"] == 2
+        # recalculating summaries doesn't conflict with existing ones
+        assert AccountActivitySummary.rebuild(Account.objects.all()) == 1
+
     def test_index_data(self):
         pers = Person.objects.create(
             name="John Smith",
@@ -464,8 +511,8 @@ class TestPerson(TestCase):
         pers.nationalities.add(uk)
         pers.nationalities.add(denmark)
         index_data = pers.index_data()
-        assert uk.name in index_data["nationality"]
-        assert denmark.name in index_data["nationality"]
+        # ordered by name
+        assert index_data["nationality"] == [denmark.name, uk.name]
 
         # ensure that punctuation is stripped during sort
         pers = Person.objects.create(
@@ -490,6 +537,36 @@ class TestPersonQuerySet(TestCase):
         acct.persons.add(jones)
         assert jones in Person.objects.library_members()
 
+    def test_merge_with_activity(self):
+        main = Person.objects.create(name="Jonas", slug="jonas")
+        main_acct = Account.objects.create()
+        main_acct.persons.add(main)
+        Subscription.objects.create(
+            account=main_acct,
+            start_date=date(1920, 1, 5),
+            end_date=date(1920, 2, 5),
+        )
+        jones = Person.objects.create(name="Jones", slug="jones")
+        jones_acct = Account.objects.create()
+        jones_acct.persons.add(jones)
+        Subscription.objects.create(
+            account=jones_acct,
+            start_date=date(1936, 3, 1),
+            end_date=date(1936, 4, 1),
+        )
+        assert main_acct.activity.years == [1920]
+
+        Person.objects.merge_with(main)
+        # activity summary includes events from the merged account
+        main_acct = Account.objects.get(pk=main_acct.pk)
+        assert main_acct.activity.years == [1920, 1936]
+        assert main_acct.activity.event_dates == [
+            date(1920, 1, 5),
+            date(1920, 2, 5),
+            date(1936, 3, 1),
+            date(1936, 4, 1),
+        ]
+
     def test_merge_with(self):
         # create test records to merge
         Person.objects.bulk_create(
@@ -1,8 +1,18 @@
 import datetime
+import hashlib
+import json
+import os.path
 from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import pytest
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
 
-from mep.accounts.models import Event
+from mep.accounts.models import Account, Event
 from mep.people.management.commands import export_members, export_creators
 from mep.people.models import Person
 
@@ -21,6 +31,14 @@ class TestExportMembers(TestCase):
         qs = self.cmd.get_queryset()
         assert member in qs
         assert author not in qs
+        # prefetched accounts are in the same order as account_set.first()
+        account = Account.objects.create()
+        account.persons.add(member)
+        prefetched = qs.get(pk=member.pk)
+        assert list(prefetched.account_set.all()) == list(
+            member.account_set.order_by("pk")
+        )
+        assert next(iter(prefetched.account_set.all())) == member.account_set.first()
 
     def test_get_object_data(self):
         # fetch some example people from fixture & call get_object_data
@@ -86,6 +104,97 @@ class TestExportMembers(TestCase):
         gay_data = self.cmd.get_object_data(gay)
         assert "" in gay_data["coordinates"]
 
+    def test_command_line_since(self):
+        previous_dir = TemporaryDirectory()
+        delta_dir = TemporaryDirectory()
+        patched_dir = TemporaryDirectory()
+        current_dir = TemporaryDirectory()
+        stdout = StringIO()
+        call_command("export_members", "-d", previous_dir.name, stdout=stdout)
+
+        # rename one member
+        gay = Person.objects.get(name="Francisque Gay")
+        old_slug = gay.slug
+        gay.slug = "gay-francisque-renamed"
+        gay.save()
+
+        call_command("export_members", "-d", current_dir.name, stdout=stdout)
+        call_command(
+            "export_members",
+            "-d",
+            delta_dir.name,
+            "--since",
+            previous_dir.name,
+            stdout=stdout,
+        )
+        assert "1 records added or changed, 1 removed" in stdout.getvalue()
+        with open(os.path.join(delta_dir.name, "members_manifest.json")) as manifest:
+            info = json.load(manifest)
+        assert info["added"] == [gay.slug]
+        assert info["deleted"] == [
+            {"id": old_slug, "status": "renamed", "new_id": gay.slug}
+        ]
+        with open(os.path.join(delta_dir.name, "members_delta.json")) as delta:
+            assert [record["id"] for record in json.load(delta)] == [gay.slug]
+
+        # patching the previous export matches the current export
+        call_command(
+            "patch_export",
+            previous_dir.name,
+            delta_dir.name,
+            "-d",
+            patched_dir.name,
+            stdout=stdout,
+        )
+        for filename in ["members.json", "members.csv"]:
+            with open(os.path.join(patched_dir.name, filename)) as patched:
+                with open(os.path.join(current_dir.name, filename)) as current:
+                    assert patched.read() == current.read()
+
+        # previous export directory without a JSON export
+        os.remove(os.path.join(previous_dir.name, "members.json"))
+        with self.assertRaisesRegex(CommandError, "members.json not found"):
+            call_command(
+                "export_members", "-d", delta_dir.name, "--since", previous_dir.name
+            )
+
+        # since must be a previous export directory
+        with self.assertRaisesRegex(CommandError, "previous export directory"):
+            call_command(
+                "export_members", "-d", delta_dir.name, "--since", "2000-01-01"
+            )
+
+    def test_command_line_parquet(self):
+        pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+        tempdir = TemporaryDirectory()
+        stdout = StringIO()
+        call_command("export_members", "-d", tempdir.name, "--parquet", stdout=stdout)
+        assert "Exporting Parquet" in stdout.getvalue()
+        table = pyarrow_parquet.read_table(
+            os.path.join(tempdir.name, "members.parquet")
+        )
+        assert table.num_rows == Person.objects.library_members().count()
+        assert table.schema.names == self.cmd.csv_fields
+        gay = [row for row in table.to_pylist() if row["name"] == "Francisque Gay"][0]
+        assert gay["birth_year"] == 1885
+        assert gay["nationalities"] == ["France"]
+        assert gay["arrondissements"] == [6]
+        assert gay["updated"] == Person.objects.get(name="Francisque Gay").updated_at
+        # datapackage with checksum and size
+        with open(os.path.join(tempdir.name, "members_datapackage.json")) as dpfile:
+            resource = json.load(dpfile)["resources"][0]
+        with open(os.path.join(tempdir.name, "members.parquet"), "rb") as parquet:
+            content = parquet.read()
+        assert resource["path"] == "members.parquet"
+        assert resource["bytes"] == len(content)
+        assert resource["hash"] == "sha256:%s" % hashlib.sha256(content).hexdigest()
+        assert resource["rows"] == table.num_rows
+
+        # pyarrow is required
+        with patch("mep.common.management.export.pyarrow", None):
+            with self.assertRaises(CommandError):
+                call_command("export_members", "--parquet")
+
 
 class TestExportCreators(TestCase):
     fixtures = ["sample_people"]
@@ -0,0 +1,62 @@
+import gzip
+import json
+from datetime import date
+from django.test import TestCase
+
+from mep.accounts.models import Account, AccountActivitySummary
+from mep.books.models import Work
+from mep.people.models import MembershipStatistics, Person
+from mep.people.stats import MembershipStats
+
+
+class TestMembershipStats(TestCase):
+    def setUp(self):
+        self.sylvia = Person.objects.create(name="Sylvia", slug="sylvia")
+        self.james = Person.objects.create(name="James", slug="james")
+        # not a library member
+        Person.objects.create(name="Ernest", slug="ernest")
+        account = Account.objects.create()
+        account.persons.add(self.sylvia)
+        account.add_event(
+            "subscription", start_date=date(1920, 1, 5), end_date=date(1920, 2, 5)
+        )
+        work = Work.objects.create(title="Ulysses")
+        account.add_event("borrow", start_date=date(1920, 2, 10), work=work)
+        account = Account.objects.create()
+        account.persons.add(self.james)
+        account.add_event("borrow", start_date=date(1920, 2, 1), work=work)
+        AccountActivitySummary.rebuild()
+
+    def test_calculate(self):
+        counts = MembershipStats.calculate()
+        assert counts["members"] == {"192001": 1, "192002": 2}
+        assert counts["logbooks"] == {"192001": 1, "192002": 1}
+        assert counts["cards"] == {"192002": 2}
+        # summaries are not calculated
+        AccountActivitySummary.objects.all().delete()
+        assert MembershipStats.calculate()["members"] == {}
+
+    def test_as_data(self):
+        stats = MembershipStats.as_data({"cards": {"192002": 2, "193805": 61}})
+        assert stats["data"]["cards"] == [
+            {"startDate": "1920-02-01", "count": 2},
+            {"startDate": "1938-05-01", "count": 61},
+        ]
+        assert stats["tables"]["cards"]["years"]["1938"][4] == 61
+        assert stats["tables"]["cards"]["month_max"] == 61
+
+    def test_update(self):
+        # not calculated in requests
+        assert MembershipStats.compressed_json() is None
+        assert MembershipStats.get()["data"]["members"] == []
+        stats = MembershipStats.update()
+        assert MembershipStatistics.objects.count() == 1
+        data = MembershipStats.get()
+        assert data["data"]["members"][1] == {"startDate": "1920-02-01", "count": 2}
+        assert json.loads(gzip.decompress(MembershipStats.compressed_json())) == data
+        # stored statistics are served until updated
+        Account.objects.all().delete()
+        assert MembershipStats.get() == data
+        assert MembershipStats.update().pk == stats.pk
+        assert MembershipStatistics.objects.count() == 1
+        assert MembershipStats.get()["data"]["members"] == []
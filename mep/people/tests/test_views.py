@@ -1,17 +1,22 @@
+import gzip
 import json
 import time
 import uuid
 from collections import OrderedDict
 from datetime import date
 from types import LambdaType
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, PropertyMock, patch
+
+from addict import Dict as AttrDict
 
 from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.core.cache import cache
 from django.core.paginator import Paginator
 from django.http import Http404, JsonResponse
 from django.template.defaultfilters import date as format_date
 from django.template.defaultfilters import urlize
-from django.test import RequestFactory, TestCase
+from django.template.response import TemplateResponse
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import resolve, reverse
 from djiffy.models import Canvas
 import pytest
@@ -28,6 +33,8 @@ from mep.accounts.models import (
 )
 from mep.accounts.partial_date import DatePrecision
 from mep.books.models import Creator, CreatorType, Edition, Work
+from mep.common.indexing import IndexVersion, SurrogateKeys
+from mep.common.solr import CountingSolrClient
 from mep.common.templatetags.mep_tags import partialdate
 from mep.common.utils import absolutize_url
 from mep.footnotes.models import Bibliography, Footnote, SourceType
@@ -43,13 +50,16 @@ from mep.people.models import (
     Relationship,
     RelationshipType,
 )
+from mep.people.stats import MembershipStats
 from mep.people.views import (
     BorrowingActivities,
     GeoNamesLookup,
     MemberCardDetail,
     MemberCardList,
+    MemberDetail,
     MembershipActivities,
     MembershipGraphs,
+    MembershipStatsJSON,
     MembersList,
     PersonMerge,
 )
@@ -862,7 +872,9 @@ class TestMembersListView(TestCase):
         # should use /members LinkPage for title if set
         new_title = "New Title"
         root = LinkPage.get_first_root_node()
-        root.add_child(instance=LinkPage(title=new_title, tagline="test", link_url="/members"))
+        root.add_child(
+            instance=LinkPage(title=new_title, tagline="test", link_url="/members")
+        )
         response = self.client.get(self.members_url)
         assert response.context.get("page_title") == new_title
 
@@ -875,7 +887,7 @@ class TestMembersListView(TestCase):
         # trigger form valid check to ensure cleaned data is available
         view.get_form().is_valid()
         view.queryset = Mock()
-        with patch("mep.people.views.alpha_pagelabels") as mock_alpha_pglabels:
+        with patch("mep.people.views.solr_pagelabels") as mock_alpha_pglabels:
             works = range(101)
             paginator = Paginator(works, per_page=50)
             result = view.get_page_labels(paginator)
@@ -884,10 +896,7 @@ class TestMembersListView(TestCase):
             # first arg is paginator
             assert alpha_pagelabels_args[0] == paginator
             # second arg is queryset with revised field list
-            assert (
-                alpha_pagelabels_args[1]
-                == view.queryset.only.return_value.get_results.return_value
-            )
+            assert alpha_pagelabels_args[1] == view.queryset.only.return_value
             # third arg is a lambda
             assert isinstance(alpha_pagelabels_args[2], LambdaType)
 
@@ -959,6 +968,7 @@ class TestMembersListView(TestCase):
         mock_qs = mock_solrqueryset.return_value
         # simulate fluent interface
         for meth in [
+            "last_modified_aggregate",
             "facet_field",
             "filter",
             "only",
@@ -975,6 +985,8 @@ class TestMembersListView(TestCase):
         # queryset should be set on the view
         assert view.queryset == sqs
         mock_solrqueryset.assert_called_with()
+        # last modified date for all members is included
+        mock_qs.last_modified_aggregate.assert_called_with(item_type="person")
         # inspect solr queryset filters called; should be only called once
         # because card filtering is not on
         # faceting should be turned on via call to facet_fields twice
@@ -1073,7 +1085,7 @@ class TestMembersListView(TestCase):
         assert labels == [(1, "N/A")]
 
     @patch("mep.people.views.PersonSolrQuerySet")
-    def test_get_range_stats(self, mockPSQ):
+    def test_calculate_range_stats(self, mockPSQ):
         # NOTE: This depends on configuration for mapping the fields
         # in the range_field_map class attribute of MembersList
         mock_stats = {
@@ -1083,7 +1095,7 @@ class TestMembersListView(TestCase):
             }
         }
         mockPSQ.return_value.stats.return_value.get_stats.return_value = mock_stats
-        range_minmax = MembersList().get_range_stats()
+        range_minmax = MembersList().calculate_range_stats()
         # returns integer years
         # also converts membership_dates to
         assert range_minmax == {
@@ -1096,12 +1108,12 @@ class TestMembersListView(TestCase):
         assert "birth_year" in args
         # if get stats returns None, should return an empty dict
         mockPSQ.return_value.stats.return_value.get_stats.return_value = None
-        assert MembersList().get_range_stats() == {}
+        assert MembersList().calculate_range_stats() == {}
         # None set for min or max should result in the field not being
         # returned (but the other should be passed through as expected)
         mockPSQ.return_value.stats.return_value.get_stats.return_value = mock_stats
         mock_stats["stats_fields"]["account_years"]["min"] = None
-        assert MembersList().get_range_stats() == {"birth_year": (1910, 1932)}
+        assert MembersList().calculate_range_stats() == {"birth_year": (1910, 1932)}
 
     @patch("mep.common.views.SolrQuerySet")
     def test_last_modified(self, mock_wsq):
@@ -1112,10 +1124,42 @@ class TestMembersListView(TestCase):
         # has last modified header
         assert response["Last-Modified"]
 
+    @patch.object(CountingSolrClient, "make_request")
+    def test_solr_queries(self, mock_request):
+        mock_request.return_value = AttrDict(
+            responseHeader={"params": {}},
+            response={"numFound": 0, "start": 0, "docs": []},
+            facet_counts={
+                "facet_fields": {
+                    "has_card": [],
+                    "gender": [],
+                    "nationality": [],
+                    "arrondissement": [],
+                }
+            },
+            stats={"stats_fields": {}},
+            facets={
+                "count": 0,
+                "last_modified": {"count": 1, "max": "2020-05-01T12:30:00Z"},
+            },
+        )
+        request = self.factory.get(self.members_url, {"query": "gay"})
+        with patch.object(MembersList, "get_range_stats", return_value={}):
+            response = MembersList.as_view()(request)
+        # results, count, facets, and last modified from a single query
+        assert response.context_data["view"].solr_query_count == 1
+        assert response["Last-Modified"] == "Fri, 01 May 2020 12:30:00 GMT"
+        params = mock_request.call_args.kwargs["params"]
+        assert "last_modified" in json.loads(params["json.facet"])
+
 
 class TestMemberDetailView(TestCase):
     fixtures = ["sample_people.json"]
 
+    def setUp(self):
+        # clear precomputed member data from other tests
+        cache.clear()
+
     def test_get_member(self):
         gay = Person.objects.get(name="Francisque Gay", slug="gay")
         url = reverse("people:member-detail", kwargs={"slug": gay.slug})
@@ -1160,6 +1204,97 @@ class TestMemberDetailView(TestCase):
             item_type="person", slug_s=gay.slug
         )
 
+    @patch.object(IndexVersion, "get", Mock(return_value=1))
+    @patch("mep.common.views.SolrQuerySet")
+    def test_not_modified(self, mock_wsq):
+        cache.clear()
+        mock_wsq.return_value.filter.return_value.order_by.return_value.only.return_value = [
+            {"last_modified": "2018-07-02T21:08:46.428Z"}
+        ]
+        gay = Person.objects.get(name="Francisque Gay", slug="gay")
+        url = reverse("people:member-detail", kwargs={"slug": gay.slug})
+        request = RequestFactory().get(url)
+        request.user = AnonymousUser()
+        response = MemberDetail.as_view()(request, slug=gay.slug)
+        assert response.status_code == 200
+
+        # conditional request for unchanged member returns without
+        # generating the page, using the cached last modified date
+        request = RequestFactory().get(url, headers={"If-None-Match": response["ETag"]})
+        request.user = AnonymousUser()
+        with patch.object(MemberDetail, "get_object") as mock_get_object:
+            response = MemberDetail.as_view()(request, slug=gay.slug)
+            assert response.status_code == 304
+            assert not mock_get_object.call_count
+        assert mock_wsq.call_count == 1
+
+    @override_settings(RESPONSE_CACHE=True)
+    @patch("mep.common.views.SolrQuerySet")
+    def test_response_cache(self, mock_wsq):
+        cache.clear()
+        mock_wsq.return_value.filter.return_value.order_by.return_value.only.return_value = [
+            {"last_modified": "2018-07-02T21:08:46.428Z"}
+        ]
+        gay = Person.objects.get(name="Francisque Gay", slug="gay")
+        url = reverse("people:member-detail", kwargs={"slug": gay.slug})
+        request = RequestFactory().get(url)
+        request.user = AnonymousUser()
+        response = MemberDetail.as_view()(request, slug=gay.slug)
+        with patch.object(
+            TemplateResponse, "rendered_content", new_callable=PropertyMock
+        ) as mock_content:
+            mock_content.return_value = "member detail"
+            response.render()
+
+        # anonymous requests are served from the cache
+        with patch.object(MemberDetail, "get_object") as mock_get_object:
+            cached = MemberDetail.as_view()(request, slug=gay.slug)
+            assert cached.content == response.content
+            assert not mock_get_object.call_count
+
+        # until the member changes
+        gay.save()
+        with patch.object(MemberDetail, "get_object") as mock_get_object:
+            mock_get_object.return_value = gay
+            MemberDetail.as_view()(request, slug=gay.slug)
+            assert mock_get_object.call_count == 1
+
+    def test_payload(self):
+        cache.clear()
+        gay = Person.objects.get(name="Francisque Gay", slug="gay")
+        payload = MemberDetail.get_payload(gay)
+        assert set(payload) == {
+            "timeline",
+            "addresses",
+            "account_years",
+            "account_start",
+            "account_end",
+            "page_description",
+            "library_address",
+        }
+        assert payload["addresses"][0]["street_address"] == "3 Rue Garancière"
+        assert payload["library_address"]["name"] == "Shakespeare and Company"
+        account = gay.account_set.first()
+        assert payload["account_start"] == account.earliest_date()
+        assert payload["account_end"] == account.last_date()
+        with patch.object(MemberDetail, "build_payload") as mock_build:
+            mock_build.return_value = {"timeline": {}}
+            # precomputed data is used in requests
+            with self.assertNumQueries(0):
+                assert MemberDetail.get_payload(gay) == payload
+            mock_build.assert_not_called()
+            # not affected by purging cached responses
+            SurrogateKeys.purge_items(Person, [gay.pk])
+            assert MemberDetail.get_payload(gay) == payload
+            # regenerated when the member is indexed
+            Person.prep_index_chunk([gay])
+            mock_build.assert_called_once_with(gay)
+            assert MemberDetail.get_payload(gay) == {"timeline": {}}
+            # non-members are skipped
+            aeschylus = Person.objects.get(name="Aeschylus", slug="aeschylus")
+            MemberDetail.store_payloads([aeschylus])
+            assert mock_build.call_count == 1
+
     def test_member_map(self):
         gay = Person.objects.get(name="Francisque Gay", slug="gay")
         url = reverse("people:member-detail", kwargs={"slug": gay.slug})
@@ -1179,6 +1314,8 @@ class TestMemberDetailView(TestCase):
         # if we don't have the library's address, page should still render
         library = Location.objects.get(name="Shakespeare and Company")
         library.delete()
+        # precomputed data is regenerated when the member is reindexed
+        Person.prep_index_chunk([gay])
         response = self.client.get(url)
         assert response.status_code == 200
         # library address is rendered as "null"
@@ -1449,6 +1586,15 @@ class TestBorrowingActivities(TestCase):
         with pytest.raises(Http404):
             self.view.get_context_data()
 
+    def test_get_surrogate_keys(self):
+        self.view.object_list = self.view.get_queryset()
+        self.view.get_context_data()
+        keys = self.view.get_surrogate_keys()
+        assert SurrogateKeys.for_item(self.member) in keys
+        # includes works listed, since their details are displayed
+        for event in self.events.values():
+            assert SurrogateKeys.for_item(event.work) in keys
+
     def test_get_absolute_url(self):
         assert self.view.get_absolute_url() == absolutize_url(
             reverse("people:borrowing-activities", kwargs={"slug": self.member.slug})
@@ -1524,46 +1670,16 @@ class TestBorrowingActivities(TestCase):
 
 
 class TestMembershipGraphs(TestCase):
-    @patch("mep.people.views.PersonSolrQuerySet")
-    def test_get_context_data(self, mock_solrqueryset):
-        mock_qs = mock_solrqueryset.return_value
-        # simulate fluent interface
-        for meth in [
-            "facet_field",
-            "filter",
-            "only",
-            "search",
-            "also",
-            "raw_query_parameters",
-            "order_by",
-        ]:
-            getattr(mock_qs, meth).return_value = mock_qs
-
-        mock_qs.get_facets.return_value = {
-            "facet_fields": {
-                "account_yearmonths": OrderedDict(
-                    [
-                        ("192601", 242),
-                        ("192512", 236),
-                        ("192511", 234),
-                    ]
-                ),
-                "logbook_yearmonths": OrderedDict(
-                    [
-                        ("192601", 231),
-                        ("192511", 225),
-                        ("192512", 225),
-                    ]
-                ),
-                "card_yearmonths": OrderedDict(
-                    [
-                        ("193805", 61),
-                        ("194002", 57),
-                        ("193806", 53),
-                    ]
-                ),
+    @patch("mep.people.views.MembershipStats")
+    def test_get_context_data(self, mock_stats):
+        mock_stats.years = range(1919, 1942)
+        mock_stats.get.return_value = MembershipStats.as_data(
+            {
+                "members": {"192511": 234, "192512": 236, "192601": 242},
+                "logbooks": {"192511": 225, "192512": 225, "192601": 231},
+                "cards": {"193805": 61, "193806": 53, "194002": 57},
             }
-        }
+        )
 
         context = MembershipGraphs().get_context_data()
 
@@ -1571,10 +1687,40 @@ class TestMembershipGraphs(TestCase):
         for series in ["members", "logbooks", "cards"]:
             assert series in context["data"]
 
-        assert context["data"]["members"][0] == {
+        assert context["data"]["members"][2] == {
             "startDate": "1926-01-01",
             "count": 242,
         }
+        tabular_data = context["tabular_data"]
+        assert tabular_data["logbooks"][1926][0] == 231
+        # years without data default to zero
+        assert tabular_data["logbooks"][1919] == [0] * 12
+        assert tabular_data["logbooks_month_max"] == 231
+        assert tabular_data["cards_month_max"] == 61
+        assert tabular_data["card_percents"][1938][4] == "-"
+
+
+class TestMembershipStatsJSON(TestCase):
+    @patch("mep.people.views.MembershipStats")
+    def test_get(self, mock_stats):
+        data = {"data": {"members": []}}
+        mock_stats.compressed_json.return_value = gzip.compress(
+            json.dumps(data).encode()
+        )
+        url = reverse("people:membership-stats")
+        # served precompressed if accepted
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip, br"})
+        assert response["Content-Type"] == "application/json"
+        assert response["Content-Encoding"] == "gzip"
+        assert json.loads(gzip.decompress(response.content)) == data
+        assert "Accept-Encoding" in response["Vary"]
+        response = self.client.get(url)
+        assert not response.has_header("Content-Encoding")
+        assert json.loads(response.content) == data
+        # not found if statistics have not been stored
+        mock_stats.compressed_json.return_value = None
+        with pytest.raises(Http404):
+            MembershipStatsJSON.as_view()(RequestFactory().get(url))
 
 
 class TestMemberCardList(TestCase):
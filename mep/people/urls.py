@@ -9,6 +9,11 @@ urlpatterns = [
     # public member urls
     path("members/", views.MembersList.as_view(), name="members-list"),
     path("members/graphs/", views.MembershipGraphs.as_view(), name="member-graphs"),
+    path(
+        "members/stats.json",
+        views.MembershipStatsJSON.as_view(),
+        name="membership-stats",
+    ),
     re_path(
         r"^members/(?P<slug>[\w-]+)/$",
         views.MemberDetail.as_view(),
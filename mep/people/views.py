@@ -1,3 +1,4 @@
+import gzip
 from collections import OrderedDict, defaultdict
 
 from dal import autocomplete
@@ -5,40 +6,56 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.humanize.templatetags.humanize import ordinal
+from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned
 from django.core.paginator import Paginator
 from django.db.models import Q
-from django.http import Http404, HttpResponsePermanentRedirect, JsonResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponsePermanentRedirect,
+    JsonResponse,
+)
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from django.utils.html import format_html, strip_tags
 from django.utils.safestring import mark_safe
 from django.views.generic import DetailView, ListView
-from django.views.generic.base import TemplateView
+from django.views.generic.base import TemplateView, View
 from django.views.generic.edit import FormMixin, FormView
 from djiffy.models import Canvas
 
 from mep.accounts.models import Address, Event
 from mep.accounts.templatetags.account_tags import as_ranges
 from mep.common import SCHEMA_ORG
-from mep.common.utils import absolutize_url, alpha_pagelabels
+from mep.common.indexing import SurrogateKeys
+from mep.common.solr import SolrPaginator, solr_pagelabels
+from mep.common.utils import absolutize_url
 from mep.common.views import (
     AjaxTemplateMixin,
+    CachedResponseMixin,
     FacetJSONMixin,
     LabeledPagesMixin,
+    RangeStatsMixin,
     RdfViewMixin,
     SolrLastModifiedMixin,
+    SolrQueryCountMixin,
 )
 from mep.pages.models import LinkPage
 from mep.people.forms import MemberSearchForm, PersonMergeForm
 from mep.people.geonames import GeoNamesAPI
 from mep.people.models import Country, Location, Person
 from mep.people.queryset import PersonSolrQuerySet
+from mep.people.stats import MembershipStats
 
 
 class MembersList(
+    SolrQueryCountMixin,
+    CachedResponseMixin,
     LabeledPagesMixin,
     SolrLastModifiedMixin,
+    RangeStatsMixin,
     ListView,
     FormMixin,
     AjaxTemplateMixin,
@@ -59,6 +76,10 @@ class MembersList(
     context_object_name = "members"
     rdf_type = SCHEMA_ORG.SearchResultsPage
     solr_lastmodified_filters = {"item_type": "person"}
+    #: retrieve each page, count, and facets with a single Solr query
+    paginator_class = SolrPaginator
+    #: purge cached responses when any person is reindexed
+    surrogate_keys = ["person"]
 
     form_class = MemberSearchForm
     # cached form instance for current request
@@ -102,36 +123,9 @@ class MembersList(
             self._form = super().get_form(*args, **kwargs)
         return self._form
 
-    def get_range_stats(self):
-        """Return the min and max for fields specified in
-        :class:`MembershipList`'s stats_fields
-
-        :returns: Dictionary keyed on form field name with a tuple of
-            (min, max) as integers. If stats are not returned from the field,
-            the key is not added to a dictionary.
-        :rtype: dict
-        """
-
-        stats = PersonSolrQuerySet().stats(*self.stats_fields).get_stats()
-        min_max_ranges = {}
-        if not stats:
-            return min_max_ranges
-        for name in self.stats_fields:
-            try:
-                min_year = int(stats["stats_fields"][name]["min"])
-                max_year = int(stats["stats_fields"][name]["max"])
-                # map to form field name if an alias is provided
-                min_max_ranges[self.range_field_map.get(name, name)] = (
-                    min_year,
-                    max_year,
-                )
-            # If the field stats are missing, min and max will be NULL,
-            # rendered as None.
-            # The TypeError will catch and pass returning an empty entry
-            # for that field but allowing others to be passed on.
-            except TypeError:
-                pass
-        return min_max_ranges
+    def get_stats_queryset(self):
+        """Solr queryset for range stats"""
+        return PersonSolrQuerySet()
 
     #: name query alias field syntax (type defaults to edismax in solr config)
     search_name_query = "{!type=edismax qf=$name_qf pf=$name_pf v=$name_query}"
@@ -142,6 +136,7 @@ class MembersList(
     def get_queryset(self):
         sqs = (
             PersonSolrQuerySet()
+            .last_modified_aggregate(**self.get_solr_lastmodified_filters())
             .facet_field("has_card")
             .facet_field("gender", missing=True, exclude="gender")
             .facet_field(
@@ -247,11 +242,12 @@ class MembersList(
             return super().get_page_labels(paginator)
 
         # otherwise, when sorting by alpha, generate alpha page labels
-        # Only return sort name; get everything at once to avoid
-        # hitting Solr for each page / item.
-        pagination_qs = self.queryset.only("sort_name").get_results(rows=100000)
-        alpha_labels = alpha_pagelabels(
-            paginator, pagination_qs, lambda x: x["sort_name"][0], max_chars=4
+        # Only return sort name, for the first and last item on each page
+        alpha_labels = solr_pagelabels(
+            paginator,
+            self.queryset.only("sort_name"),
+            lambda x: x["sort_name"][0],
+            max_chars=4,
         )
 
         # alpha labels is a dict; use items to return list of tuples
@@ -297,13 +293,19 @@ class MemberPastSlugMixin:
             raise
 
 
-class MemberLastModifiedListMixin(SolrLastModifiedMixin):
-    """last modified mixin with common logic for all single-member views"""
+class MemberLastModifiedListMixin(CachedResponseMixin, SolrLastModifiedMixin):
+    """last modified and response cache mixin with common logic for all
+    single-member views"""
 
     def get_solr_lastmodified_filters(self):
         # NOTE: slug_s because not using aliased queryset
         return {"item_type": "person", "slug_s": self.kwargs["slug"]}
 
+    def get_surrogate_keys(self):
+        """purge cached responses when this member is reindexed"""
+        member = getattr(self, "member", None) or self.object
+        return super().get_surrogate_keys() + [SurrogateKeys.for_item(member)]
+
 
 class MemberDetail(
     MemberPastSlugMixin, MemberLastModifiedListMixin, DetailView, RdfViewMixin
@@ -328,9 +330,61 @@ class MemberDetail(
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # add account to context for convenience
-        account = self.object.account_set.first()
-        context["account"] = account
+        # timeline, addresses, description and library address are
+        # precomputed when the member is indexed
+        context.update(self.get_payload(self.object))
+
+        # config settings used to render the map; set in local_settings.py
+        context.update(
+            {
+                "mapbox_token": getattr(settings, "MAPBOX_ACCESS_TOKEN", ""),
+                "mapbox_basemap": getattr(settings, "MAPBOX_BASEMAP", ""),
+                "paris_overlay": getattr(settings, "PARIS_OVERLAY", ""),
+                # metadata for social preview
+                "page_title": self.object.firstname_last,
+            }
+        )
+
+        return context
+
+    @staticmethod
+    def payload_key(member):
+        """Cache key for precomputed data for a member, based on the
+        member's :class:`~mep.common.indexing.SurrogateKeys` key."""
+        return "member-detail-%s" % SurrogateKeys.for_item(member)
+
+    @classmethod
+    def get_payload(cls, member):
+        """Get precomputed timeline, address, and description data for
+        a member, as stored by :meth:`store_payloads` when the member was
+        last indexed; generated with :meth:`build_payload` and stored if
+        not available."""
+        cache_key = cls.payload_key(member)
+        payload = cache.get(cache_key)
+        if payload is None:
+            payload = cls.build_payload(member)
+            cache.set(cache_key, payload, timeout=None)
+        return payload
+
+    @classmethod
+    def store_payloads(cls, members):
+        """Generate and store data for a list of members being indexed;
+        people who are not library members are skipped."""
+        cache.set_many(
+            {
+                cls.payload_key(member): cls.build_payload(member)
+                for member in members
+                if member.has_account()
+            },
+            timeout=None,
+        )
+
+    @classmethod
+    def build_payload(cls, member):
+        """Generate data for the member timeline and address map
+        visualizations, the page description, and the address of the
+        library itself."""
+        account = member.account_set.first()
 
         month_counts = defaultdict(int)
         # count book events by month; known years only
@@ -341,11 +395,11 @@ class MemberDetail(
             if event.end_date and event.start_date != event.end_date:
                 month_counts[event.end_date.strftime("%Y-%m-01")] += 1
 
-        account_date_ranges = account.event_date_ranges()
-        account_years = account.event_years
+        account_date_ranges = account.activity.event_date_ranges()
+        account_years = account.activity.event_years
 
         # data for member timeline visualization
-        context["timeline"] = {
+        timeline = {
             "membership_activities": [
                 {
                     "startDate": event.start_date.isoformat()
@@ -374,60 +428,58 @@ class MemberDetail(
             Address.objects.filter(account=account)
             .filter(location__latitude__isnull=False)
             .filter(location__longitude__isnull=False)
+            .select_related("location")
         )
 
-        # NOTE probably refactor this into a method on Location for feeding
-        # to leaflet; also use below
-        context["addresses"] = [
-            {
-                # these fields are taken from Location unchanged
-                "name": address.location.name,
-                "street_address": address.location.street_address,
-                "city": address.location.city,
-                "arrondissement": address.location.arrondissement_ordinal(),
-                # lat/long aren't JSON serializable so we need to do this
-                "latitude": str(address.location.latitude),
-                "longitude": str(address.location.longitude),
-                # NOTE not currently using dates as they're not entered yet
-            }
-            for address in addresses
-        ]
-
-        # address of the lending library itself; automatically available from
-        # migration mep/people/migrations/0014_library_location.py
-        try:
-            library = Location.objects.get(name="Shakespeare and Company")
-            context["library_address"] = {
-                "name": library.name,
-                "street_address": library.street_address,
-                "city": library.city,
-                "arrondissement": library.arrondissement_ordinal(),
-                "latitude": str(library.latitude),
-                "longitude": str(library.longitude),
-            }
-        except Location.DoesNotExist:
-            # if we can't find library's address send 'null' & don't render it
-            context["library_address"] = None
-
         # text-only readable version of membership years for meta description
         membership_years = strip_tags(
             as_ranges(account_years).replace("</span>", ",")
         ).rstrip(",")
 
-        # config settings used to render the map; set in local_settings.py
-        context.update(
-            {
-                "mapbox_token": getattr(settings, "MAPBOX_ACCESS_TOKEN", ""),
-                "mapbox_basemap": getattr(settings, "MAPBOX_BASEMAP", ""),
-                "paris_overlay": getattr(settings, "PARIS_OVERLAY", ""),
-                "account_years": account_years,
-                # metadata for social preview
-                "page_title": self.object.firstname_last,
-                "page_description": self.page_description % membership_years,
-            }
-        )
+        return {
+            "timeline": timeline,
+            # NOTE probably refactor this into a method on Location for feeding
+            # to leaflet; also use for library address
+            "addresses": [
+                {
+                    # these fields are taken from Location unchanged
+                    "name": address.location.name,
+                    "street_address": address.location.street_address,
+                    "city": address.location.city,
+                    "arrondissement": address.location.arrondissement_ordinal(),
+                    # lat/long aren't JSON serializable so we need to do this
+                    "latitude": str(address.location.latitude),
+                    "longitude": str(address.location.longitude),
+                    # NOTE not currently using dates as they're not entered yet
+                }
+                for address in addresses
+            ],
+            "account_years": account_years,
+            "account_start": account.activity.earliest_date(),
+            "account_end": account.activity.last_date(),
+            "page_description": cls.page_description % membership_years,
+            "library_address": cls.library_address(),
+        }
 
-        return context
+    @staticmethod
+    def library_address():
+        """Address of the lending library itself, for the member address
+        map; None if the library location is not found."""
+        # automatically available from migration
+        # mep/people/migrations/0014_library_location.py
+        try:
+            library = Location.objects.get(name="Shakespeare and Company")
+        except Location.DoesNotExist:
+            # if we can't find library's address send 'null' & don't render it
+            return None
+        return {
+            "name": library.name,
+            "street_address": library.street_address,
+            "city": library.city,
+            "arrondissement": library.arrondissement_ordinal(),
+            "latitude": str(library.latitude),
+            "longitude": str(library.longitude),
+        }
 
     def get_breadcrumbs(self):
         """Get the list of breadcrumbs and links to display for this page."""
@@ -527,6 +579,14 @@ class BorrowingActivities(
         )
         return context
 
+    def get_surrogate_keys(self):
+        """purge cached responses when this member or any work listed is
+        reindexed, since work details are displayed"""
+        works = {event.work for event in self.object_list if event.work}
+        return super().get_surrogate_keys() + sorted(
+            SurrogateKeys.for_item(work) for work in works
+        )
+
     def get_absolute_url(self):
         """Get the full URI of this page."""
         return absolutize_url(
@@ -705,60 +765,26 @@ class MembershipGraphs(LoginRequiredMixin, TemplateView):
     def get_context_data(self):
         context = super().get_context_data()
 
-        # use facets to get member totals by month and year
-        sqs = (
-            PersonSolrQuerySet()
-            .facet_field("account_yearmonths", sort="index", limit=1000)
-            .facet_field("logbook_yearmonths", sort="index", limit=1000)
-            .facet_field("card_yearmonths", sort="index", limit=1000)
-        )
-
-        facets = sqs.get_facets()["facet_fields"]
-
-        context["data"] = {
-            # convert into a format that's easier to use with javascript/d3
-            "members": [
-                {
-                    "startDate": "%s-%s-01" % (yearmonth[:4], yearmonth[-2:]),
-                    "count": count,
-                }
-                for yearmonth, count in facets["account_yearmonths"].items()
-            ],
-            "logbooks": [
-                {
-                    "startDate": "%s-%s-01" % (yearmonth[:4], yearmonth[-2:]),
-                    "count": count,
-                }
-                for yearmonth, count in facets["logbook_yearmonths"].items()
-            ],
-            "cards": [
-                {
-                    "startDate": "%s-%s-01" % (yearmonth[:4], yearmonth[-2:]),
-                    "count": count,
-                }
-                for yearmonth, count in facets["card_yearmonths"].items()
-            ],
-        }
+        # member totals by month, precomputed from account activity
+        stats = MembershipStats.get()
+        # already in a format that's easier to use with javascript/d3
+        context["data"] = stats["data"]
 
         # generate version to output as tabular data
-        logbook_month_max = 0
         # NOTE: in django templates, these defaultdicts return default value
         # when attempting to iterate, retrieve items, keys, etc
         # (accessing by index instead of trying method first?)
-        logbooks = defaultdict(lambda: [0] * 12)
-        for yearmonth, count in facets["logbook_yearmonths"].items():
-            logbook_month_max = max(logbook_month_max, count)
-            logbooks[int(yearmonth[:4])][int(yearmonth[-2:]) - 1] = count
-
-        cards_month_max = 0
-        cards = defaultdict(lambda: [0] * 12)
-        for yearmonth, count in facets["card_yearmonths"].items():
-            cards_month_max = max(cards_month_max, count)
-            cards[int(yearmonth[:4])][int(yearmonth[-2:]) - 1] = count
-
-        members = defaultdict(lambda: [0] * 12)
-        for yearmonth, count in facets["account_yearmonths"].items():
-            members[int(yearmonth[:4])][int(yearmonth[-2:]) - 1] = count
+        tables = {}
+        for name, table in stats["tables"].items():
+            tables[name] = defaultdict(lambda: [0] * 12)
+            tables[name].update(
+                (int(year), counts) for year, counts in table["years"].items()
+            )
+        logbooks, cards, members = (
+            tables["logbooks"],
+            tables["cards"],
+            tables["members"],
+        )
 
         card_percents = {}
         for year, counts in cards.items():
@@ -772,11 +798,11 @@ class MembershipGraphs(LoginRequiredMixin, TemplateView):
             card_percents[year] = percents
 
         context["tabular_data"] = {
-            "years": range(1919, 1942),  # workaround for iteration problem
+            "years": MembershipStats.years,  # workaround for iteration problem
             "logbooks": logbooks,
-            "logbooks_month_max": logbook_month_max,
+            "logbooks_month_max": stats["tables"]["logbooks"]["month_max"],
             "cards": cards,
-            "cards_month_max": cards_month_max,
+            "cards_month_max": stats["tables"]["cards"]["month_max"],
             "members": members,
             "card_percents": card_percents,
         }
@@ -784,6 +810,27 @@ class MembershipGraphs(LoginRequiredMixin, TemplateView):
         return context
 
 
+class MembershipStatsJSON(View):
+    """Public JSON endpoint for monthly membership statistics, as used by
+    the membership graphs. Served from precompressed JSON when the client
+    accepts gzip encoding. Statistics are not calculated in the request;
+    returns a 404 if they have not been stored."""
+
+    def get(self, request, *args, **kwargs):
+        compressed = MembershipStats.compressed_json()
+        if compressed is None:
+            raise Http404
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            response = HttpResponse(compressed, content_type="application/json")
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(
+                gzip.decompress(compressed), content_type="application/json"
+            )
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+
 class GeoNamesLookup(autocomplete.Select2ListView):
     """GeoNames ajax lookup for use as autocomplete.
     Optional mode parameter to restrict to countries only.
@@ -882,14 +929,14 @@ class PersonAutocomplete(autocomplete.Select2QuerySetView):
                         "<strong>{main_string}</strong>"
                         "{mep_id} <br />{type} "
                         "({start_date} – {end_date})".strip(),
-                        **labels
+                        **labels,
                     )
             return format_html("<strong>{main_string}</strong>{mep_id}", **labels)
         # we have some of the information, return it in an interpolated string
         return format_html(
             "<strong>{main_string}{bio_dates}"
             "</strong>{mep_id}<br /> {note_string}".strip(),
-            **labels
+            **labels,
         )
 
     def get_queryset(self):
@@ -81,6 +81,7 @@ MIDDLEWARE = [
     "wagtail.contrib.legacy.sitemiddleware.SiteMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
     "csp.middleware.CSPMiddleware",
+    "mep.common.indexing.ReindexCoalescerMiddleware",
 ]
 
 AUTHENTICATION_BACKENDS = (
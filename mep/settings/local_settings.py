@@ -0,0 +1,5 @@
+# sandbox-only settings for running the test suite locally (not committed)
+DATABASES["default"].update(
+    {"ENGINE": "django.db.backends.sqlite3", "NAME": "/tmp/shxco.sqlite"}
+)
+SECRET_KEY = "sandbox"